@@ -2,8 +2,12 @@ import ast
 
 def clean(s):
     """Removes extra whitespace, including empty lines"""
-    import inspect
-    return "\n".join([s for s in inspect.cleandoc(s).splitlines() if s]) + "\n"
+    #Same as inspect.cleandoc(), which would import inspect on the hot path of the passes
+    lines = s.expandtabs().split("\n")
+    indents = [len(line) - len(line.lstrip()) for line in lines[1:] if line.lstrip()]
+    margin = min(indents, default=0)
+    lines = [lines[0].lstrip()] + [line[margin:] for line in lines[1:]]
+    return "\n".join([s for s in lines if s]) + "\n"
 
 def ast_unparse(t):
     """AST -> code, deleting extra whitespace"""
@@ -11,4 +15,67 @@ def ast_unparse(t):
 
 def ast_parse(s):
     """Removes extra whitespace and parses"""
-    return ast.parse(clean(s))
\ No newline at end of file
+    return ast.parse(clean(s))
+
+def fingerprint(t, include_attributes=False):
+    """Stable hash of the AST structure, by default ignoring locations"""
+    #The nodes are serialized in pre-order, without the recursion of ast.dump().
+    #The number of fields of a node is given by its type and the lists are
+    #prefixed with their length, so the serialization is unambiguous
+    import hashlib
+    parts = []
+    stack = [t]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, ast.AST):
+            parts.append(type(value).__name__)
+            names = value._fields + value._attributes if include_attributes else value._fields
+            for name in reversed(names):
+                stack.append(getattr(value, name, None))
+        elif isinstance(value, list):
+            parts.append(f"[{len(value)}")
+            stack.extend(reversed(value))
+        else:
+            parts.append(repr(value))
+    return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+def get_blocks(node):
+    """The statement lists of the node, as (owner, statements) pairs: its body,
+    orelse and finalbody, and the bodies of its except handlers and match cases"""
+    blocks = []
+    for name in ("body", "orelse", "finalbody"):
+        statements = getattr(node, name, None)
+        if isinstance(statements, list):
+            blocks.append((node, statements))
+    for child_node in getattr(node, "handlers", []) + getattr(node, "cases", []):
+        blocks.append((child_node, child_node.body))
+    return blocks
+
+def copy_tree(t):
+    """Deep copy of the AST, without the recursion of copy.deepcopy()"""
+    result = [None]
+    #(node, container of its copy, key of its copy in the container)
+    stack = [(t, result, 0)]
+    while stack:
+        node, container, key = stack.pop()
+        #Without __init__(), which warns about the fields that are not given yet
+        copy = type(node).__new__(type(node))
+        for name in node._attributes:
+            if hasattr(node, name):
+                setattr(copy, name, getattr(node, name))
+        for name, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                values = list(value)
+                setattr(copy, name, values)
+                for position, item in enumerate(value):
+                    if isinstance(item, ast.AST):
+                        stack.append((item, values, position))
+            elif isinstance(value, ast.AST):
+                stack.append((value, copy, name))
+            else:
+                setattr(copy, name, value)
+        if isinstance(container, list):
+            container[key] = copy
+        else:
+            setattr(container, key, copy)
+    return result[0]
@@ -0,0 +1,67 @@
+'''
+Startup benchmark. Runs the command line on a tiny script and compares the
+median time, minus the time of a bare interpreter, with STARTUP_BUDGET_MS.
+Exits with 1 when the budget is exceeded
+
+python3 bench_startup.py [--runs N] [--budget MS]
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from constant import STARTUP_BUDGET_MS
+
+OUROBOROS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ouroboros.py")
+
+SCRIPT = """
+def foo(x):
+    for i in range(10):
+        y = 10 + x
+    return y
+print(foo(42))
+"""
+
+
+def time_command(command, runs):
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main(runs, budget):
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "script.py")
+        with open(script, "w") as f:
+            f.write(SCRIPT)
+
+        baseline = time_command([sys.executable, "-c", "pass"], runs)
+        print(f"{'interpreter':<12} {baseline:8.1f} ms")
+
+        over_budget = False
+        for flag in ["--dont", "--hoist", "--remove", None]:
+            command = [sys.executable, OUROBOROS, script, "-o", os.devnull]
+            if flag is not None:
+                command.append(flag)
+            startup = time_command(command, runs) - baseline
+            name = flag or "optimize"
+            print(f"{name:<12} {startup:8.1f} ms (budget {budget} ms)")
+            if startup > budget:
+                over_budget = True
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20, help="the number of runs per command")
+    ap.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS,
+                    help="the allowed startup time on top of the interpreter, in ms")
+    args = ap.parse_args()
+    sys.exit(main(args.runs, args.budget))
@@ -0,0 +1,159 @@
+'''
+Stress benchmark. Builds functions with very deeply nested statements and very
+long expressions, deeper than the recursion limit, and times the passes on them.
+The trees are built directly, ast.parse() and ast.unparse() would hit the
+recursion limit themselves
+
+python3 bench_stress.py [--depth N] [--length N] [--runs N]
+'''
+
+import ast
+import statistics
+import time
+
+from constant import STRESS_DEPTH, STRESS_LENGTH
+
+
+def get_function(body):
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg(arg="x")], vararg=None, kwonlyargs=[],
+                              kw_defaults=[], kwarg=None, defaults=[])
+    function = ast.FunctionDef(name="foo", args=arguments, body=body, decorator_list=[], returns=None)
+    return ast.Module(body=[function], type_ignores=[])
+
+
+'''
+Gives every node its own line, ast.fix_missing_locations() is recursive
+'''
+def set_locations(tree):
+    for line_number, node in enumerate(ast.walk(tree), 1):
+        if "lineno" in node._attributes:
+            node.lineno = node.end_lineno = line_number
+            node.col_offset = node.end_col_offset = 0
+    return tree
+
+
+'''
+    y = 0
+    if x:
+        if x:
+            ... (depth times)
+                y = x
+                z = 1
+    return y
+'''
+def get_nested_ifs(depth):
+    block = [ast.Assign(targets=[ast.Name(id="y", ctx=ast.Store())], value=ast.Name(id="x", ctx=ast.Load())),
+             ast.Assign(targets=[ast.Name(id="z", ctx=ast.Store())], value=ast.Constant(value=1))]
+    for i in range(depth):
+        block = [ast.If(test=ast.Name(id="x", ctx=ast.Load()), body=block, orelse=[])]
+    body = [ast.Assign(targets=[ast.Name(id="y", ctx=ast.Store())], value=ast.Constant(value=0))] + block + \
+           [ast.Return(value=ast.Name(id="y", ctx=ast.Load()))]
+    return set_locations(get_function(body))
+
+
+'''
+    y = 0
+    for i0 in range(2):
+        for i1 in range(2):
+            ... (depth times)
+                y += x
+                z = 1
+    return y
+'''
+def get_nested_fors(depth):
+    block = [ast.AugAssign(target=ast.Name(id="y", ctx=ast.Store()), op=ast.Add(), value=ast.Name(id="x", ctx=ast.Load())),
+             ast.Assign(targets=[ast.Name(id="z", ctx=ast.Store())], value=ast.Constant(value=1))]
+    for i in range(depth):
+        iterator = ast.Call(func=ast.Name(id="range", ctx=ast.Load()), args=[ast.Constant(value=2)], keywords=[])
+        block = [ast.For(target=ast.Name(id=f"i{i}", ctx=ast.Store()), iter=iterator, body=block, orelse=[])]
+    body = [ast.Assign(targets=[ast.Name(id="y", ctx=ast.Store())], value=ast.Constant(value=0))] + block + \
+           [ast.Return(value=ast.Name(id="y", ctx=ast.Load()))]
+    return set_locations(get_function(body))
+
+
+'''
+    y = x + 0 + 1 + ... (length additions)
+    z = y
+    return y
+'''
+def get_long_expression(length):
+    expression = ast.Name(id="x", ctx=ast.Load())
+    for i in range(length):
+        expression = ast.BinOp(left=expression, op=ast.Add(), right=ast.Constant(value=i))
+    body = [ast.Assign(targets=[ast.Name(id="y", ctx=ast.Store())], value=expression),
+            ast.Assign(targets=[ast.Name(id="z", ctx=ast.Store())], value=ast.Name(id="y", ctx=ast.Load())),
+            ast.Return(value=ast.Name(id="y", ctx=ast.Load()))]
+    return set_locations(get_function(body))
+
+
+'''
+    y = 0
+    try:
+        with x:
+            try:
+                ... (depth times)
+                    for i in range(2):
+                        k = x * 2
+                        y += k
+            except ValueError:
+                (the same loop)
+            else:
+                (the same loop)
+    ...
+    return y
+
+The loops are in every kind of statement list, their invariant is hoisted
+'''
+def get_wrapped_loops(depth):
+    def get_loop():
+        iterator = ast.Call(func=ast.Name(id="range", ctx=ast.Load()), args=[ast.Constant(value=2)], keywords=[])
+        invariant = ast.BinOp(left=ast.Name(id="x", ctx=ast.Load()), op=ast.Mult(), right=ast.Constant(value=2))
+        body = [ast.Assign(targets=[ast.Name(id="k", ctx=ast.Store())], value=invariant),
+                ast.AugAssign(target=ast.Name(id="y", ctx=ast.Store()), op=ast.Add(), value=ast.Name(id="k", ctx=ast.Load()))]
+        return ast.For(target=ast.Name(id="i", ctx=ast.Store()), iter=iterator, body=body, orelse=[])
+
+    block = [get_loop()]
+    for i in range(depth):
+        if i % 2:
+            block = [ast.With(items=[ast.withitem(context_expr=ast.Name(id="x", ctx=ast.Load()), optional_vars=None)],
+                              body=block)]
+        else:
+            handler = ast.ExceptHandler(type=ast.Name(id="ValueError", ctx=ast.Load()), name=None, body=[get_loop()])
+            block = [ast.Try(body=block, handlers=[handler], orelse=[get_loop()], finalbody=[])]
+    body = [ast.Assign(targets=[ast.Name(id="y", ctx=ast.Store())], value=ast.Constant(value=0))] + block + \
+           [ast.Return(value=ast.Name(id="y", ctx=ast.Load()))]
+    return set_locations(get_function(body))
+
+
+def time_optimize(get_tree, size, runs):
+    import contextlib
+    import io
+    from ouroboros import optimize
+
+    timings = []
+    for i in range(runs):
+        tree = get_tree(size)
+        start = time.perf_counter()
+        #optimize() reports every iteration
+        with contextlib.redirect_stdout(io.StringIO()):
+            optimize(tree)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main(depth, length, runs):
+    for name, get_tree, size in [("nested if", get_nested_ifs, depth), ("nested for", get_nested_fors, depth),
+                                 ("wrapped for", get_wrapped_loops, depth), ("expression", get_long_expression, length)]:
+        print(f"{name:<12} {size:>8} {time_optimize(get_tree, size, runs):10.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--depth", type=int, default=STRESS_DEPTH, help="the nesting depth of the statements")
+    ap.add_argument("--length", type=int, default=STRESS_LENGTH, help="the number of operators of the expression")
+    ap.add_argument("--runs", type=int, default=3, help="the number of runs per tree")
+    args = ap.parse_args()
+    sys.exit(main(args.depth, args.length, args.runs))
@@ -0,0 +1,141 @@
+'''
+Command line entry point of ouroboros.py.
+
+The optimizer is usually run once per file by a build, so the time to start
+matters as much as the time to optimize. Only ast, argparse and the modules of
+the selected passes are imported: the passes import their helpers lazily (so
+--hoist never loads the remove_useless helpers), and so does main() for the
+modules of the other options. bench_startup.py checks the result against
+STARTUP_BUDGET_MS.
+'''
+
+import argparse
+import ast
+import os
+import sys
+
+from constant import WATCH_INTERVAL
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="ouroboros.py")
+    ap.add_argument("script", nargs="*", help="the scripts to transform, - or nothing for stdin")
+    ap.add_argument("-o", "--output", help="where to write the optimized code, - for stdout")
+    g = ap.add_mutually_exclusive_group(required=False)
+    g.add_argument("--dont", action="store_true", help="don't optimize")
+    g.add_argument("--hoist", action="store_true", help="hoist invariants")
+    g.add_argument("--remove", action="store_true", help="remove useless")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only re-optimize the top-level functions and classes that changed")
+    ap.add_argument("--cache", help="the cache file used by --incremental")
+    ap.add_argument("--watch", action="store_true", help="re-optimize the scripts every time they are saved")
+    ap.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                    help="seconds between two polls of the watched scripts")
+    ap.add_argument("--stream", choices=("nul", "length"),
+                    help="read many NUL separated or length-prefixed documents from stdin")
+    ap.add_argument("--pyc", action="store_true", help="write a compiled .pyc file instead of source code")
+    ap.add_argument("--patch", action="store_true",
+                    help="only rewrite the statements that changed, keep the comments and formatting of the rest")
+    ap.add_argument("--profile", help="a cProfile file or line-hit histogram, only the hot functions are optimized")
+    ap.add_argument("--costs", action="store_true",
+                    help="report the predicted savings of hoisting per function on stderr")
+    ap.add_argument("--passes", help="comma separated passes to run until stable, e.g. remove,hoist,specialize")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.passes and (args.dont or args.hoist or args.remove):
+        ap.error("--passes can't be used with --dont, --hoist or --remove")
+    if args.profile and args.incremental:
+        ap.error("--profile can't be used with --incremental")
+    if args.stream and args.pyc:
+        ap.error("--pyc can't be used with --stream")
+    if args.patch and args.pyc:
+        ap.error("--patch can't be used with --pyc")
+    if args.patch and args.incremental:
+        ap.error("--patch can't be used with --incremental")
+
+    from ouroboros import DEFAULT_PASSES, PASSES, get_optimized_path
+
+    #--hoist and --remove run a single pass once, the default runs all of them until stable
+    passes = () if args.dont else ("hoist",) if args.hoist else ("remove",) if args.remove else DEFAULT_PASSES
+    fixed_point = not (args.dont or args.hoist or args.remove)
+    if args.passes:
+        passes = tuple(name for name in args.passes.split(",") if name)
+        unknown = [name for name in passes if name not in PASSES]
+        if unknown:
+            ap.error(f"unknown passes {', '.join(unknown)}, choose from {', '.join(PASSES)}")
+
+    if args.watch:
+        from watch import Watcher
+        Watcher(args.script, passes, fixed_point).run(args.interval)
+        sys.exit(0)
+
+    from stream import optimize_source, optimize_source_tree, run_stream
+
+    if args.stream:
+        cache = None
+        if args.incremental:
+            from incremental import IncrementalCache
+            cache = IncrementalCache()
+        failures = run_stream(sys.stdin.buffer, sys.stdout.buffer, args.stream, passes, fixed_point, cache,
+                              args.patch)
+        sys.exit(1 if failures else 0)
+
+    scripts = args.script or ["-"]
+    if args.output and len(scripts) > 1:
+        ap.error("--output can only be used with a single script")
+
+    for script in scripts:
+        if script == "-":
+            source = sys.stdin.read()
+            source_mtime = None
+        else:
+            with open(script, "r") as f:
+                source = f.read()
+            source_mtime = os.stat(script).st_mtime
+
+        cache = None
+        if args.incremental:
+            from incremental import IncrementalCache, get_default_cache_path
+            cache_path = args.cache or (None if script == "-" else get_default_cache_path(script))
+            cache = IncrementalCache(cache_path)
+
+        if args.costs:
+            from cost_model import get_hoist_report, format_hoist_report
+            print(format_hoist_report(get_hoist_report(ast.parse(source))), file=sys.stderr)
+
+        profile = None
+        if args.profile:
+            from pgo import load_profile
+            profile = load_profile(args.profile).for_file(None if script == "-" else script)
+
+        if args.patch:
+            optimized_source = optimize_source(source, passes, fixed_point, cache, patch=True, profile=profile)
+        else:
+            t = optimize_source_tree(source, passes, fixed_point, cache, profile)
+            optimized_source = None if args.pyc else ast.unparse(t) + "\n"
+
+        if cache is not None:
+            cache.prune()
+            cache.save()
+
+        output = args.output or ("-" if script == "-" else get_optimized_path(script))
+        if args.pyc:
+            #The tree is compiled as is, it is never rendered as source and parsed again
+            from emit import compile_tree, write_pyc
+            if output != "-" and not args.output:
+                output = os.path.splitext(output)[0] + ".pyc"
+            code = compile_tree(t, "<stdin>" if script == "-" else script)
+            source_size = len(source.encode())
+            if output == "-":
+                write_pyc(sys.stdout.buffer, code, source_mtime, source_size)
+            else:
+                with open(output, "wb") as f:
+                    write_pyc(f, code, source_mtime, source_size)
+        elif output == "-":
+            sys.stdout.write(optimized_source)
+        else:
+            with open(output, "w") as f:
+                f.write(optimized_source)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+'''
+Client stub for server.py. Keeps one connection open for all the requests
+
+    with OptimizerClient("/tmp/ouroboros.sock") as client:
+        response = client.optimize(source)
+'''
+
+import json
+import os
+import socket
+
+
+class OptimizerClient:
+    def __init__(self, socket_path):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(str(socket_path))
+        self.file = self.connection.makefile("rwb")
+
+    def request(self, request):
+        self.file.write((json.dumps(request) + "\n").encode())
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def optimize(self, source, passes=None, options=None):
+        return self.request({"source": source, "passes": passes, "options": options or {}})
+
+    def shutdown(self):
+        return self.request({"shutdown": True})
+
+    def close(self):
+        self.file.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    ap = argparse.ArgumentParser()
+    ap.add_argument("socket", help="the socket the server listens on")
+    ap.add_argument("script", nargs="+", help="the scripts to transform")
+    args = ap.parse_args()
+
+    with OptimizerClient(args.socket) as client:
+        for script in args.script:
+            with open(script, "r") as f:
+                response = client.optimize(f.read())
+            if "error" in response:
+                print(f"{script}: {response['error']}", file=sys.stderr)
+                continue
+            with open(os.path.splitext(script)[0] + "_optimized.py", "w") as f:
+                f.write(response["source"] + "\n")
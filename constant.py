@@ -3,3 +3,43 @@ PRINT_FUNCTION_CALL = "print"
 TRANSFORMER_DO_NOTHING = 0
 TRANSFORMER_DEPENDENT_VARIABLES = 1
 TRANSFORMER_PASS = 2
+
+INCREMENTAL_CACHE_VERSION = 3
+
+WATCH_INTERVAL = 0.1
+
+SERVER_CACHE_ENTRIES = 10000
+
+STREAM_CHUNK_SIZE = 65536
+
+STARTUP_BUDGET_MS = 35
+
+#get_optimizer_version() adds the hash of the optimizer modules to it
+OPTIMIZER_VERSION = "2"
+
+DIFFERENTIAL_WARMUP = 3
+DIFFERENTIAL_REPEAT = 20
+
+PGO_HOT_FRACTION = 0.9
+
+STRESS_DEPTH = 1500
+STRESS_LENGTH = 100000
+
+#Estimated cost of evaluating each kind of node, roughly in bytecode instructions
+COST_NAME = 1
+COST_CONSTANT = 1
+COST_STORE = 1
+COST_ATTRIBUTE = 2
+COST_OPERATOR = 2
+COST_CONTAINER = 2
+COST_SUBSCRIPT = 3
+COST_CALL = 10
+LOOP_TRIP_COUNT_UNKNOWN = 10
+HOIST_MIN_SAVINGS = 1
+
+#Unswitching never grows a function (or the module) past this many statements and expressions
+UNSWITCH_BUDGET = 2000
+
+#Trust the annotations and the isinstance() guards to give the exact builtin type.
+#They also allow the subclasses, which can override the methods, so it is opt-in
+TRUST_TYPE_HINTS = False
@@ -0,0 +1,187 @@
+'''
+Static cost model for hoist_invariants().
+
+The cost of an expression is the sum of the weights in constant.py of its nodes
+(name loads, attribute loads, calls, subscripts, operators...). Expressions made
+only of constants are folded by the compiler and cost a single constant load.
+
+The trip count of a loop is known for range() with constant arguments and for
+literal sequences, LOOP_TRIP_COUNT_UNKNOWN is used otherwise. Hoisting saves
+
+    whole statement: cost of the statement * (trips - 1)
+    expression:      (cost of the expression - a name load) * trips
+                     - (cost of the expression + the store of the temporary)
+
+and candidates that save less than HOIST_MIN_SAVINGS stay in the loop. A
+candidate that reads or writes a variable written by a candidate staying in the
+loop (or writes a variable it reads) stays in the loop too.
+'''
+
+import ast
+
+from constant import *
+from def_use import get_summary, clear_summaries
+
+
+def is_constant_expression(node):
+    for child_node in ast.walk(node):
+        if not isinstance(child_node, (ast.Constant, ast.UnaryOp, ast.BinOp, ast.unaryop, ast.operator,
+                                       ast.Tuple, ast.Load)):
+            return False
+    return True
+
+
+def get_node_cost(node):
+    if isinstance(node, ast.Name):
+        return COST_STORE if isinstance(node.ctx, ast.Store) else COST_NAME
+    if isinstance(node, ast.Constant):
+        return COST_CONSTANT
+    if isinstance(node, ast.Attribute):
+        return COST_ATTRIBUTE
+    if isinstance(node, ast.Subscript):
+        return COST_SUBSCRIPT
+    if isinstance(node, ast.Call):
+        return COST_CALL
+    if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.AugAssign)):
+        return COST_OPERATOR
+    if isinstance(node, ast.BoolOp):
+        return COST_OPERATOR * (len(node.values) - 1)
+    if isinstance(node, ast.Compare):
+        return COST_OPERATOR * len(node.ops)
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set, ast.Dict)):
+        return COST_CONTAINER
+    return 0
+
+
+'''
+Estimated cost of evaluating the expression (or executing the statement) once
+'''
+def get_cost(node):
+    if isinstance(node, ast.expr) and is_constant_expression(node):
+        return COST_CONSTANT
+    if isinstance(node, ast.Assign) and is_constant_expression(node.value):
+        return COST_CONSTANT + sum(get_cost(target) for target in node.targets)
+    return sum(get_node_cost(child_node) for child_node in ast.walk(node))
+
+
+'''
+Estimated number of iterations of the loop (or of the generator of a
+comprehension)
+'''
+def get_trip_count(loop):
+    if not isinstance(loop, (ast.For, ast.comprehension)):
+        return LOOP_TRIP_COUNT_UNKNOWN
+    iterable = loop.iter
+    if isinstance(iterable, (ast.List, ast.Tuple, ast.Set)):
+        return len(iterable.elts)
+    if isinstance(iterable, ast.Constant) and isinstance(iterable.value, (str, bytes)):
+        return len(iterable.value)
+    if isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name) and iterable.func.id == "range" \
+            and not iterable.keywords:
+        try:
+            arguments = [ast.literal_eval(argument) for argument in iterable.args]
+            return len(range(*arguments))
+        except (ValueError, TypeError):
+            pass
+    return LOOP_TRIP_COUNT_UNKNOWN
+
+
+'''
+Predicted savings of hoisting the node out of the loop. temporary tells if only
+the expression is hoisted into a temporary (see remember_loop_invariant_statement())
+'''
+def get_hoist_savings(node, temporary, loop):
+    trips = get_trip_count(loop)
+    cost = get_cost(node)
+    if temporary:
+        return (cost - COST_NAME) * trips - (cost + COST_STORE)
+    return cost * (trips - 1)
+
+
+'''
+Splits the invariant objects of hoist_invariants() into the ones worth hoisting
+and the ones that stay in their loop. Returns (kept, skipped), two lists of
+(invariant object, predicted savings)
+'''
+def select_invariants(block, invariants_statements):
+    kept = []
+    skipped = []
+    #Per loop, the variables read and written by the statements that stay in it
+    skipped_reads = {}
+    skipped_writes = {}
+    for invariant_object in invariants_statements:
+        node, position, temporary, line_number, loop_position = invariant_object
+        loop = block[loop_position]
+        savings = get_hoist_savings(node, temporary, loop)
+
+        summary = get_summary(node)
+        reads = summary.reads
+        writes = summary.writes
+        loop_reads = skipped_reads.setdefault(loop_position, set())
+        loop_writes = skipped_writes.setdefault(loop_position, set())
+        conflict = (reads | writes) & loop_writes or writes & loop_reads
+
+        if savings < HOIST_MIN_SAVINGS or conflict:
+            skipped.append((invariant_object, savings))
+            if not temporary:
+                loop_reads.update(reads)
+                loop_writes.update(writes)
+        else:
+            kept.append((invariant_object, savings))
+    return kept, skipped
+
+
+'''
+Returns the predicted savings of hoist_invariants() per function, without
+changing the tree: {function name: {"hoisted", "skipped", "savings"}}. Loops
+outside of functions are reported under <module>. Like hoist_invariants(), every
+statement list is looked at. The statements are walked in source order, with
+an explicit stack
+'''
+def get_hoist_report(tree):
+    from hoist_invariants_helpers import (check_invariant_statements_for, check_invariant_statements_while,
+                                          remove_await_unsafe_invariants)
+    from ast_helpers import get_blocks
+    from scopes import get_scope, clear_scopes
+
+    clear_summaries()
+    clear_scopes()
+    report = {}
+    #(node, name of its function, local variables of the function)
+    stack = [(tree, "<module>", set())]
+    while stack:
+        parent_node, owner, local_names = stack.pop()
+        if isinstance(parent_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            owner = parent_node.name if owner == "<module>" else owner + "." + parent_node.name
+            local_names = get_scope(parent_node).get_locals()
+        blocks = get_blocks(parent_node)
+        stack.extend((statement, owner, local_names)
+                     for block_owner, block in reversed(blocks) for statement in reversed(block))
+
+        for block_owner, block in blocks:
+            invariants_statements = []
+            for iterator, node in enumerate(block):
+                if isinstance(node, (ast.For, ast.AsyncFor)):
+                    check_invariant_statements_for(invariants_statements, node, iterator)
+                elif isinstance(node, ast.While):
+                    check_invariant_statements_while(invariants_statements, node, iterator)
+            invariants_statements = remove_await_unsafe_invariants(block, invariants_statements, local_names)
+            if not invariants_statements:
+                continue
+
+            kept, skipped = select_invariants(block, invariants_statements)
+            entry = report.setdefault(owner, {"hoisted": 0, "skipped": 0, "savings": 0})
+            entry["hoisted"] = entry["hoisted"] + len(kept)
+            entry["skipped"] = entry["skipped"] + len(skipped)
+            entry["savings"] = entry["savings"] + sum(savings for invariant_object, savings in kept)
+    clear_summaries()
+    clear_scopes()
+    return report
+
+
+def format_hoist_report(report):
+    lines = []
+    for owner, entry in report.items():
+        lines.append(f"{owner}: {entry['hoisted']} hoisted, {entry['skipped']} skipped, "
+                     f"predicted savings {entry['savings']}")
+    return "\n".join(lines)
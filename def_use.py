@@ -0,0 +1,157 @@
+'''
+Def/use summaries of the nodes, shared by the analyses of both passes.
+
+The summary of a node describes its whole subtree: the names it refers to, the
+names it reads and writes, the functions it calls and whether it contains a
+NamedExpr or an await. The sets of names are frozensets, so a summary only
+takes the room of the names in its subtree. The summaries of a subtree are
+computed in a single bottom-up walk and cached, so the helpers don't walk the same statement again for every
+question they ask about it.
+
+Only the statements (and the expressions the helpers ask about) are cached.
+The cache keeps the nodes, so their ids can't be reused while it is alive. It
+is cleared when a pass starts and ends, and a pass that changes a node calls
+invalidate() on it, which drops the summaries of the node and of all the
+statements containing it.
+'''
+
+import ast
+
+
+class Summary:
+    __slots__ = ("names", "reads", "writes", "calls", "has_walrus", "has_await")
+
+    def __init__(self, names, reads, writes, calls, has_walrus, has_await):
+        self.names = names
+        self.reads = reads
+        self.writes = writes
+        self.calls = calls
+        self.has_walrus = has_walrus
+        #An await, async for or async with: the coroutine can be suspended there
+        #and the other tasks can run
+        self.has_await = has_await
+
+
+#id(node) -> (node, summary)
+summaries = {}
+#id(node) -> parent node
+parents = {}
+
+
+def clear_summaries():
+    summaries.clear()
+    parents.clear()
+
+
+#Nodes that contain statements. Statements are always direct children of these
+OWNER_TYPES = (ast.stmt, ast.excepthandler, ast.match_case, ast.mod)
+
+#Nodes that await
+AWAIT_TYPES = (ast.Await, ast.AsyncFor, ast.AsyncWith)
+
+#Nodes without names or calls
+LEAF_TYPES = (ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+
+
+'''
+Summarizes the node. The summaries of the statements nested in it must already
+be cached, the rest of its subtree is walked
+'''
+def compute_summary(node):
+    names = set()
+    reads = set()
+    writes = set()
+    calls = set()
+    has_walrus = False
+    has_await = False
+
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, ast.Name):
+            names.add(current.id)
+            if isinstance(current.ctx, ast.Load):
+                reads.add(current.id)
+            else:
+                writes.add(current.id)
+            continue
+        if isinstance(current, ast.Call):
+            if isinstance(current.func, ast.Name):
+                calls.add(current.func.id)
+            elif isinstance(current.func, ast.Attribute):
+                calls.add(current.func.attr)
+        elif isinstance(current, ast.NamedExpr):
+            has_walrus = True
+        elif isinstance(current, AWAIT_TYPES):
+            has_await = True
+
+        for child_node in ast.iter_child_nodes(current):
+            if isinstance(child_node, LEAF_TYPES):
+                continue
+            summary = summaries.get(id(child_node))
+            if summary is not None and summary[0] is child_node:
+                summary = summary[1]
+                names.update(summary.names)
+                reads.update(summary.reads)
+                writes.update(summary.writes)
+                calls.update(summary.calls)
+                has_walrus = has_walrus or summary.has_walrus
+                has_await = has_await or summary.has_await
+            else:
+                stack.append(child_node)
+
+    return Summary(frozenset(names), frozenset(reads), frozenset(writes), frozenset(calls), has_walrus, has_await)
+
+
+def get_cached_summary(node):
+    record = summaries.get(id(node))
+    if record is not None and record[0] is node:
+        return record[1]
+    return None
+
+
+'''
+Returns the summary of the subtree of the node. The statements of the subtree
+are summarized bottom-up, with an explicit stack, and cached
+'''
+def get_summary(node):
+    summary = get_cached_summary(node)
+    if summary is not None:
+        return summary
+
+    #Parents come before their children, so the reversed order is bottom-up
+    order = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if get_cached_summary(current) is not None:
+            continue
+        order.append(current)
+        if isinstance(current, OWNER_TYPES):
+            for child_node in ast.iter_child_nodes(current):
+                if isinstance(child_node, OWNER_TYPES):
+                    parents[id(child_node)] = current
+                    stack.append(child_node)
+
+    for current in reversed(order):
+        summaries[id(current)] = (current, compute_summary(current))
+    return summaries[id(node)][1]
+
+
+'''
+Drops the summaries of the changed node and of the statements containing it.
+The parents of the expressions are not recorded: a pass that changes an
+expression invalidates the expressions between it and its statement itself
+(see Transformer). The statements in the changed node are recorded again as its
+children, so the statements moved there by a pass get their new parent
+'''
+def invalidate(node):
+    for child_node in ast.iter_child_nodes(node):
+        if isinstance(child_node, OWNER_TYPES):
+            parents[id(child_node)] = node
+    seen = set()
+    while node is not None and id(node) not in seen:
+        seen.add(id(node))
+        summaries.pop(id(node), None)
+        node = parents.get(id(node))
+
@@ -0,0 +1,230 @@
+'''
+Differential benchmark. Runs the original and the optimized version of a module
+in separate subprocesses, checks that the entry point returns the same values
+and prints the same output, and compares their running times.
+
+python3 differential.py <module.py> <entry point> --inputs "[(args...), ...]"
+python3 differential.py --corpus <directory>
+
+The inputs are a Python expression giving a list of argument tuples, the entry
+point is called once per tuple. Every call gets a fresh copy of its arguments,
+so entry points that modify their arguments can be compared too. After --warmup
+repetitions, every one of the --repeat repetitions calls the entry point on all
+the inputs and is timed.
+
+A corpus is a directory of modules that each describe their benchmark with a
+dictionary
+
+    BENCHMARK = {"entry": "foo", "inputs": [([0] * 1000, 1, 2)]}
+
+(only the entry and the inputs keys are read, without importing the module).
+Every module of the corpus is measured with each of the pass selections, so the
+benefit of every pass is measured separately. Exits with 1 when an optimized
+module does not behave like the original one.
+'''
+
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from constant import DIFFERENTIAL_WARMUP, DIFFERENTIAL_REPEAT
+from ouroboros import DEFAULT_PASSES
+
+#The pass selections measured for every module of a corpus
+CORPUS_PASSES = [("remove",), ("hoist",), DEFAULT_PASSES]
+
+
+'''
+Runs in the subprocess: imports the module, calls the entry point on every input
+and prints the results, the output and the timings as JSON
+'''
+def run_child(path, entry, inputs, warmup, repeat):
+    import contextlib
+    import copy
+    import importlib.util
+    import io
+    import time
+
+    inputs = eval(inputs, {})
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        spec = importlib.util.spec_from_file_location("__differential__", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        function = module
+        for name in entry.split("."):
+            function = getattr(function, name)
+
+        results = []
+        for arguments in inputs:
+            try:
+                results.append(repr(function(*copy.deepcopy(arguments))))
+            except Exception as e:
+                results.append(f"raised {type(e).__name__}: {e}")
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for repetition in range(warmup + repeat):
+            arguments_copies = copy.deepcopy(inputs)
+            start = time.perf_counter()
+            for arguments in arguments_copies:
+                try:
+                    function(*arguments)
+                except Exception:
+                    pass
+            elapsed = time.perf_counter() - start
+            if repetition >= warmup:
+                timings.append(elapsed)
+
+    print(json.dumps({"results": results, "stdout": output.getvalue(), "timings": timings}))
+
+
+'''
+Runs run_child() in a new interpreter and returns what it reported
+'''
+def run_module(path, entry, inputs, warmup=DIFFERENTIAL_WARMUP, repeat=DIFFERENTIAL_REPEAT, search_path=None):
+    environment = dict(os.environ)
+    #The module may import its siblings
+    search_path = search_path or os.path.dirname(os.path.abspath(path))
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [search_path, environment.get("PYTHONPATH")]))
+    command = [sys.executable, os.path.abspath(__file__), "--child", path, entry, inputs, str(warmup), str(repeat)]
+    process = subprocess.run(command, capture_output=True, text=True, env=environment)
+    if process.returncode != 0:
+        raise RuntimeError(f"{path} failed:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def get_statistics(timings):
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+'''
+Runs both files and returns the report of the comparison
+'''
+def compare_files(original_path, optimized_path, entry, inputs, warmup=DIFFERENTIAL_WARMUP,
+                  repeat=DIFFERENTIAL_REPEAT):
+    search_path = os.path.dirname(os.path.abspath(original_path))
+    original = run_module(original_path, entry, inputs, warmup, repeat, search_path)
+    optimized = run_module(optimized_path, entry, inputs, warmup, repeat, search_path)
+
+    original_statistics = get_statistics(original["timings"])
+    optimized_statistics = get_statistics(optimized["timings"])
+    return {
+        "module": original_path,
+        "entry": entry,
+        "identical": original["results"] == optimized["results"] and original["stdout"] == optimized["stdout"],
+        "original": original_statistics,
+        "optimized": optimized_statistics,
+        "speedup": original_statistics["median"] / optimized_statistics["median"],
+    }
+
+
+'''
+Optimizes the module with the given passes and compares it with the original
+'''
+def benchmark_module(path, entry, inputs, passes=DEFAULT_PASSES, warmup=DIFFERENTIAL_WARMUP,
+                     repeat=DIFFERENTIAL_REPEAT):
+    from stream import optimize_source
+
+    with open(path, "r") as f:
+        source = f.read()
+    with tempfile.TemporaryDirectory() as directory:
+        optimized_path = os.path.join(directory, os.path.basename(path))
+        with open(optimized_path, "w") as f:
+            f.write(optimize_source(source, passes))
+        report = compare_files(path, optimized_path, entry, inputs, warmup, repeat)
+    report["passes"] = list(passes)
+    return report
+
+
+'''
+Returns the entry point and the source of the inputs given by the BENCHMARK
+dictionary of the module, or None if it has none
+'''
+def get_benchmark(path):
+    with open(path, "r") as f:
+        source = f.read()
+    for statement in ast.parse(source).body:
+        if not isinstance(statement, ast.Assign) or not isinstance(statement.value, ast.Dict) or \
+                not any(isinstance(target, ast.Name) and target.id == "BENCHMARK" for target in statement.targets):
+            continue
+        benchmark = {}
+        for key, value in zip(statement.value.keys, statement.value.values):
+            if isinstance(key, ast.Constant):
+                benchmark[key.value] = value
+        return ast.literal_eval(benchmark["entry"]), ast.get_source_segment(source, benchmark["inputs"])
+    return None
+
+
+'''
+Benchmarks every module of the directory that has a BENCHMARK, with each of the
+pass selections
+'''
+def benchmark_corpus(directory, pass_selections=CORPUS_PASSES, warmup=DIFFERENTIAL_WARMUP,
+                     repeat=DIFFERENTIAL_REPEAT):
+    reports = []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not filename.endswith(".py"):
+            continue
+        benchmark = get_benchmark(path)
+        if benchmark is None:
+            continue
+        entry, inputs = benchmark
+        for passes in pass_selections:
+            reports.append(benchmark_module(path, entry, inputs, passes, warmup, repeat))
+    return reports
+
+
+def format_report(report):
+    original = report["original"]
+    optimized = report["optimized"]
+    status = "ok" if report["identical"] else "MISMATCH"
+    return (f"{os.path.basename(report['module'])}:{report['entry']} [{'+'.join(report.get('passes', []))}] "
+            f"{status} original {original['median'] * 1000:.3f} ms (stdev {original['stdev'] * 1000:.3f}) "
+            f"optimized {optimized['median'] * 1000:.3f} ms (stdev {optimized['stdev'] * 1000:.3f}) "
+            f"speedup {report['speedup']:.2f}x")
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(prog="differential.py")
+    ap.add_argument("module", nargs="?", help="the module to benchmark")
+    ap.add_argument("entry", nargs="?", help="the function to call, e.g. foo or Class.method")
+    ap.add_argument("--inputs", default="[()]", help="a Python expression giving a list of argument tuples")
+    ap.add_argument("--passes", default=",".join(DEFAULT_PASSES), help="comma separated passes to run")
+    ap.add_argument("--corpus", help="benchmark every module of the directory that defines BENCHMARK")
+    ap.add_argument("--warmup", type=int, default=DIFFERENTIAL_WARMUP, help="untimed repetitions")
+    ap.add_argument("--repeat", type=int, default=DIFFERENTIAL_REPEAT, help="timed repetitions")
+    ap.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = ap.parse_args(argv)
+
+    if args.corpus:
+        reports = benchmark_corpus(args.corpus, CORPUS_PASSES, args.warmup, args.repeat)
+    elif args.module and args.entry:
+        passes = tuple(name for name in args.passes.split(",") if name)
+        reports = [benchmark_module(args.module, args.entry, args.inputs, passes, args.warmup, args.repeat)]
+    else:
+        ap.error("give a module and an entry point, or --corpus")
+
+    for report in reports:
+        print(json.dumps(report) if args.json else format_report(report))
+    return 0 if all(report["identical"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        path, entry, inputs, warmup, repeat = sys.argv[2:]
+        run_child(path, entry, inputs, int(warmup), int(repeat))
+    else:
+        sys.exit(main())
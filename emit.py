@@ -0,0 +1,290 @@
+'''
+Output formats other than ast.unparse().
+
+compile_tree() compiles the optimized ast.Module directly and write_pyc() writes
+the code object as a .pyc file, so the optimized code does not have to be
+rendered as text and parsed again. A <name>_optimized.pyc file is importable as
+<name>_optimized, like any sourceless .pyc file.
+'''
+
+import ast
+import importlib.util
+import marshal
+import time
+
+
+'''
+Compiles the optimized tree. The nodes created by the passes don't always have
+a location, they get the one of their parent
+'''
+def compile_tree(tree, filename="<ouroboros>"):
+    ast.fix_missing_locations(tree)
+    return compile(tree, str(filename), "exec", dont_inherit=True)
+
+
+'''
+Returns the content of a timestamp-based .pyc file (PEP 552) for the code object
+'''
+def get_pyc_data(code, source_mtime=None, source_size=0):
+    if source_mtime is None:
+        source_mtime = time.time()
+    data = bytearray(importlib.util.MAGIC_NUMBER)
+    data.extend((0).to_bytes(4, "little"))
+    data.extend((int(source_mtime) & 0xFFFFFFFF).to_bytes(4, "little"))
+    data.extend((source_size & 0xFFFFFFFF).to_bytes(4, "little"))
+    data.extend(marshal.dumps(code))
+    return bytes(data)
+
+
+def write_pyc(stream, code, source_mtime=None, source_size=0):
+    stream.write(get_pyc_data(code, source_mtime, source_size))
+
+
+'''
+Span-patching emitter. ast.unparse() regenerates the whole file, loses the
+comments and the formatting and makes the diff as big as the file.
+emit_patched_source() keeps the bytes of the original source for everything
+the passes did not touch and only renders the statements that changed.
+
+take_snapshot() records the fields of every node before the passes run. The
+passes mutate the tree in place, so a node that is still in the snapshot with
+the same fields and unchanged children was not touched:
+
+    - an unchanged statement is copied from the source, together with the
+      comments and blank lines before it
+    - a compound statement whose header is unchanged keeps its header (and the
+      else:/except/finally: lines) and only its blocks are patched
+    - everything else (new, moved or changed statements) is rendered with
+      ast.unparse() at the indentation of its block
+
+Statements that share a line with another statement are always rendered.
+'''
+
+#The fields of a compound statement that hold blocks of statements
+BLOCK_FIELDS = ("body", "handlers", "orelse", "finalbody")
+
+
+def get_fields(node):
+    values = []
+    for name, value in ast.iter_fields(node):
+        if isinstance(value, list):
+            value = tuple(value)
+        values.append(value)
+    return tuple(values)
+
+
+'''
+Records the fields of every node of the tree, see emit_patched_source()
+'''
+def take_snapshot(tree):
+    snapshot = {}
+    for node in ast.walk(tree):
+        snapshot[id(node)] = (node, get_fields(node))
+    return snapshot
+
+
+'''
+Returns the ids of the nodes whose whole subtree is unchanged since the snapshot.
+The tree is walked bottom-up with an explicit stack
+'''
+def get_unchanged_nodes(tree, snapshot):
+    unchanged = set()
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            for child_node in ast.iter_child_nodes(node):
+                stack.append((child_node, False))
+            continue
+        record = snapshot.get(id(node))
+        if record is None or record[0] is not node or record[1] != get_fields(node):
+            continue
+        if all(id(child_node) in unchanged for child_node in ast.iter_child_nodes(node)):
+            unchanged.add(id(node))
+    return unchanged
+
+
+'''
+Indents every line of the rendered code, except the lines that are inside a
+multi-line string
+'''
+def indent_source(text, indent):
+    lines = text.splitlines(keepends=True)
+    string_lines = set()
+    if indent and len(lines) > 1 and ('"""' in text or "'''" in text):
+        import io
+        import tokenize
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            if token.type == tokenize.STRING and token.end[0] > token.start[0]:
+                string_lines.update(range(token.start[0] + 1, token.end[0] + 1))
+    return "".join(line if number in string_lines else indent + line
+                   for number, line in enumerate(lines, 1))
+
+
+class SpanEmitter:
+    def __init__(self, source, tree, snapshot):
+        self.lines = source.splitlines(keepends=True)
+        if self.lines and not self.lines[-1].endswith("\n"):
+            self.lines[-1] = self.lines[-1] + "\n"
+        self.tree = tree
+        self.snapshot = snapshot
+        self.unchanged = get_unchanged_nodes(tree, snapshot)
+        self.shared = self.get_statements_sharing_lines()
+
+    def get_recorded_value(self, node, name):
+        node, values = self.snapshot[id(node)]
+        return values[node._fields.index(name)]
+
+    def get_recorded_field(self, node, name):
+        return list(self.get_recorded_value(node, name))
+
+    '''
+    Returns the ids of the original statements that can't be copied line by
+    line: statements separated by ; and bodies written on the header line
+    '''
+    def get_statements_sharing_lines(self):
+        shared = set()
+        for node, values in self.snapshot.values():
+            for name, value in zip(node._fields, values):
+                if name not in BLOCK_FIELDS or not value or not isinstance(value[0], ast.stmt):
+                    continue
+                if isinstance(node, ast.stmt) and value[0].lineno == node.lineno:
+                    shared.update(id(statement) for statement in value)
+                for previous, statement in zip(value, value[1:]):
+                    if statement.lineno <= previous.end_lineno:
+                        shared.add(id(previous))
+                        shared.add(id(statement))
+        return shared
+
+    '''
+    First line of the statement, including its decorators
+    '''
+    def get_start(self, statement):
+        decorators = getattr(statement, "decorator_list", None)
+        if decorators:
+            return min(statement.lineno, decorators[0].lineno)
+        return statement.lineno
+
+    def get_indent(self, statement):
+        line = self.lines[statement.lineno - 1]
+        return line[:len(line) - len(line.lstrip())]
+
+    def render(self, statement, indent):
+        return indent_source(ast.unparse(statement) + "\n", indent)
+
+    '''
+    Returns the blocks of the compound statement as (new block, original block)
+    pairs in source order, or None if the header changed and the statement
+    can't be patched
+    '''
+    def get_blocks(self, statement):
+        if id(statement) not in self.snapshot or self.snapshot[id(statement)][0] is not statement:
+            return None
+
+        blocks = []
+        for name, value in ast.iter_fields(statement):
+            if name in BLOCK_FIELDS:
+                continue
+            #The header must be the original one
+            original_value = self.get_recorded_value(statement, name)
+            if isinstance(value, list):
+                if len(value) != len(original_value) or any(a is not b for a, b in zip(value, original_value)):
+                    return None
+                values = value
+            else:
+                if value is not original_value and value != original_value:
+                    return None
+                values = [value]
+            for child_node in values:
+                if isinstance(child_node, ast.AST) and id(child_node) not in self.unchanged:
+                    return None
+
+        for name in BLOCK_FIELDS:
+            if name not in statement._fields:
+                continue
+            value = getattr(statement, name)
+            original_value = self.get_recorded_field(statement, name)
+            if name == "handlers":
+                if len(value) != len(original_value) or any(a is not b for a, b in zip(value, original_value)):
+                    return None
+                for handler in value:
+                    if handler.type is not self.get_recorded_value(handler, "type") or \
+                            handler.name != self.get_recorded_value(handler, "name"):
+                        return None
+                    if handler.type is not None and id(handler.type) not in self.unchanged:
+                        return None
+                    blocks.append((handler.body, self.get_recorded_field(handler, "body")))
+            else:
+                blocks.append((value, original_value))
+
+        previous_end = statement.lineno
+        for value, original_value in blocks:
+            if bool(value) != bool(original_value):
+                return None
+            if not original_value:
+                continue
+            if self.get_start(original_value[0]) <= previous_end:
+                return None
+            previous_end = original_value[-1].end_lineno
+
+        #An elif has no else: line of its own
+        if isinstance(statement, ast.If) and len(statement.orelse) == 1 and isinstance(statement.orelse[0], ast.If):
+            if self.lines[statement.orelse[0].lineno - 1].lstrip().startswith("elif"):
+                return None
+        return [(value, original_value) for value, original_value in blocks if original_value]
+
+    '''
+    Emits a compound statement whose header is unchanged: the header and the
+    lines between the blocks are copied, the blocks are patched
+    '''
+    def emit_compound(self, statement, blocks, out):
+        region_end = self.get_start(statement) - 1
+        for value, original_value in blocks:
+            first = original_value[0]
+            out.extend(self.lines[region_end:self.get_start(first) - 1])
+            self.emit_block(value, original_value, self.get_indent(first), out)
+            region_end = original_value[-1].end_lineno
+        out.extend(self.lines[region_end:statement.end_lineno])
+
+    def emit_block(self, statements, original_statements, indent, out):
+        original_positions = {id(statement): position for position, statement in enumerate(original_statements)}
+        for statement in statements:
+            position = original_positions.get(id(statement))
+            if position is None or id(statement) in self.shared:
+                out.append(self.render(statement, indent))
+                continue
+
+            #The comments and blank lines before the statement belong to it
+            start = self.get_start(statement)
+            if position > 0:
+                out.extend(self.lines[original_statements[position - 1].end_lineno:start - 1])
+
+            if id(statement) in self.unchanged:
+                out.extend(self.lines[start - 1:statement.end_lineno])
+                continue
+            blocks = self.get_blocks(statement)
+            if blocks is None:
+                out.append(self.render(statement, indent))
+            else:
+                self.emit_compound(statement, blocks, out)
+
+    def emit(self):
+        if self.snapshot.get(id(self.tree), (None,))[0] is not self.tree:
+            return ast.unparse(self.tree) + "\n"
+        original_body = self.get_recorded_field(self.tree, "body")
+        if not original_body:
+            return ast.unparse(self.tree) + "\n"
+        out = self.lines[:self.get_start(original_body[0]) - 1]
+        self.emit_block(self.tree.body, original_body, "", out)
+        out.extend(self.lines[original_body[-1].end_lineno:])
+        return "".join(out)
+
+
+'''
+Returns the optimized source, reusing the original source for everything the
+passes did not change. snapshot is the result of take_snapshot() on the tree
+before the passes ran
+'''
+def emit_patched_source(source, tree, snapshot):
+    return SpanEmitter(source, tree, snapshot).emit()
@@ -1,5 +1,10 @@
 import ast
+from collections import deque
+
 from ast_helpers import *
+from def_use import get_summary, invalidate
+from cost_model import is_constant_expression, get_hoist_savings
+from constant import HOIST_MIN_SAVINGS
 
 '''
 Gets all the variables in LHS of assignment statement
@@ -80,21 +85,7 @@ def get_assign_node():
 Checks if the iterator is present within the given node
 '''
 def check_if_iter_present(node, iterator):
-    return_value = False
-    node_generator = ast.walk(node)
-    for child_node in node_generator:
-        if(isinstance(child_node,ast.Name)):
-            if child_node.id == iterator:
-                return_value = True
-                break
-        elif isinstance(child_node, ast.Subscript):
-            if child_node.slice.id == iterator:
-                return_value = True
-                break
-        else:
-            return_value = False
-            
-    return return_value
+    return iterator in get_summary(node).names
 
 '''
 info_object[0] - Node to be shifted out
@@ -124,17 +115,7 @@ def get_info_invariant(invariant_object):
 This returns all the variables that are present in the given node
 '''
 def get_all_variables_in_statement(statement):
-    return_list = []
-    node_generator = ast.walk(statement)
-    for child_node in node_generator:
-        if(isinstance(child_node,ast.Name)):
-            return_list.append(child_node.id)
-        elif isinstance(child_node, ast.Subscript):
-            return_list.append(child_node.value.id)
-        else:
-            pass
-            
-    return return_list
+    return list(get_summary(statement).names)
 
 '''
 Checks if the iterator is present on the LHS of ast.Assign
@@ -169,24 +150,26 @@ def check_if_condition_var_present(target, variables_in_compare):
             return True
     return False
 
-def remove_invariant_object(parent_node, invariant_object, adjust_for):
+def remove_invariant_object(block, invariant_object, adjust_for):
     #Removing all positions from for statements
     node_to_be_added, for_position, temporary, line_number, parent_node_position = get_info_invariant(invariant_object)
     if temporary:
         temp_variable_name = "__o_tmp_"+str(line_number)
-        statement_to_be_changed = parent_node.body[parent_node_position].body[for_position - adjust_for]
-        new_name_node = ast.Name()
-        new_name_node.id = temp_variable_name
+        statement_to_be_changed = block[parent_node_position].body[for_position - adjust_for]
+        new_name_node = ast.Name(id=temp_variable_name, ctx=ast.Load())
+        ast.copy_location(new_name_node, statement_to_be_changed.value)
         statement_to_be_changed.value = new_name_node
+        invalidate(statement_to_be_changed)
     else:
         actual_position_for = for_position - adjust_for
 
-        del parent_node.body[parent_node_position].body[actual_position_for]
+        del block[parent_node_position].body[actual_position_for]
+        invalidate(block[parent_node_position])
         adjust_for = adjust_for + 1 
 
     return adjust_for
 
-def add_invariant_object(parent_node, invariant_object, adjust_for):
+def add_invariant_object(block, invariant_object, adjust_for):
     node_to_be_added, for_position, temporary, line_number, parent_node_position = get_info_invariant(invariant_object)
     actual_for_position = parent_node_position + adjust_for
     if temporary:
@@ -194,16 +177,56 @@ def add_invariant_object(parent_node, invariant_object, adjust_for):
         new_assign_node = get_assign_node()
         new_assign_node.targets[0].id = temp_variable_name
         new_assign_node.value = node_to_be_added
+        #The parsed node is located on line 1, it takes the place of the loop instead
+        loop_node = block[actual_for_position]
+        ast.copy_location(new_assign_node, loop_node)
+        ast.copy_location(new_assign_node.targets[0], loop_node)
 
-        parent_node.body.insert(actual_for_position, new_assign_node)
+        block.insert(actual_for_position, new_assign_node)
     else:
-        parent_node.body.insert(actual_for_position, node_to_be_added) 
+        block.insert(actual_for_position, node_to_be_added) 
 
     adjust_for = adjust_for + 1 
 
     return adjust_for
 
 
+#The expressions that can't be moved across an await: the other tasks run
+#while the coroutine is suspended, and can change what they compute
+AWAIT_UNSAFE_TYPES = (ast.Await, ast.Yield, ast.YieldFrom, ast.Call, ast.Attribute, ast.Subscript)
+
+'''
+Checks if the node only computes with the local variables of the coroutine,
+which the other tasks can't change
+'''
+def check_if_safe_across_await(node, local_names):
+    for child_node in ast.walk(node):
+        if isinstance(child_node, AWAIT_UNSAFE_TYPES):
+            return False
+        if isinstance(child_node, ast.Name) and child_node.id not in local_names:
+            return False
+    return True
+
+'''
+Returns the invariants of the block that can be hoisted out of their loop with
+respect to the awaits. An await is never hoisted. Out of a loop that awaits
+(an async for, or a loop with an await in it), only the invariants that are
+safe across an await are hoisted. local_names are the local variables of the
+function of the block
+'''
+def remove_await_unsafe_invariants(block, invariants_statements, local_names):
+    safe_invariants = []
+    for invariant_object in invariants_statements:
+        node_to_be_added, for_position, temporary, line_number, parent_node_position = get_info_invariant(invariant_object)
+        if get_summary(node_to_be_added).has_await:
+            continue
+        if get_summary(block[parent_node_position]).has_await and \
+                not check_if_safe_across_await(node_to_be_added, local_names):
+            continue
+        safe_invariants.append(invariant_object)
+    return safe_invariants
+
+
 def check_invariant_statements_for(invariants_statements, node, iterator):
     iter = get_iterator_for(node)
     variables_rhs_of_iter = []
@@ -256,7 +279,6 @@ def check_invariant_statements_while(invariants_statements, node, iterator):
         if isinstance(statement_in_while, ast.Assign):
             target_has_condition_variable = False
             for target in statement_in_while.targets:
-                print(target)
                 if check_if_condition_var_present(target.id, variables_in_compare):
                     target_has_condition_variable = True
                     break
@@ -267,7 +289,6 @@ def check_invariant_statements_while(invariants_statements, node, iterator):
             if target_has_condition_variable:
                 #Check if rhs has condition variables. If yes, cant do anything, if no tmp variable
                 variables_in_rhs = get_all_variables_in_statement(statement_in_while.value)
-                print(variables_in_rhs)
                 condition_variables_in_rhs = False
                 for each_variable in variables_in_rhs:
                     if check_if_condition_var_present(each_variable, variables_in_compare):
@@ -300,6 +321,253 @@ def check_invariant_statements_while(invariants_statements, node, iterator):
                         remember_loop_invariant_statement(invariants_statements, statement_in_while, i, False, line_number, iterator)
 
 
+#The comprehensions (see hoist_comprehension_invariants())
+COMPREHENSION_TYPES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+#Builtins that consume the generator expression given to them right away
+CONSUMING_BUILTINS = ("all", "any", "dict", "frozenset", "list", "max", "min", "set", "sorted", "sum", "tuple")
+
+#The expressions that are never hoisted out of a comprehension
+COMPREHENSION_UNSAFE_TYPES = (ast.Call, ast.Await, ast.Yield, ast.YieldFrom, ast.NamedExpr, ast.Lambda,
+                              ast.Starred) + COMPREHENSION_TYPES
+
+#The statements that evaluate their comprehensions once, when they run
+COMPREHENSION_STATEMENT_TYPES = (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr, ast.Return)
+
+'''
+Returns the children of the expression that are always evaluated with it: not
+the operands of and/or after the first one, not the branches of a conditional
+expression and not the body of a lambda
+'''
+def get_evaluated_children(node):
+    if isinstance(node, ast.BoolOp):
+        return node.values[:1]
+    if isinstance(node, ast.IfExp):
+        return [node.test]
+    if isinstance(node, ast.Lambda):
+        return []
+    return [child_node for child_node in ast.iter_child_nodes(node) if isinstance(child_node, ast.expr)]
+
+'''
+Returns the comprehensions evaluated every time the statement runs, the
+outermost ones only. A generator expression only runs when it is consumed, so
+it is only returned when it is the argument of a builtin that consumes it.
+shadowed_names are the names of the builtins that are rebound
+'''
+def get_evaluated_comprehensions(statement, shadowed_names):
+    comprehensions = []
+    consumed = set()
+    stack = [child_node for child_node in ast.iter_child_nodes(statement) if isinstance(child_node, ast.expr)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in CONSUMING_BUILTINS \
+                and node.func.id not in shadowed_names and len(node.args) == 1 \
+                and isinstance(node.args[0], ast.GeneratorExp):
+            consumed.add(id(node.args[0]))
+        if isinstance(node, COMPREHENSION_TYPES):
+            if not isinstance(node, ast.GeneratorExp) or id(node) in consumed:
+                comprehensions.append(node)
+            continue
+        stack.extend(reversed(get_evaluated_children(node)))
+    return comprehensions
+
+'''
+Checks if the iterable is known to have items: a literal with an item that is
+not unpacked, or range() of constant bounds. shadowed_names are the names of
+the builtins that are rebound
+'''
+def check_if_non_empty(iterable, shadowed_names):
+    if isinstance(iterable, (ast.List, ast.Tuple, ast.Set)):
+        return any(not isinstance(item, ast.Starred) for item in iterable.elts)
+    if isinstance(iterable, ast.Dict):
+        return any(key is not None for key in iterable.keys)
+    if isinstance(iterable, ast.Constant):
+        return isinstance(iterable.value, (str, bytes)) and len(iterable.value) > 0
+    if not isinstance(iterable, ast.Call) or not isinstance(iterable.func, ast.Name) or \
+            iterable.func.id != "range" or "range" in shadowed_names or iterable.keywords or \
+            not 1 <= len(iterable.args) <= 2:
+        return False
+    if not all(isinstance(argument, ast.Constant) and type(argument.value) is int for argument in iterable.args):
+        return False
+    bounds = [argument.value for argument in iterable.args]
+    return len(range(*bounds)) > 0
+
+'''
+Checks if the statement calls or awaits something outside of the comprehension,
+which could run before it. A call whose only argument is the comprehension runs
+after it, or it is the builtin consuming the generator expression (see
+get_evaluated_comprehensions()), it doesn't count
+'''
+def check_if_calls_around(statement, comprehension):
+    stack = list(ast.iter_child_nodes(statement))
+    while stack:
+        node = stack.pop()
+        if node is comprehension:
+            continue
+        if isinstance(node, ast.Await) or (isinstance(node, ast.Call) and node.args != [comprehension]):
+            return True
+        stack.extend(ast.iter_child_nodes(node))
+    return False
+
+'''
+Returns the subexpressions of the comprehension that don't change from one
+element to the next, the largest ones, as (parent, field, index) with index
+None for a field that isn't a list. They only read variables that aren't bound
+by the comprehension, and they don't call or await anything. Only the parts
+evaluated up to the first if of the comprehension are looked at, the rest is
+guarded by it. When the comprehension or the statement around it (calls_around)
+calls something, the callee can change the globals, the closure cells, the
+attributes and the items between two elements, so the invariants must then be
+safe across it like across an await (see check_if_safe_across_await()): they
+only read private_names, the local variables of the function without the cells
+its nested functions assign. An attribute or an item can raise, it is only
+hoisted when the iterables are known to have items (see check_if_non_empty())
+'''
+def get_comprehension_invariants(comprehension, private_names, shadowed_names, calls_around):
+    bound_names = set()
+    for child_node in ast.walk(comprehension):
+        if isinstance(child_node, ast.Name) and not isinstance(child_node.ctx, ast.Load):
+            bound_names.add(child_node.id)
+
+    #The parts evaluated for every element, with whether they are evaluated for
+    #sure when the comprehension runs. The first iterable is evaluated once, in
+    #the enclosing scope
+    fields = [("key", None), ("value", None)] if isinstance(comprehension, ast.DictComp) else [("elt", None)]
+    locations = []
+    certain = {}
+    non_empty = check_if_non_empty(comprehension.generators[0].iter, shadowed_names)
+    guarded = False
+    for position, generator in enumerate(comprehension.generators):
+        if position > 0:
+            locations.append((generator, "iter", None))
+            certain[id(generator.iter)] = non_empty
+            non_empty = non_empty and check_if_non_empty(generator.iter, shadowed_names)
+        if generator.ifs:
+            locations.append((generator, "ifs", 0))
+            certain[id(generator.ifs[0])] = non_empty
+            guarded = True
+            break
+    if not guarded:
+        locations[:0] = [(comprehension, name, index) for name, index in fields]
+        for name, index in fields:
+            certain[id(getattr(comprehension, name))] = non_empty
 
+    #The invariance of every node, bottom-up
+    order = []
+    stack = [get_location(location) for location in locations]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(ast.iter_child_nodes(node))
+    has_calls = calls_around or any(isinstance(node, (ast.Call, ast.Await)) for node in order)
+    invariant = {}
+    for node in reversed(order):
+        if isinstance(node, COMPREHENSION_UNSAFE_TYPES):
+            invariant[id(node)] = False
+        elif isinstance(node, ast.Name):
+            invariant[id(node)] = isinstance(node.ctx, ast.Load) and node.id not in bound_names
+        else:
+            invariant[id(node)] = all(invariant[id(child_node)] for child_node in ast.iter_child_nodes(node))
+
+    invariants = []
+    stack = [(location, certain[id(get_location(location))]) for location in reversed(locations)]
+    while stack:
+        location, evaluated_for_sure = stack.pop()
+        node = get_location(location)
+        if invariant[id(node)] and (not has_calls or check_if_safe_across_await(node, private_names)) and \
+                (evaluated_for_sure or not any(isinstance(child_node, (ast.Attribute, ast.Subscript))
+                                               for child_node in ast.walk(node))):
+            if not isinstance(node, (ast.Name, ast.Constant)) and not is_constant_expression(node):
+                invariants.append(location)
+            continue
+        evaluated = {id(child_node) for child_node in get_evaluated_children(node)}
+        children = []
+        for name, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                children.extend((node, name, index) for index, item in enumerate(value) if id(item) in evaluated)
+            elif id(value) in evaluated:
+                children.append((node, name, None))
+        stack.extend((child, evaluated_for_sure) for child in reversed(children))
+    return invariants
+
+def get_location(location):
+    parent, name, index = location
+    value = getattr(parent, name)
+    return value if index is None else value[index]
+
+def set_location(location, node):
+    parent, name, index = location
+    if index is None:
+        setattr(parent, name, node)
+    else:
+        getattr(parent, name)[index] = node
+
+'''
+Hoists the invariants of the comprehensions of the statement into temporaries
+assigned just before it. Returns the assignments of the temporaries, to be
+inserted before the statement. Like for the loops, the invariant is evaluated
+once even if the comprehension has no element, unless it can raise (see
+get_comprehension_invariants()). private_names are the local
+variables of the function without the cells its nested functions assign
+'''
+def hoist_statement_comprehensions(statement, shadowed_names, private_names, use_cost_model):
+    assignments = []
+    #A walrus in the statement could change what the invariants read
+    if get_summary(statement).has_walrus or get_summary(statement).has_await:
+        return assignments
+    for comprehension in get_evaluated_comprehensions(statement, shadowed_names):
+        calls_around = check_if_calls_around(statement, comprehension)
+        for location in get_comprehension_invariants(comprehension, private_names, shadowed_names, calls_around):
+            node = get_location(location)
+            if use_cost_model and \
+                    get_hoist_savings(node, True, comprehension.generators[0]) < HOIST_MIN_SAVINGS:
+                continue
+            temp_variable_name = "__o_tmp_" + str(node.lineno) + "_" + str(node.col_offset)
+            new_assign_node = get_assign_node()
+            new_assign_node.targets[0].id = temp_variable_name
+            new_assign_node.value = node
+            ast.copy_location(new_assign_node, statement)
+            ast.copy_location(new_assign_node.targets[0], statement)
+            assignments.append(new_assign_node)
+
+            new_name_node = ast.Name(id=temp_variable_name, ctx=ast.Load())
+            ast.copy_location(new_name_node, node)
+            set_location(location, new_name_node)
+    return assignments
+
+'''
+Hoists the invariants of the comprehensions of the tree, out of the class
+bodies: a comprehension in a class body can't see the temporaries assigned
+there, the names of a class are not visible in its nested scopes
+'''
+def hoist_comprehension_invariants(tree, use_cost_model):
+    from scopes import get_scope
 
+    module_names = get_scope(tree).get_exported_names() if isinstance(tree, ast.Module) else set()
+    queue = deque()
+    #(node, names of the function, the ones no nested function assigns, True in a class body)
+    queue.append((tree, set(), set(), False))
+    while queue:
+        parent_node, local_names, private_names, in_class = queue.popleft()
+        if isinstance(parent_node, ast.ClassDef):
+            in_class = True
+        elif isinstance(parent_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            scope = get_scope(parent_node)
+            local_names = scope.get_locals()
+            private_names = local_names - scope.get_assigned_cells()
+            in_class = False
 
+        for owner, block in get_blocks(parent_node):
+            new_block = []
+            for statement in block:
+                queue.append((statement, local_names, private_names, in_class))
+                if not in_class and isinstance(statement, COMPREHENSION_STATEMENT_TYPES):
+                    assignments = hoist_statement_comprehensions(statement, module_names | local_names,
+                                                                 private_names, use_cost_model)
+                    if assignments:
+                        invalidate(statement)
+                    new_block.extend(assignments)
+                new_block.append(statement)
+            if len(new_block) != len(block):
+                block[:] = new_block
+                invalidate(owner)
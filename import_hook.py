@@ -0,0 +1,157 @@
+'''
+Import hook that optimizes modules when they are imported, without a build
+step producing _optimized.py files.
+
+    import import_hook
+    import_hook.install(["mypackage"])
+
+The finder is put at the front of sys.meta_path and only handles the
+configured packages (and their submodules). Their source is parsed, run through
+optimize() and compiled straight from the optimized tree. The code objects are
+cached in __pycache__ next to the source, in
+
+    <module>.<cache tag>.ouroboros-<optimizer version>.pyc
+
+keyed by the hash of the source and of the selected passes, so only the first
+import pays for the optimization. The optimizer version (see
+ouroboros.get_optimizer_version()) is OPTIMIZER_VERSION and the hash of the
+optimizer modules, so a change of the passes never serves
+code they optimized before. The standard .pyc files are neither read nor
+written, so the optimized code never leaks into imports made without the hook.
+
+If the optimizer fails on a module, a warning is issued and the module is
+compiled unoptimized.
+'''
+
+import ast
+import contextlib
+import importlib.machinery
+import importlib.util
+import io
+import marshal
+import os
+import sys
+import warnings
+
+from ouroboros import optimize, get_optimizer_version, DEFAULT_PASSES
+from scopes import get_scope, clear_scopes
+
+#Same layout as the hash-based pyc files of PEP 552
+HASH_BASED_FLAGS = (1).to_bytes(4, "little")
+
+
+'''
+Returns the path of the cached code object for the given source file
+'''
+def get_cache_path(source_path):
+    directory, filename = os.path.split(source_path)
+    stem = os.path.splitext(filename)[0]
+    tag = sys.implementation.cache_tag
+    return os.path.join(directory, "__pycache__", f"{stem}.{tag}.ouroboros-{get_optimizer_version()}.pyc")
+
+
+'''
+Optimizes and compiles the source. The names bound by the module are kept, the
+importers can read them. Falls back to the unoptimized tree when the optimizer
+fails
+'''
+def compile_optimized(source, path, passes=DEFAULT_PASSES):
+    tree = ast.parse(source, path)
+    try:
+        exported_names = sorted(get_scope(tree).get_exported_names())
+        clear_scopes()
+        with contextlib.redirect_stdout(io.StringIO()):
+            optimized_tree = optimize(tree, dependent_variables=exported_names, passes=passes)
+        ast.fix_missing_locations(optimized_tree)
+        return compile(optimized_tree, path, "exec", dont_inherit=True)
+    except Exception as e:
+        warnings.warn(f"ouroboros could not optimize {path}: {type(e).__name__}: {e}", ImportWarning)
+        return compile(ast.parse(source, path), path, "exec", dont_inherit=True)
+
+
+class OptimizingLoader(importlib.machinery.SourceFileLoader):
+    def __init__(self, fullname, path, passes=DEFAULT_PASSES):
+        super().__init__(fullname, path)
+        self.passes = tuple(passes)
+
+    def get_key(self, data):
+        return importlib.util.source_hash(data + repr(self.passes).encode())
+
+    def read_cache(self, cache_path, key):
+        try:
+            with open(cache_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        header = importlib.util.MAGIC_NUMBER + HASH_BASED_FLAGS + key
+        if not data.startswith(header):
+            return None
+        try:
+            return marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def write_cache(self, cache_path, key, code):
+        data = importlib.util.MAGIC_NUMBER + HASH_BASED_FLAGS + key + marshal.dumps(code)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            #Written to a temporary file first, so a concurrent import never reads half of it
+            temporary_path = f"{cache_path}.{os.getpid()}"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            #Like the standard bytecode cache, a read-only location only costs time
+            pass
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        data = self.get_data(source_path)
+        key = self.get_key(data)
+        cache_path = get_cache_path(source_path)
+
+        code = self.read_cache(cache_path, key)
+        if code is None:
+            source = importlib.util.decode_source(data)
+            code = compile_optimized(source, source_path, self.passes)
+            self.write_cache(cache_path, key, code)
+        return code
+
+
+class OptimizingFinder:
+    def __init__(self, packages, passes=DEFAULT_PASSES):
+        self.packages = tuple(packages)
+        self.passes = tuple(passes)
+
+    def matches(self, fullname):
+        for package in self.packages:
+            if fullname == package or fullname.startswith(package + "."):
+                return True
+        return False
+
+    def find_spec(self, fullname, path, target=None):
+        if not self.matches(fullname):
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            return None
+        spec.loader = OptimizingLoader(fullname, spec.origin, self.passes)
+        return spec
+
+    def invalidate_caches(self):
+        pass
+
+
+'''
+Installs the import hook for the given packages. Returns the finder, which
+can be given to uninstall()
+'''
+def install(packages, passes=DEFAULT_PASSES):
+    finder = OptimizingFinder(packages, passes)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def uninstall(finder):
+    if finder in sys.meta_path:
+        sys.meta_path.remove(finder)
@@ -0,0 +1,185 @@
+'''
+Per-function incremental optimization.
+
+The module is split into units: every top-level ast.FunctionDef/ast.ClassDef is
+a unit of its own and every maximal run of other top-level statements is one
+unit. Each unit is optimized on its own, seeded with the names the rest of the
+module uses, and the optimized statements are remembered in a cache keyed by
+the fingerprint of the unit, of the module-level facts it depends on and the
+version of the optimizer (see ouroboros.get_optimizer_version()). On
+the next run only the units whose key changed ("dirty" units) go through
+remove_useless()/hoist_invariants() again.
+'''
+
+import ast
+import copy
+import hashlib
+import os
+import pickle
+
+from ast_helpers import fingerprint
+from constant import INCREMENTAL_CACHE_VERSION
+from transformer import known_pure
+from ouroboros import optimize, get_optimizer_version, DEFAULT_PASSES
+
+
+class IncrementalCache:
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        #A cache that can't be read is treated as empty, it only costs time
+        try:
+            with open(self.path, "rb") as f:
+                version, entries = pickle.load(f)
+        except Exception:
+            return
+        if version == INCREMENTAL_CACHE_VERSION:
+            self.entries = entries
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as f:
+            pickle.dump((INCREMENTAL_CACHE_VERSION, self.entries), f)
+
+    def clear(self):
+        self.entries = {}
+        self.used = set()
+
+    def prune(self):
+        #Only keep the units that were seen since the last prune
+        self.entries = {key: self.entries[key] for key in self.used if key in self.entries}
+        self.used = set()
+
+    def lookup(self, key):
+        self.used.add(key)
+        statements = self.entries.get(key)
+        if statements is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        #The caller owns the returned nodes, the cached ones must stay untouched
+        return copy.deepcopy(statements)
+
+    def store(self, key, statements):
+        self.used.add(key)
+        self.entries[key] = copy.deepcopy(statements)
+
+
+'''
+Returns the default location of the cache for the given script. It lives in
+__pycache__ next to the script, like the bytecode cache
+'''
+def get_default_cache_path(script):
+    directory, filename = os.path.split(str(script))
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, "__pycache__", stem + ".ouroboros.pickle")
+
+
+'''
+Splits the module body into units. Returns a list of (is_definition, statements)
+'''
+def split_into_units(tree):
+    units = []
+    run = []
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+            if run:
+                units.append((False, run))
+                run = []
+            units.append((True, [statement]))
+        else:
+            run.append(statement)
+    if run:
+        units.append((False, run))
+    return units
+
+
+'''
+Returns all the names a list of statements refers to. Used to seed the mark phase
+of the other units, so this errs on the side of keeping statements
+'''
+def get_names_used(statements):
+    names = set()
+    for statement in statements:
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name):
+                names.add(node.id)
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                names.update(node.names)
+    return names
+
+
+'''
+Returns all the names bound by the top-level statements of the module
+'''
+def get_module_bindings(tree):
+    names = set()
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+            names.add(statement.name)
+        elif isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+            for target in targets:
+                for node in ast.walk(target):
+                    if isinstance(node, ast.Name):
+                        names.add(node.id)
+    return names
+
+
+'''
+Fingerprint of the module-level facts a unit depends on: the names used by the
+rest of the module, the module globals and the list of known pure functions
+'''
+def get_facts_fingerprint(seed, global_variables):
+    facts = repr((sorted(seed), sorted(global_variables), known_pure))
+    return hashlib.sha1(facts.encode()).hexdigest()
+
+
+'''
+Optimizes the module unit by unit, reusing the cached result of every unit whose
+fingerprint and facts are unchanged. passes and fixed_point are passed on to optimize()
+
+Runs of module-level statements are fingerprinted with their locations, since the
+temporaries hoisted out of module-level loops are named after line numbers and
+are globals shared by all the runs
+'''
+def optimize_incremental(tree, cache=None, passes=DEFAULT_PASSES, fixed_point=True):
+    if cache is None:
+        cache = IncrementalCache()
+
+    units = split_into_units(tree)
+    names_used = [get_names_used(statements) for is_definition, statements in units]
+    global_variables = get_module_bindings(tree)
+
+    new_body = []
+    for position, (is_definition, statements) in enumerate(units):
+        seed = set()
+        for other_position, names in enumerate(names_used):
+            if other_position != position:
+                seed.update(names)
+
+        unit = ast.Module(body=statements, type_ignores=[])
+        key = (get_optimizer_version(), tuple(passes), fixed_point,
+               fingerprint(unit, include_attributes=not is_definition),
+               get_facts_fingerprint(seed, global_variables))
+
+        optimized_statements = cache.lookup(key)
+        if optimized_statements is None:
+            unit = optimize(unit, sorted(seed), passes, fixed_point)
+            optimized_statements = unit.body
+            cache.store(key, optimized_statements)
+        new_body.extend(optimized_statements)
+
+    tree.body = new_body
+    return tree
@@ -0,0 +1,121 @@
+'''
+@optimize decorator, to opt single hot functions into the optimizer without
+changing the build
+
+    from jit import optimize
+
+    @optimize
+    def hot(a, x, y):
+        ...
+
+The source of the decorated function is parsed, the passes run on just its
+ast.FunctionDef and the result is compiled into a new function that shares the
+globals, defaults and closure of the original one. The code objects are cached
+by the hash of the source, so redefining the same function (e.g. in a loop or
+on reload) does not optimize it again.
+
+On any failure, or for functions that can't be recompiled on their own (other
+decorators below @optimize, zero-argument super()), the original function is
+returned with a RuntimeWarning.
+'''
+
+import ast
+import contextlib
+import functools
+import hashlib
+import inspect
+import io
+import textwrap
+import types
+import warnings
+
+import ouroboros
+
+code_cache = {}
+
+
+'''
+Returns the names whose assignments are visible outside of the function, which
+remove_useless() must keep: globals it refers to, variables it shares with the
+enclosing function and its global/nonlocal declarations
+'''
+def get_outer_names(function, node):
+    names = set(function.__code__.co_names) | set(function.__code__.co_freevars)
+    for child_node in ast.walk(node):
+        if isinstance(child_node, (ast.Global, ast.Nonlocal)):
+            names.update(child_node.names)
+    return sorted(names)
+
+
+'''
+Compiles the optimized version of the function and returns its code object
+'''
+def compile_function(function, passes):
+    source = textwrap.dedent(inspect.getsource(function))
+    freevars = function.__code__.co_freevars
+    key = (hashlib.sha1(source.encode()).hexdigest(), tuple(passes), freevars, function.__code__.co_filename)
+    if key in code_cache:
+        return code_cache[key]
+
+    tree = ast.parse(source)
+    node = tree.body[0]
+    if not isinstance(node, ast.FunctionDef) or node.name != function.__name__:
+        raise ValueError("the source is not a plain function definition")
+    node.decorator_list = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree = ouroboros.optimize(tree, get_outer_names(function, node), passes)
+
+    #The free variables must stay free variables, so the function is compiled
+    #inside an outer function that defines them
+    if freevars:
+        outer = ast.parse(f"def __o_outer({', '.join(freevars)}):\n    pass").body[0]
+        outer.body = tree.body
+        tree.body = [outer]
+    ast.increment_lineno(tree, function.__code__.co_firstlineno - 1)
+    ast.fix_missing_locations(tree)
+    code = compile(tree, function.__code__.co_filename, "exec", dont_inherit=True)
+
+    if freevars:
+        code = [const for const in code.co_consts if isinstance(const, types.CodeType)][0]
+    code = [const for const in code.co_consts
+            if isinstance(const, types.CodeType) and const.co_name == function.__name__][0]
+
+    code_cache[key] = code
+    return code
+
+
+'''
+Returns the optimized version of the function
+'''
+def optimize_function(function, passes=ouroboros.DEFAULT_PASSES):
+    if hasattr(function, "__wrapped__"):
+        raise ValueError("@optimize must be the innermost decorator")
+    if "__class__" in function.__code__.co_freevars:
+        raise ValueError("functions using zero-argument super() can't be recompiled")
+
+    code = compile_function(function, passes)
+
+    #The optimizer may have removed the uses of some of the free variables
+    cells = dict(zip(function.__code__.co_freevars, function.__closure__ or ()))
+    closure = tuple(cells[name] for name in code.co_freevars)
+
+    new_function = types.FunctionType(code, function.__globals__, function.__name__,
+                                      function.__defaults__, closure)
+    new_function.__kwdefaults__ = function.__kwdefaults__
+    functools.update_wrapper(new_function, function)
+    return new_function
+
+
+def optimize(function=None, *, passes=ouroboros.DEFAULT_PASSES):
+    def decorator(function):
+        try:
+            return optimize_function(function, passes)
+        except Exception as e:
+            warnings.warn(f"could not optimize {function.__qualname__}: {type(e).__name__}: {e}", RuntimeWarning)
+            return function
+
+    #Both @optimize and @optimize(passes=...) are supported
+    if function is None:
+        return decorator
+    return decorator(function)
@@ -1,12 +1,12 @@
 import ast
-import copy
-import sys
-from transformer import *
-from visitor import *
+import os
+from collections import deque
 from constant import *
-from hoist_invariants_helpers import *
-from ast_helpers import *
-from remove_useless_helpers import *
+
+'''
+The helpers of each pass are imported by the pass itself, so that running a
+single pass from the command line only loads the modules it needs (see cli.py)
+'''
 
 '''
 The function removes all the useless assignment statements in the given AST.
@@ -26,10 +26,19 @@ check_ast_empty_for()
 Lastly, it checks for consistency of the whole AST. If there are any if statements and the
 if block is empty but not the else block, it reverses the check condition. This is taken care
 by the function check_new_ast_for_consistency() 
+
+dependent_variables optionally seeds the mark phase with names that are known
+to be used outside of the given tree (see incremental.py)
 '''
-def remove_useless(tree: ast.AST) -> ast.AST:
+def remove_useless(tree: ast.AST, dependent_variables=None) -> ast.AST:
     # Implement this optimization here
-    dependent_variables = [] 
+    from remove_useless_helpers import (remove_useless_in_block, check_new_ast_for_pass,
+                                        check_new_ast_empty_for, check_new_ast_for_consistency)
+    from def_use import clear_summaries
+    from scopes import clear_scopes
+    dependent_variables = list(dependent_variables or [])
+    clear_summaries()
+    clear_scopes()
     remove_useless_in_block(tree,dependent_variables)
     
     check_new_ast_for_pass(tree)
@@ -38,6 +47,8 @@ def remove_useless(tree: ast.AST) -> ast.AST:
     
     check_new_ast_for_consistency(tree)
 
+    clear_summaries()
+    clear_scopes()
     return tree
 
 
@@ -58,60 +69,262 @@ modifications to the ast.For/ast.While node and it's parent node
 NOTE: The order of the statements put to the top of the parent node are maintained
 in accordance to how they occur in the for block. Please see test_hoist_maintain_order()
 for the test case and expected output.
+
+With use_cost_model, the candidates that are not worth hoisting stay in their
+loop (see cost_model.py)
 '''
-def hoist_invariants(tree: ast.AST) -> ast.AST:
+def hoist_invariants(tree: ast.AST, use_cost_model=True) -> ast.AST:
     # Implement this optimization here
-    queue = []
-    queue.append(tree)
+    from hoist_invariants_helpers import (check_invariant_statements_for, check_invariant_statements_while,
+                                          remove_invariant_object, add_invariant_object,
+                                          remove_await_unsafe_invariants, hoist_comprehension_invariants)
+    from cost_model import select_invariants
+    from def_use import clear_summaries, invalidate
+    from ast_helpers import get_blocks
+    from scopes import get_scope, clear_scopes
+    clear_summaries()
+    clear_scopes()
+    queue = deque()
+    #(node, local variables of its function)
+    queue.append((tree, set()))
 
     while queue:
-        parent_node = queue.pop(0)
-        if "body" in parent_node._fields:
-            length_of_parent_node = len(parent_node.body)
-            
+        parent_node, local_names = queue.popleft()
+        if isinstance(parent_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            local_names = get_scope(parent_node).get_locals()
+        #Every statement list is handled the same way: the body, the else
+        #clauses, the finally block and the except handlers and match cases
+        for owner, block in get_blocks(parent_node):
             #Add all children to list
-            for block in parent_node.body:
-                queue.append(block)
+            for statement in block:
+                queue.append((statement, local_names))
 
             invariants_statements = [] 
-            #Find all for statements that have 0 statements in the body
-            #We need to remove such for statements
-            for iterator in range(length_of_parent_node):
-                node = parent_node.body[iterator]
-                if isinstance(node, ast.For):
+            for iterator in range(len(block)):
+                node = block[iterator]
+                if isinstance(node, (ast.For, ast.AsyncFor)):
                     check_invariant_statements_for(invariants_statements, node, iterator)   
                 
                 elif isinstance(node, ast.While):
                     check_invariant_statements_while(invariants_statements, node, iterator)
 
-            adjust_for = 0
+            invariants_statements = remove_await_unsafe_invariants(block, invariants_statements, local_names)
+
+            if use_cost_model and invariants_statements:
+                kept, skipped = select_invariants(block, invariants_statements)
+                invariants_statements = [invariant_object for invariant_object, savings in kept]
+
+            #The statements removed from a loop only move the next ones of the
+            #same loop
+            adjust_for = {}
             for invariant_object in invariants_statements:
-                adjust_for = remove_invariant_object(parent_node, invariant_object, adjust_for)               
+                loop_position = invariant_object[4]
+                adjust_for[loop_position] = remove_invariant_object(block, invariant_object,
+                                                                    adjust_for.get(loop_position, 0))
 
             adjust_for = 0    
             for invariant_object in invariants_statements:
-                adjust_for = add_invariant_object(parent_node, invariant_object, adjust_for)
-                
+                adjust_for = add_invariant_object(block, invariant_object, adjust_for)
+            if invariants_statements:
+                invalidate(owner)
+
+    hoist_comprehension_invariants(tree, use_cost_model)
     
+    clear_summaries()
+    clear_scopes()
+    return tree
+
+
+'''
+Type-specialized rewrites, such as x ** 2 into x * x, where the local type
+inference (see type_inference.py) proves the operands have the builtin type
+the rewrite needs. Every function and method is specialized on its own
+'''
+def specialize_types(tree: ast.AST) -> ast.AST:
+    from specialize_types_helpers import get_functions, specialize_function
+    from type_inference import get_module_names
+    from def_use import clear_summaries
+    clear_summaries()
+    module_names = get_module_names(tree)
+    for function in get_functions(tree):
+        specialize_function(function, module_names)
+    clear_summaries()
     return tree
 
 
 '''
-This function runs the remove_useless() and hoist_invariants() continuously
-until there are no changes made to the AST
+Loop unswitching: a loop with an if statement whose test is invariant in the
+loop is replaced by an if statement choosing between two copies of the loop,
+one per branch, so the test is evaluated once instead of on every iteration.
+Like hoist_invariants(), the test is evaluated even if the loop doesn't run.
+The copies are bounded by UNSWITCH_BUDGET (see unswitch_block())
+'''
+def unswitch_loops(tree: ast.AST) -> ast.AST:
+    from unswitch_loops_helpers import unswitch_block
+    from def_use import clear_summaries, invalidate
+    from ast_helpers import get_blocks
+    from scopes import get_scope, clear_scopes
+    from type_inference import get_module_names
+    clear_summaries()
+    clear_scopes()
+    module_names = get_module_names(tree)
+    #The size of each function so far, and its types
+    sizes = {}
+    types = {}
+    queue = deque()
+    #(node, its function or the module, local variables of the function)
+    queue.append((tree, tree, set()))
+
+    while queue:
+        parent_node, function, local_names = queue.popleft()
+        if isinstance(parent_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = parent_node
+            scope = get_scope(parent_node)
+            #The cells can be assigned by the nested functions
+            local_names = scope.get_locals() - scope.cells
+        elif isinstance(parent_node, ast.ClassDef):
+            local_names = set()
+        for owner, block in get_blocks(parent_node):
+            if unswitch_block(block, function, local_names, sizes, module_names, types):
+                invalidate(owner)
+            for statement in block:
+                queue.append((statement, function, local_names))
+
+    clear_summaries()
+    clear_scopes()
+    return tree
+
+
+'''
+Copy propagation: the loads of x after a copy x = y (an assignment of a bare
+name, like the ones hoist_invariants() leaves with its __o_tmp_ temporaries)
+read y instead, as long as y still holds the same value, which the SSA form of
+the function tells (see ssa.py and get_copies()). The copies themselves are
+left for remove_useless() to delete once they are dead, e.g. with
+--passes copy,remove. Only the functions are looked at, the module code has no
+SSA form
+'''
+def propagate_copies(tree: ast.AST) -> ast.AST:
+    from propagate_copies_helpers import propagate_function_copies
+    from specialize_types_helpers import get_functions
+    from def_use import clear_summaries
+    clear_summaries()
+    for function in get_functions(tree):
+        propagate_function_copies(function)
+    clear_summaries()
+    return tree
+
+
+'''
+Rewrites the loops over range(len(xs)) whose index reads the items of xs into
+loops over xs, zip(xs, ys...) for the sequences known to have the same length,
+or enumerate() when the index is used otherwise. The type inference (see
+type_inference.py) must prove xs is a list, a tuple, a str or bytes, and the
+loop must not change the sequences (see check_if_not_mutated())
+'''
+def rewrite_index_loops(tree: ast.AST) -> ast.AST:
+    from rewrite_index_loops_helpers import get_function_loops, get_escaped_names, rewrite_index_loop
+    from specialize_types_helpers import get_functions
+    from type_inference import infer_types, get_module_names
+    from def_use import clear_summaries
+    from scopes import get_scope, clear_scopes
+    clear_summaries()
+    clear_scopes()
+    module_names = get_module_names(tree)
+    for function in get_functions(tree):
+        types = infer_types(function, module_names)
+        scope = get_scope(function)
+        local_names = scope.get_locals() - scope.cells
+        local_names = local_names - get_escaped_names(function, local_names, types)
+        for loop, block, position in get_function_loops(function):
+            rewrite_index_loop(loop, block, position, local_names, types)
+    clear_summaries()
+    clear_scopes()
+    return tree
+
+
 '''
-def optimize(tree: ast.AST) -> ast.AST:
+Rewrites the loops that build a string with s += piece (or s = s + piece) into
+loops appending the pieces to a list, joined into s after the loop, so building
+the string is linear instead of quadratic. The type inference (see
+type_inference.py) must prove s is a str when the loop starts and every piece
+is a str, and the loop must read s nowhere else
+'''
+def rewrite_string_accumulation(tree: ast.AST) -> ast.AST:
+    from rewrite_string_accumulation_helpers import LOOP_TYPES, rewrite_loop_accumulations
+    from rewrite_index_loops_helpers import get_function_loops
+    from specialize_types_helpers import get_functions
+    from type_inference import infer_types, get_module_names
+    from def_use import clear_summaries
+    from scopes import get_scope, clear_scopes
+    clear_summaries()
+    clear_scopes()
+    module_names = get_module_names(tree)
+    for function in get_functions(tree):
+        types = infer_types(function, module_names)
+        scope = get_scope(function)
+        local_names = scope.get_locals() - scope.cells
+        for loop, block, position in get_function_loops(function, LOOP_TYPES):
+            rewrite_loop_accumulations(loop, block, local_names, types)
+    clear_summaries()
+    clear_scopes()
+    return tree
+
+
+'''
+The passes that can be selected by name. Every pass takes the tree and returns
+the optimized tree. remove_useless() also gets the seed of dependent variables.
+The passes that are not in DEFAULT_PASSES only run when selected (see --passes)
+'''
+PASSES = {
+    "remove": remove_useless,
+    "hoist": hoist_invariants,
+    "specialize": specialize_types,
+    "unswitch": unswitch_loops,
+    "copy": propagate_copies,
+    "iterate": rewrite_index_loops,
+    "join": rewrite_string_accumulation,
+}
+
+DEFAULT_PASSES = ("remove", "hoist")
+
+'''
+Runs each of the given passes once, in order
+'''
+def run_passes(tree: ast.AST, passes=DEFAULT_PASSES, dependent_variables=None) -> ast.AST:
+    for name in passes:
+        if name not in PASSES:
+            raise ValueError(f"unknown pass {name!r}")
+        if name == "remove":
+            tree = remove_useless(tree, dependent_variables)
+        else:
+            tree = PASSES[name](tree)
+    return tree
+
+
+'''
+This function runs the remove_useless() and hoist_invariants() (or the given
+passes) continuously until there are no changes made to the AST. With
+fixed_point=False the passes only run once
+'''
+def optimize(tree: ast.AST, dependent_variables=None, passes=DEFAULT_PASSES, fixed_point=True) -> ast.AST:
     # Implement this optimization here
+    if not fixed_point:
+        return run_passes(tree, passes, dependent_variables)
+
+    #The trees are compared by fingerprint, without copying or unparsing them,
+    #which would recurse
+    from ast_helpers import fingerprint
+
     change = True
+    tree_fingerprint = fingerprint(tree)
     while change:
-        original_tree = copy.deepcopy(tree)
+        original_fingerprint = tree_fingerprint
 
-        tree = remove_useless(tree)
-        tree = hoist_invariants(tree)
+        tree = run_passes(tree, passes, dependent_variables)
 
-        try:
-            assert ast.unparse(original_tree) == ast.unparse(tree)
-        except AssertionError:
+        tree_fingerprint = fingerprint(tree)
+        if tree_fingerprint != original_fingerprint:
             print("Tree still changing")
             change = True
         else:
@@ -120,31 +333,40 @@ def optimize(tree: ast.AST) -> ast.AST:
     return tree
 
 
-if __name__ == "__main__":
-    import argparse
-    from pathlib import Path
-    ap = argparse.ArgumentParser()
-    ap.add_argument("script", type=Path, help="the script to transform")
-    g = ap.add_mutually_exclusive_group(required=False)
-    g.add_argument("--dont", action="store_true", help="don't optimize")
-    g.add_argument("--hoist", action="store_true", help="hoist invariants")
-    g.add_argument("--remove", action="store_true", help="remove useless")
-    args = ap.parse_args()
-
-    with open(args.script, "r") as f:
-        t = ast.parse(f.read())
-        
-    if not args.dont:
-        if args.hoist:
-            t = hoist_invariants(t)
-        elif args.remove:
-            t = remove_useless(t)
-        else:
-            t = optimize(t)
+#The version of the optimizer, computed on the first call
+optimizer_version = None
 
-    split_string = str.split(".",str(args.script))
-    new_filename = split_string[0] + "_optimized.py"
-    
-    with open(new_filename, 'w') as sys.stdout:
-        print(ast.unparse(t))
 
+'''
+Returns the version of the optimizer: OPTIMIZER_VERSION and the hash of the
+modules next to ouroboros.py (the tests left out), which any change of the
+output of the passes goes through. The caches of optimized code are keyed by it
+(see import_hook.py and incremental.py)
+'''
+def get_optimizer_version():
+    global optimizer_version
+    if optimizer_version is None:
+        import glob
+        import hashlib
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+            if os.path.basename(path).startswith("test_"):
+                continue
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        optimizer_version = f"{OPTIMIZER_VERSION}-{digest.hexdigest()[:16]}"
+    return optimizer_version
+
+
+'''
+Returns the name of the file the optimized version of script is written to
+'''
+def get_optimized_path(script):
+    root, extension = os.path.splitext(str(script))
+    return root + "_optimized.py"
+
+
+if __name__ == "__main__":
+    from cli import main
+    main()
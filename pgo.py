@@ -0,0 +1,187 @@
+'''
+Profile-guided optimization. Only the functions where the program spends its
+time are optimized, the cold ones are left exactly as they are.
+
+python3 ouroboros.py --profile <profile> <py file>
+
+The profile is either a file saved by cProfile (python3 -m cProfile -o <profile>)
+or a line-hit histogram, a text file with one line per source line
+
+    <file>:<line number> <hits>
+
+The time (or the hits) of every function, including the functions nested in it,
+is added to the top-level function or method that contains it. The hottest
+functions that together account for PGO_HOT_FRACTION of the profile are
+optimized, and the report lists them with their hottest loops and whether the
+passes changed them.
+'''
+
+import ast
+import os
+
+from constant import PGO_HOT_FRACTION
+from ouroboros import optimize, DEFAULT_PASSES
+
+
+class Profile:
+    def __init__(self, entries):
+        #(file name, line number, weight)
+        self.entries = entries
+
+    '''
+    Returns the profile of the given source file only. The file names of the
+    profile are compared as absolute paths, then by their base name
+    '''
+    def for_file(self, path):
+        if path is None:
+            return self
+        absolute_path = os.path.abspath(path)
+        entries = [entry for entry in self.entries if os.path.abspath(entry[0]) == absolute_path]
+        if not entries:
+            basename = os.path.basename(path)
+            entries = [entry for entry in self.entries if os.path.basename(entry[0]) == basename]
+        return Profile(entries)
+
+
+def load_pstats(path):
+    import pstats
+    stats = pstats.Stats(path).stats
+    entries = []
+    for (filename, lineno, name), (primitive_calls, calls, total_time, cumulative_time, callers) in stats.items():
+        entries.append((filename, lineno, total_time))
+    return Profile(entries)
+
+
+def load_line_histogram(path):
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            location, hits = line.rsplit(None, 1)
+            filename, lineno = location.rsplit(":", 1)
+            entries.append((filename, int(lineno), float(hits)))
+    return Profile(entries)
+
+
+'''
+Loads a cProfile file, or a line-hit histogram if the file isn't one
+'''
+def load_profile(path):
+    try:
+        return load_pstats(path)
+    except Exception:
+        return load_line_histogram(path)
+
+
+def get_start(node):
+    if node.decorator_list:
+        return min(node.lineno, node.decorator_list[0].lineno)
+    return node.lineno
+
+
+'''
+Returns the top-level functions and the methods of the tree, as a list of
+(function, statement list containing it)
+'''
+def get_functions(tree):
+    functions = []
+    stack = [tree.body]
+    while stack:
+        statements = stack.pop()
+        for statement in statements:
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append((statement, statements))
+            elif isinstance(statement, ast.ClassDef):
+                stack.append(statement.body)
+    functions.sort(key=lambda function: function[0].lineno)
+    return functions
+
+
+'''
+Returns the weight of every function of the list, in the same order
+'''
+def get_heat(functions, profile):
+    heat = [0.0] * len(functions)
+    for filename, lineno, weight in profile.entries:
+        for position, (function, statements) in enumerate(functions):
+            if get_start(function) <= lineno <= function.end_lineno:
+                heat[position] = heat[position] + weight
+                break
+    return heat
+
+
+'''
+Returns the loops of the function with their weight, hottest first
+'''
+def get_hot_loops(function, profile):
+    loops = []
+    for node in ast.walk(function):
+        if isinstance(node, (ast.For, ast.While, ast.AsyncFor)):
+            weight = sum(entry[2] for entry in profile.entries if node.lineno <= entry[1] <= node.end_lineno)
+            if weight:
+                loops.append((node.lineno, weight))
+    loops.sort(key=lambda loop: -loop[1])
+    return loops
+
+
+'''
+Returns the names whose assignments in the function are visible outside of it,
+which remove_useless() must keep: its global and nonlocal declarations
+'''
+def get_outer_names(function):
+    names = set()
+    for node in ast.walk(function):
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+    return names
+
+
+'''
+Optimizes the hot functions of the tree in place and returns the report: a list
+of dictionaries with the name, line, share of the profile, hottest loops and
+whether the function was hot and transformed
+'''
+def optimize_with_profile(tree, profile, passes=DEFAULT_PASSES, fixed_point=True, hot_fraction=PGO_HOT_FRACTION):
+    functions = get_functions(tree)
+    heat = get_heat(functions, profile)
+    total = sum(heat)
+
+    report = []
+    covered = 0.0
+    for position in sorted(range(len(functions)), key=lambda position: -heat[position]):
+        function, statements = functions[position]
+        share = heat[position] / total if total else 0.0
+        hot = heat[position] > 0 and covered < hot_fraction * total
+        entry = {"name": function.name, "lineno": function.lineno, "share": share, "hot": hot,
+                 "transformed": False, "loops": []}
+        report.append(entry)
+        if not hot:
+            continue
+        covered = covered + heat[position]
+
+        before = ast.dump(function)
+        unit = ast.Module(body=[function], type_ignores=[])
+        unit = optimize(unit, sorted(get_outer_names(function)), passes, fixed_point)
+        index = next(index for index, statement in enumerate(statements) if statement is function)
+        statements[index:index + 1] = unit.body
+        entry["transformed"] = [ast.dump(statement) for statement in unit.body] != [before]
+        entry["loops"] = get_hot_loops(unit.body[0], profile) if unit.body else []
+    return report
+
+
+def format_report(report):
+    lines = []
+    cold = 0
+    for entry in report:
+        if not entry["hot"]:
+            cold = cold + 1
+            continue
+        status = "transformed" if entry["transformed"] else "unchanged"
+        line = f"{entry['name']} (line {entry['lineno']}): {entry['share'] * 100:.1f}% of the profile, {status}"
+        if entry["loops"]:
+            line = line + ", hottest loop at line " + str(entry["loops"][0][0])
+        lines.append(line)
+    lines.append(f"{cold} cold functions left as is")
+    return "\n".join(lines)
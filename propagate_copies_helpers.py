@@ -0,0 +1,91 @@
+'''
+All the helper functions needed by propagate_copies()
+'''
+
+import ast
+
+from ssa import build_ssa, get_assigned_value, UNDEFINED
+from hoist_invariants_helpers import COMPREHENSION_TYPES
+
+'''
+Returns the names that can't be the source of a copy in the function: the
+names deleted by del (a use after the del would see them unbound) and the
+names bound by its comprehensions (a use in the comprehension would read the
+comprehension variable instead)
+'''
+def get_unsafe_sources(function):
+    names = set()
+    stack = list(function.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Lambda):
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            stack.extend(node.decorator_list)
+            continue
+        if isinstance(node, ast.Delete):
+            names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+        elif isinstance(node, COMPREHENSION_TYPES):
+            for generator in node.generators:
+                names.update(child_node.id for child_node in ast.walk(generator.target)
+                             if isinstance(child_node, ast.Name))
+        stack.extend(ast.iter_child_nodes(node))
+    return names
+
+'''
+Returns {definition index: index of the definition it copies} for the copies
+x = y of the function that can be propagated. y must be a local with a single
+definition: the copy is reached by it, and every use of the copy is reached by
+the copy without going around a loop again (there would be a phi of x), so y
+still holds the same value there. The names with escaping definitions (see
+ssa.py) are left alone
+'''
+def get_copies(ssa, unsafe_sources):
+    definition_counts = {}
+    #The names with an escaping definition: it can reach loads that the SSA
+    #form maps to another definition, e.g. in the except handlers
+    escaping_names = set()
+    for definition in ssa.definitions:
+        if not definition.is_phi():
+            definition_counts[definition.name] = definition_counts.get(definition.name, 0) + 1
+        if definition.escaping:
+            escaping_names.add(definition.name)
+
+    copies = {}
+    for index, definition in enumerate(ssa.definitions):
+        value = get_assigned_value(definition)
+        if not isinstance(value, ast.Name) or definition.name in escaping_names:
+            continue
+        source = ssa.reaching.get(id(value), UNDEFINED)
+        if source == UNDEFINED or ssa.definitions[source].is_phi() or ssa.definitions[source].escaping:
+            continue
+        if definition_counts[value.id] != 1 or value.id in unsafe_sources:
+            continue
+        copies[index] = source
+    return copies
+
+'''
+Returns the definition the copy reads in the end, through the chains of copies
+x = y, z = x...
+'''
+def get_root_source(copies, index):
+    while index in copies:
+        index = copies[index]
+    return index
+
+'''
+Replaces the loads of the copies of the function by their sources. The Name
+nodes are renamed in place. Returns the number of loads replaced
+'''
+def propagate_function_copies(function):
+    ssa = build_ssa(function)
+    copies = get_copies(ssa, get_unsafe_sources(function))
+    replaced = 0
+    for index in copies:
+        source_name = ssa.definitions[get_root_source(copies, index)].name
+        for use in ssa.definitions[index].uses:
+            #The target of x += 1 is a use of x too, it stays a store to x
+            if isinstance(use.ctx, ast.Load):
+                use.id = source_name
+                replaced = replaced + 1
+    return replaced
@@ -2,8 +2,12 @@
 All the helper functions needed by the remove_useless()
 '''
 
+from collections import deque
+
 from transformer import *
 from ast_helpers import *
+from def_use import get_summary, invalidate
+from scopes import get_scope
 
 '''
 Function to update the dependent_variable list. This keeps track of
@@ -18,38 +22,51 @@ Function returns True if node has a dependent variable within
 it
 '''
 def check_if_variables_are_dependent(node, dependent_variables):
-    node_generator = ast.walk(node)
-    for child_node in node_generator:
-        if(isinstance(child_node,ast.Name)):
-            if child_node.id in dependent_variables:
-                return True
-            
-    return False
+    return not get_summary(node).names.isdisjoint(dependent_variables)
 
 
 '''
 Get all the dependent variables. Used in the handling of
-ast.Assign object
+ast.Assign object. The nodes are visited in the order of a recursive walk,
+with an explicit stack so long expression chains don't hit the recursion limit
 '''
 def get_dependent_variables(dependent_variables, node):
-    if (isinstance(node,ast.Name)):
-        add_value_to_dependent_variable(dependent_variables, node.id)
-
-    elif (isinstance(node,ast.BinOp)):
-        get_dependent_variables(dependent_variables,node.left)
-        get_dependent_variables(dependent_variables,node.right)
-
-    elif (isinstance(node,ast.NamedExpr)):
-        get_dependent_variables(dependent_variables,node.value)
-        if check_if_variables_are_dependent(node.value, dependent_variables):
-            get_dependent_variables(dependent_variables,node.target)
-
-    elif (isinstance(node, ast.Call)):
-        check_pure_function = check_if_function_pure(node.func.id)
-        if not check_pure_function:
-            add_value_to_dependent_variable(dependent_variables, node.func.id)
-            for argument in node.args:
-                get_dependent_variables(dependent_variables, argument)
+    #(node, True) adds the target of the NamedExpr node once its value is done
+    stack = [(node, False)]
+    while stack:
+        node, named_expr_target = stack.pop()
+        #A bare return has no value
+        if node is None:
+            continue
+        if named_expr_target:
+            if check_if_variables_are_dependent(node.value, dependent_variables):
+                stack.append((node.target, False))
+
+        elif (isinstance(node,ast.Name)):
+            add_value_to_dependent_variable(dependent_variables, node.id)
+
+        elif (isinstance(node,ast.BinOp)):
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+
+        elif (isinstance(node,ast.NamedExpr)):
+            stack.append((node, True))
+            stack.append((node.value, False))
+
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            check_pure_function = check_if_function_pure(node.func.id)
+            if not check_pure_function:
+                add_value_to_dependent_variable(dependent_variables, node.func.id)
+            #The result is used, so are the arguments, pure function or not
+            for keyword in node.keywords:
+                get_all_names(dependent_variables, keyword.value)
+            for argument in reversed(node.args):
+                stack.append((argument, False))
+
+        else:
+            #Comprehensions, attributes, subscripts... all their names are
+            #dependent
+            get_all_names(dependent_variables, node)
 
     return
 
@@ -57,21 +74,24 @@ def get_dependent_variables(dependent_variables, node):
 Check if the node has a NamedExpr in it
 '''
 def check_if_subtree_has_named_expr(node):
-    node_generator = ast.walk(node)
-    for child_node in node_generator:
-        if (isinstance(child_node,ast.NamedExpr)):
-            return True
-    
-    return False
+    return get_summary(node).has_walrus
+
+'''
+Check if the node awaits. The awaited value is kept even when its result is
+not used, so all its variables are dependent
+'''
+def check_if_subtree_has_await(node):
+    return get_summary(node).has_await
 
 
 '''
-Get all the global variables in the module
+Get all the global variables in the module: every name bound at its top level
+(by any assignment target, import, def or class) or declared global in a
+function and bound there
 '''
 def get_global_variables(tree, global_variables):
-    for block in reversed(tree.body):
-        if (isinstance(block, ast.Assign)):
-            global_variables.append(block.targets[0].id) 
+    for name in sorted(get_scope(tree).get_exported_names()):
+        add_value_to_dependent_variable(global_variables, name)
 
 '''
 Check if the function is pure or not
@@ -83,87 +103,221 @@ def check_if_function_pure(function_name):
     else:
         return False
 
+'''
+The handlers of the compound nodes below don't recurse, they append the work
+left to do on their children to tasks, in order (see remove_useless_in_block())
+'''
+
 '''
 Function to handle the case for ast.Call object
 '''    
-def remove_useless_function_call(tree, dependant_variables):
+def remove_useless_function_call(tree, dependant_variables, tasks):
     #need to add args only function is impure. Check if function
     #is pure or not
-    check_pure_function = check_if_function_pure(tree.func.id)
-    if not check_pure_function:
-        add_value_to_dependent_variable(dependant_variables, tree.func.id)
+    function_name = get_function_name(tree)
+    if not check_if_call_pure(tree):
+        #A method can change its object, so the object is kept
+        if function_name:
+            add_value_to_dependent_variable(dependant_variables, function_name)
+        get_all_names(dependant_variables, tree.func)
+        #The arguments are kept whole: every name they read is dependant, and
+        #their sub-expressions are not swept
+        for keyword in tree.keywords:
+            get_all_names(dependant_variables, keyword.value)
         for argument in tree.args:
-            remove_useless_in_block(argument, dependant_variables)
+            get_all_names(dependant_variables, argument)
 
 
 '''
-Function to handle the case for ast.FuncDef object
+Function to handle the case for ast.FuncDef object. The names the function
+shares with other scopes (the cells of its closures, its global and nonlocal
+names) are used outside of its body, so they are dependant
 '''
-def remove_useless_function_definition(tree, dependant_variables):
-    for argument in tree.args.args:
-        add_value_to_dependent_variable(dependant_variables,argument.arg)
+def remove_useless_function_definition(tree, dependant_variables, tasks):
+    scope = get_scope(tree)
+    for name in sorted(scope.parameters | scope.get_exported_names()):
+        add_value_to_dependent_variable(dependant_variables, name)
 
     for statement in reversed(tree.body):
-        remove_useless_in_block(statement, dependant_variables)
+        tasks.append((MARK_BLOCK, statement))
 
 '''
-Function to handle the case for ast.For object
+Function to handle the case for ast.ClassDef object. The names bound in the
+class body are its attributes and can be used from anywhere, so they are all
+dependant. The methods are then cleaned like any other function
 '''
-def remove_useless_for(tree, dependant_variables):
+def remove_useless_class_definition(tree, dependant_variables, tasks):
+    for name in sorted(get_scope(tree).get_exported_names()):
+        add_value_to_dependent_variable(dependant_variables, name)
+
+    for statement in reversed(tree.body):
+        tasks.append((MARK_BLOCK, statement))
+
+'''
+Function to handle the case for ast.For object. The else clause runs after
+the loop, so it is marked first. An async for awaits its iterator at every
+iteration, so it is always kept with its iterator
+'''
+def remove_useless_for(tree, dependant_variables, tasks):
+    if isinstance(tree, ast.AsyncFor):
+        get_all_names(dependant_variables, tree.iter)
+
+    for block in reversed(tree.orelse):
+        tasks.append((MARK_BLOCK, block))
 
     for block in tree.body:
-        remove_useless_in_block(block, dependant_variables)
+        tasks.append((MARK_BLOCK, block))
  
 '''
 Function to handle the case for ast.While object
 '''
-def remove_useless_while(tree, dependant_variables):
+def remove_useless_while(tree, dependant_variables, tasks):
+    marked_before = len(dependant_variables)
+
+    for block in reversed(tree.orelse):
+        tasks.append((MARK_BLOCK, block))
+
     #get the operators in the while loop and add to dependant
-    remove_useless_in_block(tree.test, dependant_variables)
+    tasks.append((MARK_BLOCK, tree.test))
 
     #Then iterate over all the statements in both directions
     for block in tree.body:
-        remove_useless_in_block(block, dependant_variables)
+        tasks.append((MARK_BLOCK, block))
 
+    #Marking is monotonic, so the second direction only finds something
+    #new if the first one marked new variables
+    tasks.append((MARK_WHILE_REVERSED, tree, marked_before))
+
+def remove_useless_while_reversed(tree, dependant_variables, tasks, marked_before):
+    if len(dependant_variables) == marked_before:
+        return
     for block in reversed(tree.body):
-         remove_useless_in_block(block, dependant_variables)
+        tasks.append((MARK_BLOCK, block))
 
 '''
-Function to handle the case for ast.If object
+Function to handle the case for ast.If object. state[0] tells if the test
+variables are dependant
 '''
-def remove_useless_if(tree, dependant_variables):
-    test_variables_dependant = False
+def remove_useless_if(tree, dependant_variables, tasks):
+    state = [False]
     for block in reversed(tree.body):
-        remove_useless_in_block(block, dependant_variables)
-        if test_variables_dependant == False:
-            test_variables_dependant = check_if_variables_are_dependent(block, dependant_variables)
+        tasks.append((MARK_BLOCK, block))
+        tasks.append((CHECK_IF_DEPENDENT, block, state))
 
     for block in reversed(tree.orelse):
-        remove_useless_in_block(block, dependant_variables)
-        if test_variables_dependant == False:
-            test_variables_dependant = check_if_variables_are_dependent(block, dependant_variables)
+        tasks.append((MARK_BLOCK, block))
+        tasks.append((CHECK_IF_DEPENDENT, block, state))
+
+    tasks.append((MARK_IF_TEST, tree, state))
 
-    if test_variables_dependant:
+def remove_useless_if_test(tree, dependant_variables, tasks, state):
+    if state[0]:
         #need to add the test variables to dependant_variables list
-        remove_useless_in_block(tree.test,dependant_variables)
+        tasks.append((MARK_BLOCK, tree.test))
+
+'''
+Function to handle the case for ast.Try object. The blocks are marked from the
+last one to run to the first one: the finally block, the else clause, the
+except handlers and then the body, which can jump to any of them
+'''
+def remove_useless_try(tree, dependant_variables, tasks):
+    for block in reversed(tree.finalbody):
+        tasks.append((MARK_BLOCK, block))
+
+    for block in reversed(tree.orelse):
+        tasks.append((MARK_BLOCK, block))
+
+    for handler in tree.handlers:
+        if handler.type is not None:
+            get_all_names(dependant_variables, handler.type)
+        for block in reversed(handler.body):
+            tasks.append((MARK_BLOCK, block))
+
+    for block in reversed(tree.body):
+        tasks.append((MARK_BLOCK, block))
+
+'''
+Function to handle the case for ast.With object. Entering and exiting the
+context managers can do anything, so their expressions are always kept
+'''
+def remove_useless_with(tree, dependant_variables, tasks):
+    for item in tree.items:
+        get_all_names(dependant_variables, item.context_expr)
+        if item.optional_vars is not None:
+            get_all_names(dependant_variables, item.optional_vars)
+
+    for block in reversed(tree.body):
+        tasks.append((MARK_BLOCK, block))
+
+'''
+Function to handle the case for ast.Match object. The subject, the patterns
+and the guards decide which case runs, so their names are dependant
+'''
+def remove_useless_match(tree, dependant_variables, tasks):
+    get_all_names(dependant_variables, tree.subject)
+    for case in tree.cases:
+        get_all_names(dependant_variables, case.pattern)
+        if case.guard is not None:
+            get_all_names(dependant_variables, case.guard)
+        for block in reversed(case.body):
+            tasks.append((MARK_BLOCK, block))
+
+'''
+Adds every name used in the node (and bound by its patterns) to the dependant
+variables
+'''
+def get_all_names(dependant_variables, node):
+    for child_node in ast.walk(node):
+        if isinstance(child_node, ast.Name):
+            add_value_to_dependent_variable(dependant_variables, child_node.id)
+        elif isinstance(child_node, (ast.MatchAs, ast.MatchStar)) and child_node.name:
+            add_value_to_dependent_variable(dependant_variables, child_node.name)
+        elif isinstance(child_node, ast.MatchMapping) and child_node.rest:
+            add_value_to_dependent_variable(dependant_variables, child_node.rest)
+
+'''
+Marks the target of a kept assignment: the names it assigns, and the names it
+reads, the objects and the indices of the attributes and items it stores into
+'''
+def add_target_to_dependent_variables(dependant_variables, target):
+    for node in ast.walk(target):
+        if isinstance(node, ast.Name):
+            add_value_to_dependent_variable(dependant_variables, node.id)
+
+'''
+Marks the names read by the target of a live assignment (see
+check_if_target_live()): the objects and the indices of the attributes and
+items it stores into
+'''
+def add_target_reads_to_dependent_variables(dependant_variables, target):
+    for node in ast.walk(target):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            add_value_to_dependent_variable(dependant_variables, node.id)
+
 '''
 Function to handle the case of ast.Assign object
 '''
 def remove_useless_assign(tree, dependant_variables):
-    if check_if_subtree_has_named_expr(tree) and check_if_variables_are_dependent(tree, dependant_variables):
-        for target in tree.targets:
-            add_value_to_dependent_variable(dependant_variables, get_target_name_for_assignment(target))
+    if check_if_subtree_has_await(tree):
+        get_all_names(dependant_variables, tree.value)
 
-    elif isinstance(tree.value, ast.Call):
-        function_name = tree.value.func.value.id
-        if not check_if_function_pure(function_name):
-            add_value_to_dependent_variable(dependant_variables, tree.targets[0].id)
+    elif check_if_subtree_has_named_expr(tree) and check_if_variables_are_dependent(tree, dependant_variables):
+        for target in tree.targets:
+            add_target_to_dependent_variables(dependant_variables, target)
 
     else:
+        #The result of an impure call is kept, with what the call reads
+        if isinstance(tree.value, ast.Call) and not check_if_call_pure(tree.value):
+            for target in tree.targets:
+                add_target_to_dependent_variables(dependant_variables, target)
+
+        live = False
         for target in tree.targets:
-            target_id = get_target_name_for_assignment(target)
-            if target_id in dependant_variables:
-                get_dependent_variables(dependant_variables,tree.value)
+            if check_if_target_live(target, dependant_variables):
+                add_target_reads_to_dependent_variables(dependant_variables, target)
+                live = True
+        if live:
+            get_dependent_variables(dependant_variables,tree.value)
 
 '''
 Recursively calls all the statements within the compare statement
@@ -176,43 +330,69 @@ def remove_useless_compare(tree, dependant_variables):
 
 
 '''
-The function that recursively optimizes code block by block. This is where the
-mark and sweep function is implemented. The recursive call marks all the dependent
-variables and the NodeTransformer does the sweep of all the not marked nodes
+Kinds of tasks of remove_useless_in_block()
 '''
-def remove_useless_in_block(tree, dependent_variables):
+MARK_BLOCK = 0
+SWEEP_BLOCK = 1
+CHECK_IF_DEPENDENT = 2
+MARK_IF_TEST = 3
+MARK_WHILE_REVERSED = 4
+
+'''
+Marks the dependent variables of a single block. The work left to do on its
+children is appended to tasks
+'''
+def mark_block(tree, dependent_variables, tasks):
     if (isinstance(tree, ast.Expr)):
-        remove_useless_in_block(tree.value, dependent_variables)
+        tasks.append((MARK_BLOCK, tree.value))
 
     elif (isinstance(tree,ast.Call)):
-        remove_useless_function_call(tree, dependent_variables)
+        remove_useless_function_call(tree, dependent_variables, tasks)
+
+    elif (isinstance(tree,(ast.FunctionDef, ast.AsyncFunctionDef))):
+        remove_useless_function_definition(tree, dependent_variables, tasks)
 
-    elif (isinstance(tree,ast.FunctionDef)):
-        remove_useless_function_definition(tree, dependent_variables)
+    elif (isinstance(tree,ast.ClassDef)):
+        remove_useless_class_definition(tree, dependent_variables, tasks)
 
-    elif(isinstance(tree,ast.For)):
-        remove_useless_for(tree, dependent_variables)
+    elif(isinstance(tree,(ast.For, ast.AsyncFor))):
+        remove_useless_for(tree, dependent_variables, tasks)
 
     elif(isinstance(tree,ast.While)):
-        remove_useless_while(tree, dependent_variables)
+        remove_useless_while(tree, dependent_variables, tasks)
 
     elif (isinstance(tree,ast.Return)):
         get_dependent_variables(dependent_variables, tree.value)
     
     elif (isinstance(tree,ast.If)):
-        remove_useless_if(tree, dependent_variables)
+        remove_useless_if(tree, dependent_variables, tasks)
 
     elif (isinstance(tree, ast.Assign)):
         remove_useless_assign(tree, dependent_variables)
+
+    elif isinstance(tree, (ast.Try, ast.TryStar)):
+        remove_useless_try(tree, dependent_variables, tasks)
+
+    elif isinstance(tree, (ast.With, ast.AsyncWith)):
+        remove_useless_with(tree, dependent_variables, tasks)
+
+    elif isinstance(tree, ast.Match):
+        remove_useless_match(tree, dependent_variables, tasks)
                     
     elif isinstance(tree,ast.NamedExpr):
         if tree.target.id in dependent_variables:
             get_dependent_variables(dependent_variables,tree.value)
 
     elif isinstance(tree,ast.AugAssign):
-        if tree.target.id in dependent_variables:
+        if check_if_subtree_has_await(tree):
+            get_all_names(dependent_variables, tree.value)
+        elif check_if_target_live(tree.target, dependent_variables):
+            add_target_reads_to_dependent_variables(dependent_variables, tree.target)
             get_dependent_variables(dependent_variables,tree.value)
 
+    elif isinstance(tree, ast.Await):
+        get_all_names(dependent_variables, tree.value)
+
     elif isinstance(tree,ast.Constant):
         pass
 
@@ -224,29 +404,56 @@ def remove_useless_in_block(tree, dependent_variables):
 
     elif isinstance(tree,ast.Module):
         for block in reversed(tree.body):
-            remove_useless_in_block(block,dependent_variables)
+            tasks.append((MARK_BLOCK, block))
 
     elif isinstance(tree, ast.ListComp):
-        remove_useless_in_block(tree.elt, dependent_variables)
+        tasks.append((MARK_BLOCK, tree.elt))
 
     else:
         pass
-    
-    transformer = Transformer(dependent_variables, TRANSFORMER_DEPENDENT_VARIABLES)
-    transformer.visit(tree)
 
 
 '''
-returns the target name of the node.
-'''
-def get_target_name_for_assignment(node):
-    if isinstance(node, ast.Name):
-        return node.id
-    elif isinstance(node, ast.Subscript):
-        return node.value.id
-    else:
-        return ""
+The function that optimizes code block by block. This is where the mark and
+sweep function is implemented. Every block is marked, then its children are
+handled the same way, then the NodeTransformer does the sweep of all the not
+marked nodes of the block.
 
+This is done with an explicit stack of tasks instead of recursion, so deeply
+nested code doesn't hit the recursion limit. The tasks run in the same order
+as the calls of the recursive version
+'''
+def remove_useless_in_block(tree, dependent_variables):
+    stack = [(MARK_BLOCK, tree)]
+    while stack:
+        task = stack.pop()
+        kind = task[0]
+        tasks = []
+        if kind == MARK_BLOCK:
+            mark_block(task[1], dependent_variables, tasks)
+            tasks.append((SWEEP_BLOCK, task[1]))
+
+        elif kind == SWEEP_BLOCK:
+            #The statements of the block were swept before it, with fewer
+            #dependent variables, so sweeping them again wouldn't remove more
+            transformer = Transformer(dependent_variables, TRANSFORMER_DEPENDENT_VARIABLES, nested_statements=False)
+            transformer.visit(task[1])
+            for node in transformer.changed_nodes:
+                invalidate(node)
+
+        elif kind == CHECK_IF_DEPENDENT:
+            block, state = task[1], task[2]
+            if state[0] == False:
+                state[0] = check_if_variables_are_dependent(block, dependent_variables)
+
+        elif kind == MARK_IF_TEST:
+            remove_useless_if_test(task[1], dependent_variables, tasks, task[2])
+
+        elif kind == MARK_WHILE_REVERSED:
+            remove_useless_while_reversed(task[1], dependent_variables, tasks, task[2])
+
+        #The first task must run first
+        stack.extend(reversed(tasks))
 
 '''
 Returns a unaryOp node object
@@ -260,9 +467,15 @@ def get_unary_op_node():
         if isinstance(every_node, ast.UnaryOp):
             return every_node
 
+#The nodes whose body can't be empty. The body of a try and the bodies of its
+#handlers are fixed together
+BODY_REQUIRED_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.With, ast.AsyncWith,
+                       ast.While, ast.AsyncFor, ast.ExceptHandler, ast.match_case)
+
 '''
 Checks for consistency in if-else node of AST. If there are no statements in the 
 else block, removes the 
+The tree is walked without recursion
 '''
 def check_new_ast_for_consistency(new_tree):
     pass_node = ast.Pass()
@@ -273,11 +486,11 @@ def check_new_ast_for_consistency(new_tree):
     #and hence, we need to add pass statement to this function definition
     generator = ast.walk(new_tree)
     for node in generator:
-        if isinstance(node,ast.FunctionDef):
+        if isinstance(node, BODY_REQUIRED_TYPES):
             if len(node.body) == 0:
                 node.body.append(pass_node)
 
-        if isinstance(node,ast.Try):
+        if isinstance(node, (ast.Try, ast.TryStar)):
             if len(node.body) == 0:
                 node.body.append(pass_node)
                 #Since we append for body of try and we see that there are no
@@ -288,12 +501,13 @@ def check_new_ast_for_consistency(new_tree):
                         handler.body.pop(0)
                     handler.body.append(pass_node)
 
+            #A try needs a handler or a finally block
+            if len(node.handlers) == 0 and len(node.finalbody) == 0:
+                node.finalbody.append(pass_node)
+
         elif isinstance(node,ast.If):
-            for every_node in node.body:
-                check_new_ast_for_consistency(every_node)
-            
-            for every_node in node.orelse:
-                check_new_ast_for_consistency(every_node)
+            #The nested statements are visited by the walk too, and none of
+            #these fixes can empty the body of the enclosing if
 
             #If the body is empty, we replace the test condition with
             #not test condition and add all statements from orelse list
@@ -301,6 +515,7 @@ def check_new_ast_for_consistency(new_tree):
             if len(node.body) == 0:
                 #Negating the condition
                 unary_op_node = get_unary_op_node()
+                ast.copy_location(unary_op_node, node.test)
                 unary_op_node.operand = node.test
                 node.test = unary_op_node
 
@@ -320,37 +535,29 @@ statements in the parent block
 def check_new_ast_for_pass(new_tree):
     t = Transformer([], TRANSFORMER_DO_NOTHING)
     t.visit(new_tree)
-    queue = []
+    queue = deque()
     queue.append(new_tree)        
 
     #We do a BFS on the AST and when we detect a pass, we delete all the
-    #subsequent nodes
+    #subsequent nodes of its block
     while queue:
-        parent_node = queue.pop(0)
-        if "body" in parent_node._fields: 
-            length_of_parent_node = len(parent_node.body)
-
+        parent_node = queue.popleft()
+        for owner, block in get_blocks(parent_node):
             pass_found_at = -1
             pass_found = False
-            delete_nodes = []
-
-            for iterator in range(length_of_parent_node):
-
-                if pass_found==False:
-                    if isinstance(parent_node.body[iterator],ast.Pass):
-                        pass_found = True
-                        pass_found_at = iterator
-                        break
-                    else:
-                        queue.append(parent_node.body[iterator])
-              
-        #We found pass at the pass_found. Need to remove all the statements that
-        #come after this. If not found, do nothing
+
+            for iterator in range(len(block)):
+                if isinstance(block[iterator],ast.Pass):
+                    pass_found = True
+                    pass_found_at = iterator
+                    break
+                else:
+                    queue.append(block[iterator])
+
+            #We found pass at the pass_found. Need to remove all the statements that
+            #come after this. If not found, do nothing
             if pass_found:
-                length_of_list = len(parent_node.body)
-                number_of_deletions = length_of_list - pass_found_at - 1
-                for i in range (0,number_of_deletions):
-                    del parent_node.body[pass_found_at+1]
+                del block[pass_found_at+1:]
     return
 
 '''
@@ -359,32 +566,23 @@ Checks for empty for statements in AST. If found, removes these from the AST
 def check_new_ast_empty_for(tree):
     t = Transformer([], TRANSFORMER_DO_NOTHING)
     t.visit(tree)
-    queue = []
+    queue = deque()
     queue.append(tree)        
     #We do a BFS on the AST and when we detect a for and if that for has body of 0,
-    #we delete the for
+    #we delete the for. Its else clause always runs then, it takes its place
     while queue:
-        parent_node = queue.pop(0)
-        if "body" in parent_node._fields:
+        parent_node = queue.popleft()
+        for owner, block in get_blocks(parent_node):
             #Add all children nodes of parent_node to list
-            for block in parent_node.body:
-                queue.append(block) 
-
-            length_of_parent_node = len(parent_node.body)
-
-            for_found_at = []
-            for_found = False
-            #Find all for statements that have 0 statements in the body
-            #We need to remove such for statements
-            for iterator in range(length_of_parent_node):
-                if isinstance(parent_node.body[iterator], ast.For):
-                    for_node = parent_node.body[iterator]
-                    if len(for_node.body) == 0:
-                        for_found_at.append(iterator)
-            
-            dynamic_adjust = 0
-            for for_position in for_found_at:
-                parent_node.body.pop(for_position - dynamic_adjust)
-                dynamic_adjust = dynamic_adjust + 1
+            for statement in block:
+                queue.append(statement)
+
+            new_block = []
+            for statement in block:
+                if isinstance(statement, ast.For) and len(statement.body) == 0:
+                    new_block.extend(statement.orelse)
+                else:
+                    new_block.append(statement)
+            block[:] = new_block
     return
   
@@ -0,0 +1,441 @@
+'''
+All the helper functions needed by rewrite_index_loops()
+'''
+
+import ast
+
+from ast_helpers import get_blocks
+from def_use import get_summary, invalidate
+from ssa import get_assigned_value, UNDEFINED
+
+#The sequences whose iteration gives the same items as the indexing
+SEQUENCE_TYPES = (list, tuple, str, bytes)
+
+#The builtins that don't change the sequence given to them
+NON_MUTATING_BUILTINS = ("all", "any", "enumerate", "id", "isinstance", "iter", "len", "list", "max", "min",
+                         "print", "repr", "reversed", "set", "sorted", "str", "sum", "tuple", "zip")
+
+#The types that a list can't be extended with
+NUMBER_TYPES = (bool, int, float, complex)
+
+#The values that are new objects, no other name refers to them yet
+FRESH_VALUE_TYPES = (ast.Constant, ast.JoinedStr, ast.List, ast.ListComp, ast.Dict, ast.DictComp, ast.Set,
+                     ast.SetComp, ast.GeneratorExp)
+
+#The nodes that read the objects of their children without keeping them
+NON_KEEPING_TYPES = (ast.Subscript, ast.Compare, ast.BinOp, ast.UnaryOp, ast.If, ast.While, ast.Assert, ast.For,
+                     ast.AsyncFor, ast.comprehension, ast.Expr)
+
+#The scopes nested in a function, their loops belong to them
+NESTED_SCOPE_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+'''
+Returns the For statements (or the loops of loop_types) of the function, with
+the block they are in and their position there, without the ones of the nested
+functions and classes. A loop comes before the loops nested in it
+'''
+def get_function_loops(function, loop_types=(ast.For,)):
+    loops = []
+    stack = [function]
+    while stack:
+        node = stack.pop()
+        for owner, block in get_blocks(node):
+            for position, statement in enumerate(block):
+                if isinstance(statement, loop_types):
+                    loops.append((statement, block, position))
+                if not isinstance(statement, NESTED_SCOPE_TYPES):
+                    stack.append(statement)
+    return loops
+
+'''
+Returns the name of xs for a loop over range(len(xs)) (or range(0, len(xs))),
+or None. range and len must be the builtins
+'''
+def get_indexed_sequence(loop, types):
+    if not isinstance(loop.target, ast.Name):
+        return None
+    iterable = loop.iter
+    if not isinstance(iterable, ast.Call) or not isinstance(iterable.func, ast.Name) or \
+            iterable.func.id != "range" or iterable.keywords or not types.is_builtin("range"):
+        return None
+    arguments = iterable.args
+    if len(arguments) == 2 and isinstance(arguments[0], ast.Constant) and type(arguments[0].value) is int \
+            and arguments[0].value == 0:
+        arguments = arguments[1:]
+    if len(arguments) != 1:
+        return None
+    length = arguments[0]
+    if not isinstance(length, ast.Call) or not isinstance(length.func, ast.Name) or length.func.id != "len" or \
+            length.keywords or len(length.args) != 1 or not types.is_builtin("len"):
+        return None
+    if not isinstance(length.args[0], ast.Name) or types.get_type(length.args[0]) not in SEQUENCE_TYPES:
+        return None
+    return length.args[0].id
+
+'''
+Returns the subscripts seq[i] of the loop body that load with the index i of
+the loop, as (parent node, field, position in the field list or None,
+subscript) and the number of the other references to i in the loop. There are
+no subscripts if i is assigned in the loop
+'''
+def get_index_uses(loop):
+    index = loop.target.id
+    subscripts = []
+    other_uses = 0
+    stack = [(child_node, loop, name, position)
+             for name, position, child_node in get_fields(loop, ("body", "orelse"))]
+    while stack:
+        node, parent_node, name, position = stack.pop()
+        #The nested functions keep the index, they can run after the loop
+        if isinstance(node, NESTED_SCOPE_TYPES):
+            other_uses = other_uses + sum(1 for child_node in ast.walk(node)
+                                          if isinstance(child_node, ast.Name) and child_node.id == index)
+            continue
+        if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) \
+                and isinstance(node.slice, ast.Name) and node.slice.id == index:
+            subscripts.append((parent_node, name, position, node))
+            continue
+        if isinstance(node, ast.Name) and node.id == index:
+            if not isinstance(node.ctx, ast.Load):
+                return None, 0
+            other_uses = other_uses + 1
+            continue
+        stack.extend((child_node, node, child_name, child_position)
+                     for child_name, child_position, child_node in get_fields(node))
+    return subscripts, other_uses
+
+'''
+Returns (field name, position in the list or None, child node) for the AST
+children of the node, only in the given fields if there are some
+'''
+def get_fields(node, names=None):
+    fields = []
+    for name, value in ast.iter_fields(node):
+        if names is not None and name not in names:
+            continue
+        if isinstance(value, list):
+            fields.extend((name, position, item) for position, item in enumerate(value) if isinstance(item, ast.AST))
+        elif isinstance(value, ast.AST):
+            fields.append((name, None, value))
+    return fields
+
+'''
+Returns the indexes of the definitions whose object the definition can hold,
+through the copies x = y (see ssa.py), the phis and the x += y that keep the
+object of x, and whether they all hold a new object (see FRESH_VALUE_TYPES).
+They don't when the name is not defined in the function on a path
+'''
+def get_value_origins(ssa, index):
+    origins = set()
+    fresh = True
+    seen = set()
+    worklist = [index]
+    while worklist:
+        index = worklist.pop()
+        if index in seen:
+            continue
+        seen.add(index)
+        definition = ssa.definitions[index]
+        if definition.is_phi():
+            worklist.extend(definition.operands)
+            continue
+        if isinstance(definition.statement, ast.AugAssign) and definition.node is definition.statement.target:
+            copied = definition.node
+        else:
+            copied = get_assigned_value(definition)
+        if isinstance(copied, ast.Name):
+            operand = ssa.reaching.get(id(copied), UNDEFINED)
+            if operand == UNDEFINED:
+                fresh = False
+            else:
+                worklist.append(operand)
+            continue
+        origins.add(index)
+        if not isinstance(copied, FRESH_VALUE_TYPES):
+            fresh = False
+    return origins, fresh
+
+'''
+Checks if the name read by the node can refer to the list of the sequence,
+whose definitions hold the objects of sequence_origins: it does unless its type
+is known to be another one, or it only holds new objects of other definitions
+'''
+def check_if_may_alias(node, sequence_origins, types):
+    node_type = types.get_type(node)
+    if isinstance(node_type, type) and node_type is not list:
+        return False
+    definition = types.ssa.reaching.get(id(node), UNDEFINED)
+    if definition == UNDEFINED:
+        return True
+    origins, fresh = get_value_origins(types.ssa, definition)
+    return not fresh or bool(origins & sequence_origins)
+
+'''
+Checks if the node is a name that can refer to the sequence. aliases caches
+check_if_may_alias() by id(Name), it is None when the sequence can't be
+changed anyway (a tuple, a str or bytes)
+'''
+def check_if_refers(node, sequence, sequence_origins, aliases, types):
+    if not isinstance(node, ast.Name):
+        return False
+    if node.id == sequence:
+        return True
+    if aliases is None:
+        return False
+    if id(node) not in aliases:
+        aliases[id(node)] = check_if_may_alias(node, sequence_origins, types)
+    return aliases[id(node)]
+
+'''
+Checks if the loop can't change the sequence while it is iterated: the name is
+not assigned, its items are not assigned or deleted, no method is called on it
+and it is only given to the builtins that don't change their arguments. A list
+can also be changed through the other names that can refer to it (see
+check_if_may_alias()), the same goes for them, and through any object holding
+it: for a list, a call to anything but these builtins and the methods of names
+that can't refer to it, a store into the items of anything but a name, or a
+yield or an await (the caller runs in the middle) change it. When the name is
+not a local of the function (local_names, without the closure cells and the
+names whose object escaped, see get_escaped_names()), the loop must not call
+anything but the builtins either, the callee could change it
+'''
+def check_if_not_mutated(loop, sequence, local_names, types):
+    if sequence in get_summary(loop).writes:
+        return False
+    load = next(node for node in ast.walk(loop) if isinstance(node, ast.Name) and node.id == sequence)
+    aliases = None
+    sequence_origins = set()
+    if types.get_type(load) not in (tuple, str, bytes):
+        aliases = {}
+        definition = types.ssa.reaching.get(id(load), UNDEFINED)
+        if definition != UNDEFINED:
+            sequence_origins = get_value_origins(types.ssa, definition)[0]
+
+    nodes = loop.body + loop.orelse
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(ast.iter_child_nodes(node))
+        if isinstance(node, (ast.Yield, ast.YieldFrom, ast.Await)) and \
+                (aliases is not None or sequence not in local_names):
+            return False
+        if isinstance(node, ast.Subscript) and not isinstance(node.ctx, ast.Load):
+            if check_if_refers(node.value, sequence, sequence_origins, aliases, types) or \
+                    (aliases is not None and not isinstance(node.value, ast.Name)):
+                return False
+        #x += y changes a list in place, a number can't be added to it
+        if isinstance(node, ast.AugAssign) and aliases is not None and \
+                (check_if_refers(node.target, sequence, sequence_origins, aliases, types) or
+                 (not isinstance(node.target, ast.Name) and types.get_type(node.value) not in NUMBER_TYPES)):
+            return False
+        if not isinstance(node, ast.Call):
+            continue
+        if isinstance(node.func, ast.Attribute):
+            receiver = node.func.value
+            if check_if_refers(receiver, sequence, sequence_origins, aliases, types) or \
+                    (aliases is not None and not isinstance(receiver, ast.Name)):
+                return False
+        elif aliases is not None and not isinstance(node.func, ast.Name):
+            return False
+        builtin = isinstance(node.func, ast.Name) and types.is_builtin(node.func.id)
+        non_mutating = builtin and node.func.id in NON_MUTATING_BUILTINS
+        if aliases is not None and isinstance(node.func, ast.Name) and not non_mutating:
+            return False
+        for argument in node.args + [keyword.value for keyword in node.keywords]:
+            if isinstance(argument, ast.Starred):
+                argument = argument.value
+            if check_if_refers(argument, sequence, sequence_origins, aliases, types) and not non_mutating:
+                return False
+        if sequence not in local_names and not builtin:
+            return False
+    return True
+
+'''
+Returns the local names of the function whose object can be reached from
+elsewhere: stored into an item, an attribute or a container, given to anything
+but the builtins that don't keep their arguments, yielded, or read as a bound
+method. Names assigned to each other hold the same object, if one escapes they
+all do, and a name assigned to or from a name that is not in local_names escapes
+'''
+def get_escaped_names(function, local_names, types):
+    escaped = set()
+    copies = []
+    parents = {}
+    nodes = list(function.body)
+    while nodes:
+        node = nodes.pop()
+        for child_node in ast.iter_child_nodes(node):
+            parents[id(child_node)] = node
+            if not isinstance(child_node, NESTED_SCOPE_TYPES):
+                nodes.append(child_node)
+        if not isinstance(node, ast.Name) or not isinstance(node.ctx, ast.Load):
+            continue
+        parent_node = parents.get(id(node))
+        if isinstance(parent_node, NON_KEEPING_TYPES) and \
+                not (isinstance(parent_node, ast.Subscript) and parent_node.slice is node):
+            continue
+        if isinstance(parent_node, ast.Attribute) and isinstance(parents.get(id(parent_node)), ast.Call) and \
+                parents[id(parent_node)].func is parent_node:
+            continue
+        if isinstance(parent_node, ast.Call) and (parent_node.func is node or
+                                                  (isinstance(parent_node.func, ast.Name) and
+                                                   parent_node.func.id in NON_MUTATING_BUILTINS and
+                                                   types.is_builtin(parent_node.func.id))):
+            continue
+        if isinstance(parent_node, ast.Assign) and all(isinstance(target, ast.Name) for target in parent_node.targets):
+            copies.extend((node.id, target.id) for target in parent_node.targets)
+            continue
+        escaped.add(node.id)
+    escaped.update(name for copy in copies for name in copy if name not in local_names)
+    changed = True
+    while changed:
+        changed = False
+        for name, other_name in copies:
+            if (name in escaped) != (other_name in escaped):
+                escaped.update((name, other_name))
+                changed = True
+    return escaped
+
+'''
+Returns the pair of names of len(a) == len(b), or None
+'''
+def get_length_equality(test):
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1:
+        return None
+    operands = [test.left, test.comparators[0]]
+    names = []
+    for operand in operands:
+        if not isinstance(operand, ast.Call) or not isinstance(operand.func, ast.Name) or \
+                operand.func.id != "len" or len(operand.args) != 1 or not isinstance(operand.args[0], ast.Name):
+            return None
+        names.append(operand.args[0].id)
+    return names, test.ops[0]
+
+'''
+Returns the pairs of sequences known to have the same length at the loop, at
+position in block: the ones checked by an assert len(a) == len(b), or by an
+if len(a) != len(b): raise ..., right before the loop. The statements in
+between must not refer to them, nor call anything
+'''
+def get_equal_lengths(block, position, types):
+    pairs = []
+    changed_names = set()
+    for statement in reversed(block[:position]):
+        equality = None
+        if isinstance(statement, ast.Assert):
+            equality = get_length_equality(statement.test)
+            if equality is not None and not isinstance(equality[1], ast.Eq):
+                equality = None
+        elif isinstance(statement, ast.If) and not statement.orelse and len(statement.body) == 1 and \
+                isinstance(statement.body[0], ast.Raise):
+            equality = get_length_equality(statement.test)
+            if equality is not None and not isinstance(equality[1], ast.NotEq):
+                equality = None
+        if equality is not None and types.is_builtin("len"):
+            names = equality[0]
+            if not changed_names & set(names):
+                pairs.append(set(names))
+            continue
+        summary = get_summary(statement)
+        if summary.calls or summary.has_await:
+            break
+        changed_names.update(summary.names)
+    return pairs
+
+'''
+Returns the sequences that have the same length as the sequence, from the
+pairs of get_equal_lengths()
+'''
+def get_same_length_sequences(sequence, pairs):
+    same_length = {sequence}
+    changed = True
+    while changed:
+        changed = False
+        for pair in pairs:
+            if pair & same_length and not pair <= same_length:
+                same_length.update(pair)
+                changed = True
+    return same_length
+
+'''
+Checks if the index of the loop is only read in the loop, with the SSA form of
+the function (see ssa.py): the definition of the loop target is not escaping,
+and the versions of the index after the loop, the phis it is merged into, are
+never used
+'''
+def check_if_index_private(ssa, loop):
+    definition = ssa.definition_of.get(id(loop.target))
+    if definition is None or ssa.definitions[definition].escaping:
+        return False
+    seen = set()
+    worklist = list(ssa.definitions[definition].phi_users)
+    while worklist:
+        index = worklist.pop()
+        if index in seen:
+            continue
+        seen.add(index)
+        phi = ssa.definitions[index]
+        if phi.escaping or phi.uses:
+            return False
+        worklist.extend(phi.phi_users)
+    return True
+
+'''
+Rewrites the loop over range(len(xs)) at position in block when its index
+reads items of xs, and of sequences of the same length:
+
+    for i in range(len(xs)):          for x in xs:
+        total += xs[i] * ws[i]   =>       ...   (or zip(xs, ws), or enumerate())
+
+The index is kept with enumerate() when it is used otherwise. Returns True if
+the loop changed
+'''
+def rewrite_index_loop(loop, block, position, local_names, types):
+    sequence = get_indexed_sequence(loop, types)
+    if sequence is None:
+        return False
+    subscripts, other_uses = get_index_uses(loop)
+    if not subscripts:
+        return False
+    if sequence not in [subscript.value.id for parent_node, name, field_position, subscript in subscripts] or \
+            not check_if_not_mutated(loop, sequence, local_names, types):
+        return False
+    #The sequences iterated with xs, in the order of their first item read
+    same_length = get_same_length_sequences(sequence, get_equal_lengths(block, position, types))
+    iterated = [sequence]
+    if types.is_builtin("zip"):
+        for parent_node, name, field_position, subscript in subscripts:
+            seq = subscript.value.id
+            if seq in same_length and seq not in iterated and types.get_type(subscript.value) in SEQUENCE_TYPES \
+                    and check_if_not_mutated(loop, seq, local_names, types):
+                iterated.append(seq)
+
+    #The subscripts that are not replaced by items keep the index
+    kept_loads = other_uses + sum(1 for parent_node, name, field_position, subscript in subscripts
+                                  if subscript.value.id not in iterated)
+    keep_index = kept_loads > 0 or not check_if_index_private(types.ssa, loop)
+    if keep_index and not types.is_builtin("enumerate"):
+        return False
+
+    items = {seq: f"__o_{seq}_{loop.lineno}_{loop.col_offset}" for seq in iterated}
+    for parent_node, name, field_position, subscript in subscripts:
+        if subscript.value.id not in items:
+            continue
+        item = ast.copy_location(ast.Name(id=items[subscript.value.id], ctx=ast.Load()), subscript)
+        if field_position is None:
+            setattr(parent_node, name, item)
+        else:
+            getattr(parent_node, name)[field_position] = item
+
+    targets = [ast.Name(id=items[seq], ctx=ast.Store()) for seq in iterated]
+    target = targets[0] if len(targets) == 1 else ast.Tuple(elts=targets, ctx=ast.Store())
+    iterable = ast.Name(id=sequence, ctx=ast.Load())
+    if len(iterated) > 1:
+        iterable = ast.Call(func=ast.Name(id="zip", ctx=ast.Load()),
+                            args=[ast.Name(id=seq, ctx=ast.Load()) for seq in iterated], keywords=[])
+    if keep_index:
+        target = ast.Tuple(elts=[ast.Name(id=loop.target.id, ctx=ast.Store()), target], ctx=ast.Store())
+        iterable = ast.Call(func=ast.Name(id="enumerate", ctx=ast.Load()), args=[iterable], keywords=[])
+    loop.target = ast.fix_missing_locations(ast.copy_location(target, loop.target))
+    loop.iter = ast.fix_missing_locations(ast.copy_location(iterable, loop.iter))
+    invalidate(loop)
+    return True
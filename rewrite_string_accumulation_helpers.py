@@ -0,0 +1,144 @@
+'''
+All the helper functions needed by rewrite_string_accumulation()
+'''
+
+import ast
+
+from ast_helpers import get_blocks
+from def_use import invalidate
+
+LOOP_TYPES = (ast.For, ast.AsyncFor, ast.While)
+
+#Their accumulators are their own
+NESTED_SCOPE_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+'''
+Returns the pieces added to the accumulator by the statement, s += piece or
+s = s + piece + ..., or None
+'''
+def get_pieces(statement, accumulator):
+    if isinstance(statement, ast.AugAssign) and isinstance(statement.op, ast.Add) and \
+            isinstance(statement.target, ast.Name) and statement.target.id == accumulator:
+        return [statement.value]
+    if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and \
+            isinstance(statement.targets[0], ast.Name) and statement.targets[0].id == accumulator:
+        pieces = []
+        value = statement.value
+        while isinstance(value, ast.BinOp) and isinstance(value.op, ast.Add):
+            pieces.append(value.right)
+            value = value.left
+        if pieces and isinstance(value, ast.Name) and value.id == accumulator:
+            return pieces[::-1]
+    return None
+
+'''
+Returns the statements of the loop body (and of the statements nested in it)
+that add pieces to the accumulator, as (block, position, pieces)
+'''
+def get_accumulations(loop, accumulator):
+    accumulations = []
+    blocks = [loop.body]
+    while blocks:
+        block = blocks.pop()
+        for position, statement in enumerate(block):
+            pieces = get_pieces(statement, accumulator)
+            if pieces is not None:
+                accumulations.append((block, position, pieces))
+            elif not isinstance(statement, NESTED_SCOPE_TYPES):
+                blocks.extend(statements for owner, statements in get_blocks(statement))
+    return accumulations
+
+'''
+Returns the type of the accumulator when the loop starts: the type of the
+definition merged by the phi of the loop header (see ssa.py), or None
+'''
+def get_entry_type(types, loop, accumulator):
+    for index, definition in enumerate(types.ssa.definitions):
+        if definition.is_phi() and definition.node is loop and definition.name == accumulator:
+            entry = definition.operands[0]
+            if entry < 0:
+                return None
+            entry_type = types.types[entry]
+            return entry_type if isinstance(entry_type, type) else None
+    return None
+
+'''
+Returns the accumulations of the loop when it only builds the string
+accumulator: the accumulator is a str when the loop starts (by the type
+inference, which knows the literals), every piece is a str, and the loop
+refers to the accumulator nowhere else. Returns None otherwise
+'''
+def get_string_accumulations(loop, accumulator, types):
+    if get_entry_type(types, loop, accumulator) is not str:
+        return None
+    accumulations = get_accumulations(loop, accumulator)
+    if not accumulations:
+        return None
+    references = 0
+    for block, position, pieces in accumulations:
+        if any(types.get_type(piece) is not str for piece in pieces):
+            return None
+        references = references + (1 if isinstance(block[position], ast.AugAssign) else 2)
+    #The accumulator is not read by the pieces, the tests, the else block...
+    if sum(1 for node in ast.walk(loop) if isinstance(node, ast.Name) and node.id == accumulator) != references:
+        return None
+    return accumulations
+
+'''
+Returns the names of the candidate accumulators of the loop: the local names
+(without the closure cells) assigned by an s += ... or s = s + ... in it, whose
+definitions are not escaping (see ssa.py)
+'''
+def get_accumulators(loop, local_names, types):
+    escaping = {definition.name for definition in types.ssa.definitions if definition.escaping}
+    accumulators = []
+    for node in ast.walk(loop):
+        name = None
+        if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            name = node.target.id
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+        if name is not None and name in local_names and name not in escaping and name not in accumulators and \
+                get_pieces(node, name) is not None:
+            accumulators.append(name)
+    return accumulators
+
+'''
+Rewrites the string accumulations of the loop into a list of the parts, joined
+after the loop:
+
+                                    parts = [s]
+    for x in xs:                    for x in xs:
+        s += f(x)           =>          parts.append(f(x))
+                                    s = ''.join(parts)
+
+The accumulator is read nowhere in the loop, so the joined string is the one
+the loop built. Returns True if the loop changed
+'''
+def rewrite_loop_accumulations(loop, block, local_names, types):
+    changed = False
+    for accumulator in get_accumulators(loop, local_names, types):
+        accumulations = get_string_accumulations(loop, accumulator, types)
+        if accumulations is None:
+            continue
+        parts = f"__o_parts_{accumulator}_{loop.lineno}_{loop.col_offset}"
+        for statements, position, pieces in accumulations:
+            #s = s + a + b adds a, then b
+            method = "append" if len(pieces) == 1 else "extend"
+            argument = pieces[0] if len(pieces) == 1 else ast.Tuple(elts=pieces, ctx=ast.Load())
+            call = ast.Call(func=ast.Attribute(value=ast.Name(id=parts, ctx=ast.Load()), attr=method,
+                                               ctx=ast.Load()), args=[argument], keywords=[])
+            statements[position] = ast.fix_missing_locations(
+                ast.copy_location(ast.Expr(value=call), statements[position]))
+
+        start = ast.Assign(targets=[ast.Name(id=parts, ctx=ast.Store())],
+                           value=ast.List(elts=[ast.Name(id=accumulator, ctx=ast.Load())], ctx=ast.Load()))
+        join = ast.Call(func=ast.Attribute(value=ast.Constant(value=""), attr="join", ctx=ast.Load()),
+                        args=[ast.Name(id=parts, ctx=ast.Load())], keywords=[])
+        end = ast.Assign(targets=[ast.Name(id=accumulator, ctx=ast.Store())], value=join)
+        position = next(position for position, statement in enumerate(block) if statement is loop)
+        block[position:position + 1] = [ast.fix_missing_locations(ast.copy_location(start, loop)), loop,
+                                        ast.fix_missing_locations(ast.copy_location(end, loop))]
+        invalidate(loop)
+        changed = True
+    return changed
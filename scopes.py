@@ -0,0 +1,311 @@
+'''
+Scope analysis: the symbol table of every scope of a tree (the module, the
+classes, the functions, the lambdas and the comprehensions), with the same
+rules as the compiler and the stdlib symtable module:
+
+    - a name bound in a function is local to it, unless it is declared global
+      or nonlocal there
+    - a name used in a function and bound in an enclosing function is free in
+      it and a cell of the enclosing function. The class scopes in between
+      are skipped, their names are attributes
+    - any other name used in a function is global
+    - the targets of a comprehension are local to it, a walrus in a
+      comprehension binds in the enclosing function (or module)
+    - super() and __class__ in a method are free, a cell of the class
+
+The names are not mangled: the private names of a class keep the name they
+have in the tree.
+
+symtable needs the source, the passes only have the (changing) tree, so the
+table is built from the tree. test_scopes.py checks it against symtable.
+
+The scopes are cached per node, like the def/use summaries (see def_use.py),
+and cleared by the passes when they start and end.
+'''
+
+import ast
+
+FUNCTION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+COMPREHENSION_TYPES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+#The names symtable gives to the scopes of the comprehensions
+COMPREHENSION_NAMES = {ast.ListComp: "listcomp", ast.SetComp: "setcomp", ast.DictComp: "dictcomp",
+                       ast.GeneratorExp: "genexpr"}
+
+
+class Scope:
+    def __init__(self, kind, name, node, parent):
+        #"module", "class", "function" (lambdas and comprehensions too)
+        self.kind = kind
+        self.name = name
+        self.node = node
+        self.parent = parent
+        self.children = []
+        self.parameters = set()
+        self.bound = set()
+        self.used = set()
+        self.declared_global = set()
+        self.declared_nonlocal = set()
+        #Set by resolve()
+        self.free = set()
+        self.cells = set()
+        self.implicit_global = set()
+
+    def get_locals(self):
+        if self.kind == "module":
+            return set()
+        return (self.bound | self.parameters) - self.declared_global - self.declared_nonlocal
+
+    def get_globals(self):
+        return self.declared_global | self.implicit_global
+
+    def is_local(self, name):
+        return name in self.get_locals()
+
+    '''
+    Returns the names of the scope that can be seen from outside of it: the
+    names bound at the top level of a module (and declared global below it),
+    the attributes of a class, and for a function its cells and the names it
+    binds that are declared global or nonlocal
+    '''
+    def get_exported_names(self):
+        if self.kind == "module":
+            names = set(self.bound)
+            stack = list(self.children)
+            while stack:
+                scope = stack.pop()
+                names.update(scope.declared_global & scope.bound)
+                stack.extend(scope.children)
+            return names
+        if self.kind == "class":
+            return self.get_locals()
+        return self.cells | ((self.declared_global | self.declared_nonlocal) & self.bound)
+
+    '''
+    Returns the cells of the scope that its nested scopes can assign, the ones
+    they declare nonlocal and bind. The other cells are only read by them
+    '''
+    def get_assigned_cells(self):
+        names = set()
+        stack = list(self.children)
+        while stack:
+            scope = stack.pop()
+            names.update(scope.declared_nonlocal & scope.bound)
+            stack.extend(scope.children)
+        return names & self.cells
+
+
+def get_scope_name(node):
+    if isinstance(node, ast.Lambda):
+        return "lambda"
+    if isinstance(node, COMPREHENSION_TYPES):
+        return COMPREHENSION_NAMES[type(node)]
+    return getattr(node, "name", "top")
+
+
+'''
+Builds the scopes of the tree. node is a module, a class, a function, a lambda
+or a comprehension. Returns the scope of node, its children are in
+Scope.children in source order
+'''
+def build_scopes(node):
+    kind = "module" if isinstance(node, ast.Module) else "class" if isinstance(node, ast.ClassDef) else "function"
+    root = Scope(kind, get_scope_name(node), node, None)
+    open_scope(root, node)
+    resolve(root)
+    return root
+
+
+'''
+Adds the names of the scope of node. The nodes of the nested scopes are
+handled by their own open_scope(), run from an explicit stack
+'''
+def open_scope(root, node):
+    pending = [(root, node)]
+    while pending:
+        scope, node = pending.pop()
+        #(node, scope), the children are visited in source order
+        stack = []
+        if isinstance(node, ast.Module):
+            stack = [(child_node, scope) for child_node in node.body]
+        elif isinstance(node, ast.ClassDef):
+            stack = [(child_node, scope) for child_node in node.body]
+        elif isinstance(node, FUNCTION_TYPES):
+            arguments = node.args
+            for argument in arguments.posonlyargs + arguments.args + arguments.kwonlyargs + \
+                    [arguments.vararg, arguments.kwarg]:
+                if argument is not None:
+                    scope.parameters.add(argument.arg)
+            body = node.body if isinstance(node.body, list) else [node.body]
+            stack = [(child_node, scope) for child_node in body]
+        elif isinstance(node, COMPREHENSION_TYPES):
+            for position, generator in enumerate(node.generators):
+                stack.append((generator.target, scope))
+                #The first iterable is evaluated in the enclosing scope
+                if position > 0:
+                    stack.append((generator.iter, scope))
+                stack.extend((condition, scope) for condition in generator.ifs)
+            if isinstance(node, ast.DictComp):
+                stack.extend([(node.key, scope), (node.value, scope)])
+            else:
+                stack.append((node.elt, scope))
+        stack.reverse()
+
+        while stack:
+            current, current_scope = stack.pop()
+            children = visit(current, current_scope, pending)
+            stack.extend((child_node, current_scope) for child_node in reversed(children))
+
+
+'''
+Records what the node does in the scope, opens the scopes it creates (they are
+appended to pending) and returns the children to visit in the same scope
+'''
+def visit(node, scope, pending):
+    #The scope of a definition is opened after what the definition evaluates
+    if isinstance(node, Scope):
+        scope.children.append(node)
+        pending.append((node, node.node))
+        return []
+
+    if isinstance(node, ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            scope.used.add(node.id)
+            #super() reads the __class__ cell of the enclosing class
+            if node.id == "super" and scope.kind == "function":
+                scope.used.add("__class__")
+        else:
+            scope.bound.add(node.id)
+        return []
+
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)) or \
+            isinstance(node, COMPREHENSION_TYPES):
+        kind = "class" if isinstance(node, ast.ClassDef) else "function"
+        child_scope = Scope(kind, get_scope_name(node), node, scope)
+        #What is evaluated in the enclosing scope, then the new scope
+        children = []
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            scope.bound.add(node.name)
+            children.extend(node.decorator_list)
+        if isinstance(node, ast.ClassDef):
+            children.extend(node.bases)
+            children.extend(keyword.value for keyword in node.keywords)
+        elif isinstance(node, FUNCTION_TYPES):
+            arguments = node.args
+            children.extend(arguments.defaults)
+            children.extend(default for default in arguments.kw_defaults if default is not None)
+            if not isinstance(node, ast.Lambda):
+                for argument in arguments.posonlyargs + arguments.args + arguments.kwonlyargs + \
+                        [arguments.vararg, arguments.kwarg]:
+                    if argument is not None and argument.annotation is not None:
+                        children.append(argument.annotation)
+                if node.returns is not None:
+                    children.append(node.returns)
+        else:
+            children.append(node.generators[0].iter)
+        children.append(child_scope)
+        return children
+
+    if isinstance(node, ast.NamedExpr):
+        #Binds in the enclosing function or module of the comprehensions
+        target_scope = scope
+        while isinstance(target_scope.node, COMPREHENSION_TYPES):
+            #Free in the comprehension
+            target_scope.used.add(node.target.id)
+            target_scope = target_scope.parent
+        target_scope.bound.add(node.target.id)
+        return [node.value]
+
+    if isinstance(node, ast.Global):
+        scope.declared_global.update(node.names)
+        return []
+    if isinstance(node, ast.Nonlocal):
+        scope.declared_nonlocal.update(node.names)
+        return []
+    if isinstance(node, ast.alias):
+        if node.name != "*":
+            scope.bound.add(node.asname or node.name.split(".")[0])
+        return []
+    if isinstance(node, ast.ExceptHandler) and node.name:
+        scope.bound.add(node.name)
+    elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+        scope.bound.add(node.name)
+    elif isinstance(node, ast.MatchMapping) and node.rest:
+        scope.bound.add(node.rest)
+    return list(ast.iter_child_nodes(node))
+
+
+'''
+Resolves the names used by every scope: local, free (and then a cell of the
+function that binds it) or global
+'''
+def resolve(root):
+    stack = [root]
+    while stack:
+        scope = stack.pop()
+        stack.extend(scope.children)
+        if scope.kind == "module":
+            continue
+
+        local_names = scope.get_locals()
+        for name in sorted(scope.used | scope.bound | scope.declared_nonlocal):
+            if name in scope.declared_global:
+                continue
+            if name in local_names:
+                continue
+            owner = get_enclosing_binding(scope, name)
+            if owner is None:
+                scope.implicit_global.add(name)
+            else:
+                scope.free.add(name)
+                #The scopes in between pass the name through
+                between = scope.parent
+                while between is not owner:
+                    between.free.add(name)
+                    between = between.parent
+                owner.cells.add(name)
+
+
+'''
+Returns the enclosing function scope that binds the name, skipping the classes,
+or None if the name is global
+'''
+def get_enclosing_binding(scope, name):
+    scope = scope.parent
+    while scope is not None and scope.kind != "module":
+        if scope.kind == "class" and name == "__class__":
+            return scope
+        if scope.kind == "function":
+            if name in scope.declared_global:
+                return None
+            if name in scope.get_locals():
+                return scope
+        scope = scope.parent
+    return None
+
+
+#id(node) -> (node, scope), filled by get_scope()
+scopes = {}
+
+
+def clear_scopes():
+    scopes.clear()
+
+
+'''
+Returns the scope of the module, class, function, lambda or comprehension node.
+The scopes of its subtree are built and cached at the same time. A scope built
+from a subtree doesn't know the functions around it: its names that are bound
+there are global in it
+'''
+def get_scope(node):
+    record = scopes.get(id(node))
+    if record is not None and record[0] is node:
+        return record[1]
+    root = build_scopes(node)
+    stack = [root]
+    while stack:
+        scope = stack.pop()
+        scopes[id(scope.node)] = (scope.node, scope)
+        stack.extend(scope.children)
+    return root
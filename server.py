@@ -0,0 +1,150 @@
+'''
+Daemon mode. Listens on a Unix domain socket so a build can pay the interpreter
+startup and the imports once for all the files it optimizes.
+
+The protocol is one JSON object per line in both directions. A request is
+
+    {"source": "...", "passes": ["remove", "hoist"], "options": {...}}
+
+passes defaults to DEFAULT_PASSES. The options are
+    fixed_point - run the passes until the tree is stable (default true)
+    incremental - reuse the units cached by the worker (default true)
+
+and the response is {"source": "...", "stats": {...}} or {"error": "..."}.
+{"shutdown": true} stops the server. Every request gets a response, a request
+that fails gets an error and the connection stays usable.
+
+Every connection gets a thread that reads its requests, the optimization itself
+runs in a pool of worker processes. Each worker keeps a warm IncrementalCache,
+so functions that were already seen are not optimized again.
+'''
+
+import ast
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constant import SERVER_CACHE_ENTRIES
+from incremental import IncrementalCache, optimize_incremental
+from ouroboros import optimize, DEFAULT_PASSES, PASSES
+
+worker_cache = None
+
+
+'''
+Returns the number of statements in the tree
+'''
+def count_statements(tree):
+    return sum(1 for node in ast.walk(tree) if isinstance(node, ast.stmt))
+
+
+'''
+Optimizes the source of a single request. This runs in a worker process. Any
+failure, of the request or of the optimizer, is returned as an error
+'''
+def handle_request(request):
+    global worker_cache
+    if worker_cache is None:
+        worker_cache = IncrementalCache()
+    if len(worker_cache.entries) > SERVER_CACHE_ENTRIES:
+        worker_cache.clear()
+
+    start = time.perf_counter()
+    try:
+        source = request["source"]
+        passes = tuple(request.get("passes") or DEFAULT_PASSES)
+        options = request.get("options") or {}
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(f"unknown pass {name!r}")
+        fixed_point = options.get("fixed_point", True)
+
+        t = ast.parse(source)
+        statements_before = count_statements(t)
+        hits, misses = worker_cache.hits, worker_cache.misses
+
+        #The progress messages of optimize() would end up in the log of the server
+        with contextlib.redirect_stdout(io.StringIO()):
+            if options.get("incremental", True):
+                t = optimize_incremental(t, worker_cache, passes, fixed_point)
+            else:
+                t = optimize(t, passes=passes, fixed_point=fixed_point)
+        output = ast.unparse(t)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    stats = {
+        "statements_before": statements_before,
+        "statements_after": count_statements(t),
+        "cache_hits": worker_cache.hits - hits,
+        "cache_misses": worker_cache.misses - misses,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+        "worker": os.getpid(),
+    }
+    return {"source": output, "stats": stats}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"error": f"invalid request: {e}"}
+            else:
+                if not isinstance(request, dict):
+                    response = {"error": "invalid request: not a JSON object"}
+                elif request.get("shutdown"):
+                    #shutdown() waits for serve_forever(), so it can't run on this thread
+                    threading.Thread(target=self.server.shutdown).start()
+                    response = {"shutdown": True}
+                else:
+                    try:
+                        response = self.server.executor.submit(handle_request, request).result()
+                    except Exception as e:
+                        #The worker died, or the request or the response can't be pickled
+                        response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class OptimizerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers=None):
+        self.socket_path = str(socket_path)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        super().__init__(self.socket_path, RequestHandler)
+        #The connection threads already run when the workers are started, a
+        #forkserver avoids forking a threaded process
+        context = multiprocessing.get_context("forkserver")
+        self.executor = ProcessPoolExecutor(workers, mp_context=context)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("socket", help="the path of the Unix domain socket to listen on")
+    ap.add_argument("--workers", type=int, default=None, help="the number of worker processes")
+    args = ap.parse_args()
+
+    with OptimizerServer(args.socket, args.workers) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
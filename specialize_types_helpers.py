@@ -0,0 +1,66 @@
+'''
+All the helper functions needed by specialize_types()
+'''
+
+import ast
+
+from type_inference import infer_types
+
+'''
+Returns the functions and methods of the tree, nested ones included
+'''
+def get_functions(tree):
+    return [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+
+'''
+Returns x * x for x ** 2 when x is a name known to hold an int, or None.
+int ** 2 and int * int give the same int, the multiplication skips the generic
+power. A float is left alone, x ** 2 raises OverflowError where x * x gives inf
+'''
+def get_square(node, types):
+    if not isinstance(node, ast.BinOp) or not isinstance(node.op, ast.Pow):
+        return None
+    if not isinstance(node.right, ast.Constant) or type(node.right.value) is not int or node.right.value != 2:
+        return None
+    if not isinstance(node.left, ast.Name) or types.get_type(node.left) not in (int, bool):
+        return None
+    right = ast.copy_location(ast.Name(id=node.left.id, ctx=ast.Load()), node.left)
+    return ast.copy_location(ast.BinOp(left=node.left, op=ast.Mult(), right=right), node)
+
+
+'''
+Replaces the expressions of the function for which rewrite() returns a new one.
+The nodes of the nested functions are looked at too: their names are not locals
+of this function, so they have no type here and are left alone
+'''
+def rewrite_expressions(function, types, rewrite):
+    changed = False
+    for node in ast.walk(function):
+        for name, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                for position, item in enumerate(value):
+                    new_item = rewrite(item, types) if isinstance(item, ast.expr) else None
+                    if new_item is not None:
+                        value[position] = new_item
+                        changed = True
+            elif isinstance(value, ast.expr):
+                new_value = rewrite(value, types)
+                if new_value is not None:
+                    setattr(node, name, new_value)
+                    changed = True
+    return changed
+
+
+'''
+The type-specialized rewrites, in order
+'''
+REWRITES = [get_square]
+
+
+def specialize_function(function, module_names):
+    types = infer_types(function, module_names)
+    changed = False
+    for rewrite in REWRITES:
+        changed = rewrite_expressions(function, types, rewrite) or changed
+    return changed
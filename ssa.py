@@ -0,0 +1,643 @@
+'''
+SSA form of a function body, as an analysis layer. The tree is not rewritten.
+
+Every binding of a local name (assignment, loop target, import, def...) is a
+Definition, numbered in program order. Every load of a local name reaches
+exactly one definition: at the join after an If, a Match or a Try, and at the
+header of a loop, a phi definition merges the versions coming from the
+different paths. SSA.reaching maps every Name node that loads a local to its
+definition, and every definition keeps the list of its uses, so the analyses
+below are sparse walks over def-use edges instead of rescans of the code.
+
+The construction is conservative where Python is dynamic:
+
+    - the names declared global or nonlocal are not local and have no
+      definitions
+    - the definitions of names read by nested functions, lambdas and classes,
+      and the definitions made inside a try or a with (which can be left in the
+      middle by an exception) are escaping, they count as used
+    - if the function calls locals(), vars(), eval() or exec(), every
+      definition is escaping
+
+Like the passes, the builder doesn't recurse over the statements, it runs an
+explicit stack of tasks.
+'''
+
+import ast
+
+from def_use import get_summary
+
+#Index of a missing definition: a global, a builtin or an unbound name
+UNDEFINED = -1
+
+#Calls that can read any local
+INTROSPECTION_CALLS = ("locals", "vars", "eval", "exec")
+
+#Expressions without side effects whose value only depends on their operands
+PURE_EXPRESSION_TYPES = (ast.Name, ast.Constant, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+                         ast.IfExp, ast.Tuple, ast.expr_context, ast.operator, ast.unaryop,
+                         ast.boolop, ast.cmpop)
+
+COMPREHENSION_TYPES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+NESTED_SCOPE_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+#Tasks of the builder
+BLOCK = 0
+IF_ELSE = 1
+JOIN = 2
+LOOP_END = 3
+LOOP_EXIT = 4
+TRY_BODY_END = 5
+TRY_HANDLER_START = 6
+TRY_HANDLER_END = 7
+TRY_FINALLY = 8
+MATCH_CASE_START = 9
+MATCH_CASE_END = 10
+ESCAPE = 11
+UNREACHABLE = 12
+
+
+class Definition:
+    __slots__ = ("name", "node", "statement", "operands", "uses", "phi_users", "escaping")
+
+    def __init__(self, name, node, statement, operands=None):
+        self.name = name
+        #The Name, arg, alias or statement that binds the name, the joining
+        #statement for a phi
+        self.node = node
+        self.statement = statement
+        #The merged definitions, None if this is not a phi
+        self.operands = operands
+        #The Name nodes that load this definition
+        self.uses = []
+        #The phis that merge this definition
+        self.phi_users = []
+        self.escaping = False
+
+    def is_phi(self):
+        return self.operands is not None
+
+
+class Loop:
+    __slots__ = ("node", "phis", "entry", "continues", "breaks")
+
+    def __init__(self, node, phis, entry):
+        self.node = node
+        self.phis = phis
+        self.entry = entry
+        self.continues = []
+        self.breaks = []
+
+
+'''
+Returns the names bound by the nodes (Name stores, defs, imports...), without
+looking into nested scopes
+'''
+def get_bound_names(nodes):
+    names = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            stack.extend(node.decorator_list)
+            continue
+        elif isinstance(node, ast.Lambda):
+            continue
+        elif isinstance(node, ast.alias):
+            names.add(node.asname or node.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names.add(node.rest)
+        stack.extend(ast.iter_child_nodes(node))
+    return names
+
+
+'''
+Returns the names loaded inside the nested scopes of the function
+'''
+def get_captured_names(function):
+    captured = set()
+    stack = list(function.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NESTED_SCOPE_TYPES):
+            for child_node in ast.walk(node):
+                if isinstance(child_node, ast.Name) and isinstance(child_node.ctx, ast.Load):
+                    captured.add(child_node.id)
+            continue
+        stack.extend(ast.iter_child_nodes(node))
+    return captured
+
+
+class SSA:
+    def __init__(self, function):
+        self.function = function
+        self.definitions = []
+        #id(Name node) -> index of the definition it loads
+        self.reaching = {}
+        #id(binding node) -> index of its definition
+        self.definition_of = {}
+        #id(loop) -> (first, last + 1) indices of the definitions made in the loop
+        self.loop_ranges = {}
+        self.outer_names = set()
+        self.captured = get_captured_names(function)
+        #name -> index of its current definition, None when unreachable
+        self.env = {}
+        self.loops = []
+
+        for node in ast.walk(function):
+            if isinstance(node, (ast.Global, ast.Nonlocal)):
+                self.outer_names.update(node.names)
+
+    '''
+    Creates the definition of name by node and makes it the current version
+    '''
+    def define(self, name, node, statement):
+        if name in self.outer_names:
+            return UNDEFINED
+        index = len(self.definitions)
+        definition = Definition(name, node, statement)
+        definition.escaping = name in self.captured
+        self.definitions.append(definition)
+        self.definition_of[id(node)] = index
+        if self.env is not None:
+            self.env[name] = index
+        return index
+
+    def use(self, node):
+        if self.env is None or node.id in self.outer_names:
+            return
+        index = self.env.get(node.id, UNDEFINED)
+        self.reaching[id(node)] = index
+        if index != UNDEFINED:
+            self.definitions[index].uses.append(node)
+
+    def add_phi(self, name, statement, operands):
+        index = len(self.definitions)
+        definition = Definition(name, statement, statement, [])
+        definition.escaping = name in self.captured
+        self.definitions.append(definition)
+        self.set_operands(index, operands)
+        return index
+
+    def set_operands(self, index, operands):
+        self.definitions[index].operands = operands
+        for operand in operands:
+            if operand != UNDEFINED:
+                self.definitions[operand].phi_users.append(index)
+
+    '''
+    Merges the environments of the paths that reach the statement. None is an
+    unreachable path
+    '''
+    def join(self, envs, statement):
+        envs = [env for env in envs if env is not None]
+        if not envs:
+            return None
+        if len(envs) == 1:
+            return dict(envs[0])
+        joined = {}
+        names = set()
+        for env in envs:
+            names.update(env)
+        for name in sorted(names):
+            operands = [env.get(name, UNDEFINED) for env in envs]
+            if all(operand == operands[0] for operand in operands):
+                joined[name] = operands[0]
+            else:
+                joined[name] = self.add_phi(name, statement, operands)
+        return joined
+
+    '''
+    Visits an expression in evaluation order: the loads are uses, the walrus
+    targets are definitions. The names bound by comprehensions are their own
+    '''
+    def visit_expression(self, node, statement, local_names=frozenset()):
+        if node is None:
+            return
+        #(node, names local to a comprehension, is a walrus target)
+        stack = [(node, local_names, False)]
+        while stack:
+            node, local_names, is_target = stack.pop()
+            if is_target:
+                self.define(node.id, node, statement)
+            elif isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load) and node.id not in local_names:
+                    self.use(node)
+            elif isinstance(node, ast.NamedExpr):
+                stack.append((node.target, local_names, True))
+                stack.append((node.value, local_names, False))
+            elif isinstance(node, ast.Lambda):
+                #Only the defaults are evaluated here
+                defaults = node.args.defaults + [default for default in node.args.kw_defaults if default]
+                for default in reversed(defaults):
+                    stack.append((default, local_names, False))
+            elif isinstance(node, COMPREHENSION_TYPES):
+                inner_names = set(local_names)
+                for generator in node.generators:
+                    inner_names.update(get_bound_names([generator.target]))
+                inner_names = frozenset(inner_names)
+                #Only the first iterable is evaluated in the enclosing scope
+                inner = []
+                for position, generator in enumerate(node.generators):
+                    if position > 0:
+                        inner.append(generator.iter)
+                    inner.extend(generator.ifs)
+                inner.extend([node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt])
+                for child_node in reversed(inner):
+                    stack.append((child_node, inner_names, False))
+                stack.append((node.generators[0].iter, local_names, False))
+            else:
+                for child_node in reversed(list(ast.iter_child_nodes(node))):
+                    stack.append((child_node, local_names, False))
+
+    '''
+    Visits an assignment target: the names are defined, the subscripts and
+    attributes are loads
+    '''
+    def visit_target(self, target, statement):
+        stack = [target]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.Name):
+                self.define(node.id, node, statement)
+            elif isinstance(node, (ast.Tuple, ast.List)):
+                stack.extend(reversed(node.elts))
+            elif isinstance(node, ast.Starred):
+                stack.append(node.value)
+            else:
+                self.visit_expression(node, statement)
+
+    def visit_pattern(self, pattern, statement):
+        for node in ast.walk(pattern):
+            if isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+                self.define(node.name, node, statement)
+            elif isinstance(node, ast.MatchMapping) and node.rest:
+                self.define(node.rest, node, statement)
+            elif isinstance(node, ast.MatchValue):
+                self.visit_expression(node.value, statement)
+
+    '''
+    Starts a loop: the names bound in it get a phi at the header, whose
+    operands are set when the body ends
+    '''
+    def start_loop(self, node, tasks):
+        entry = self.env
+        start = len(self.definitions)
+        if isinstance(node, ast.While):
+            bound_names = get_bound_names(node.body + [node.test])
+        else:
+            bound_names = get_bound_names(node.body + [node.target])
+        phis = {}
+        self.env = dict(entry)
+        for name in sorted(bound_names - self.outer_names):
+            #The operands are only known at the end of the body
+            index = len(self.definitions)
+            self.definitions.append(Definition(name, node, node, []))
+            self.definitions[index].escaping = name in self.captured
+            phis[name] = index
+            self.env[name] = index
+        loop = Loop(node, phis, entry)
+        self.loops.append(loop)
+        if isinstance(node, ast.While):
+            self.visit_expression(node.test, node)
+        else:
+            self.visit_target(node.target, node)
+        tasks.append((LOOP_END, loop, start))
+        tasks.append((BLOCK, node.body, 0))
+
+    def end_loop(self, loop, start, tasks):
+        self.loops.pop()
+        back_edges = [env for env in loop.continues + [self.env] if env is not None]
+        header = dict(loop.entry)
+        for name, index in loop.phis.items():
+            operands = [loop.entry.get(name, UNDEFINED)]
+            operands.extend(env.get(name, UNDEFINED) for env in back_edges)
+            self.set_operands(index, operands)
+            header[name] = index
+        self.loop_ranges[id(loop.node)] = (start, len(self.definitions))
+        #The loop is left from its header, the else block runs then
+        self.env = header
+        tasks.append((LOOP_EXIT, loop))
+        tasks.append((BLOCK, loop.node.orelse, 0))
+
+    '''
+    Visits a simple statement, or starts a compound one by pushing its tasks
+    '''
+    def visit_statement(self, statement, tasks):
+        if isinstance(statement, ast.Assign):
+            self.visit_expression(statement.value, statement)
+            for target in statement.targets:
+                self.visit_target(target, statement)
+        elif isinstance(statement, ast.AugAssign):
+            self.visit_expression(statement.value, statement)
+            if isinstance(statement.target, ast.Name):
+                #The target is read before it is written
+                self.use(statement.target)
+                self.define(statement.target.id, statement.target, statement)
+            else:
+                self.visit_expression(statement.target, statement)
+        elif isinstance(statement, ast.AnnAssign):
+            if statement.value is not None:
+                self.visit_expression(statement.value, statement)
+                self.visit_target(statement.target, statement)
+            elif not isinstance(statement.target, ast.Name):
+                self.visit_expression(statement.target, statement)
+        elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            for decorator in statement.decorator_list:
+                self.visit_expression(decorator, statement)
+            if isinstance(statement, ast.ClassDef):
+                for base in statement.bases + [keyword.value for keyword in statement.keywords]:
+                    self.visit_expression(base, statement)
+            else:
+                for default in statement.args.defaults + [default for default in statement.args.kw_defaults if default]:
+                    self.visit_expression(default, statement)
+            self.define(statement.name, statement, statement)
+        elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+            for alias in statement.names:
+                if alias.name != "*":
+                    self.define(alias.asname or alias.name.split(".")[0], alias, statement)
+        elif isinstance(statement, ast.Delete):
+            for target in statement.targets:
+                if isinstance(target, ast.Name):
+                    self.use(target)
+                    if self.env is not None:
+                        self.env.pop(target.id, None)
+                else:
+                    self.visit_expression(target, statement)
+        elif isinstance(statement, (ast.Return, ast.Raise)):
+            for child_node in ast.iter_child_nodes(statement):
+                self.visit_expression(child_node, statement)
+            self.env = None
+        elif isinstance(statement, ast.Break):
+            self.loops[-1].breaks.append(self.env)
+            self.env = None
+        elif isinstance(statement, ast.Continue):
+            self.loops[-1].continues.append(self.env)
+            self.env = None
+        elif isinstance(statement, ast.If):
+            self.visit_expression(statement.test, statement)
+            tasks.append((IF_ELSE, statement, dict(self.env)))
+            tasks.append((BLOCK, statement.body, 0))
+        elif isinstance(statement, (ast.For, ast.AsyncFor)):
+            self.visit_expression(statement.iter, statement)
+            self.start_loop(statement, tasks)
+        elif isinstance(statement, ast.While):
+            self.start_loop(statement, tasks)
+        elif isinstance(statement, (ast.With, ast.AsyncWith)):
+            for item in statement.items:
+                self.visit_expression(item.context_expr, statement)
+                if item.optional_vars is not None:
+                    self.visit_target(item.optional_vars, statement)
+            #A context manager that suppresses an exception can leave the body
+            #anywhere
+            tasks.append((ESCAPE, len(self.definitions)))
+            tasks.append((BLOCK, statement.body, 0))
+        elif isinstance(statement, (ast.Try, getattr(ast, "TryStar", ast.Try))):
+            tasks.append((ESCAPE, len(self.definitions)))
+            tasks.append((TRY_BODY_END, statement, dict(self.env)))
+            tasks.append((BLOCK, statement.body, 0))
+        elif isinstance(statement, ast.Match):
+            self.visit_expression(statement.subject, statement)
+            entry = dict(self.env)
+            ends = []
+            #When no case matches, the entry reaches the join too
+            tasks.append((JOIN, statement, ends, entry))
+            for case in reversed(statement.cases):
+                tasks.append((MATCH_CASE_END, ends))
+                tasks.append((BLOCK, case.body, 0))
+                tasks.append((MATCH_CASE_START, case, statement, entry))
+        else:
+            for child_node in ast.iter_child_nodes(statement):
+                self.visit_expression(child_node, statement)
+
+    def build(self):
+        for argument in ast.walk(self.function.args):
+            if isinstance(argument, ast.arg):
+                self.define(argument.arg, argument, self.function)
+
+        tasks = [(BLOCK, self.function.body, 0)]
+        while tasks:
+            task = tasks.pop()
+            kind = task[0]
+            if kind == BLOCK:
+                statements, position = task[1], task[2]
+                if self.env is None or position >= len(statements):
+                    continue
+                tasks.append((BLOCK, statements, position + 1))
+                self.visit_statement(statements[position], tasks)
+
+            elif kind == IF_ELSE:
+                statement, entry = task[1], task[2]
+                then_env = self.env
+                self.env = entry
+                tasks.append((JOIN, statement, [then_env], None))
+                tasks.append((BLOCK, statement.orelse, 0))
+
+            elif kind == JOIN:
+                statement, ends, entry = task[1], task[2], task[3]
+                self.env = self.join(ends + [entry if entry is not None else self.env], statement)
+
+            elif kind == LOOP_END:
+                self.end_loop(task[1], task[2], tasks)
+
+            elif kind == LOOP_EXIT:
+                loop = task[1]
+                self.env = self.join([self.env] + loop.breaks, loop.node)
+
+            elif kind == TRY_BODY_END:
+                statement, entry = task[1], task[2]
+                #The handlers can start from anywhere in the body, the
+                #definitions made there are escaping
+                handler_entry = self.join([entry, self.env], statement)
+                ends = []
+                tasks.append((TRY_FINALLY, statement, ends, handler_entry))
+                for handler in reversed(statement.handlers):
+                    tasks.append((TRY_HANDLER_END, ends))
+                    tasks.append((BLOCK, handler.body, 0))
+                    tasks.append((TRY_HANDLER_START, handler, handler_entry))
+                tasks.append((TRY_HANDLER_END, ends))
+                tasks.append((BLOCK, statement.orelse, 0))
+
+            elif kind == TRY_HANDLER_START:
+                handler, entry = task[1], task[2]
+                self.env = dict(entry)
+                self.visit_expression(handler.type, handler)
+                if handler.name:
+                    self.define(handler.name, handler, handler)
+
+            elif kind == TRY_HANDLER_END:
+                task[1].append(self.env)
+
+            elif kind == TRY_FINALLY:
+                statement, ends, handler_entry = task[1], task[2], task[3]
+                if statement.finalbody:
+                    #The finally block also runs on the way out of an
+                    #exception or a return
+                    self.env = self.join(ends + [handler_entry], statement)
+                    if all(env is None for env in ends):
+                        tasks.append((UNREACHABLE,))
+                    tasks.append((BLOCK, statement.finalbody, 0))
+                else:
+                    self.env = self.join(ends, statement)
+
+            elif kind == UNREACHABLE:
+                self.env = None
+
+            elif kind == MATCH_CASE_START:
+                case, statement, entry = task[1], task[2], task[3]
+                self.env = dict(entry)
+                self.visit_pattern(case.pattern, statement)
+                self.visit_expression(case.guard, statement)
+
+            elif kind == MATCH_CASE_END:
+                task[1].append(self.env)
+
+            elif kind == ESCAPE:
+                for definition in self.definitions[task[1]:]:
+                    definition.escaping = True
+
+        calls = get_summary(self.function).calls
+        if not calls.isdisjoint(INTROSPECTION_CALLS):
+            for definition in self.definitions:
+                definition.escaping = True
+        return self
+
+
+'''
+Builds the SSA form of the body of the function
+'''
+def build_ssa(function):
+    return SSA(function).build()
+
+
+'''
+Returns the indices of the definitions that are never used: not escaping, not
+loaded, and only merged into phis that are never used themselves
+'''
+def get_dead_definitions(ssa):
+    live = [False] * len(ssa.definitions)
+    worklist = [index for index, definition in enumerate(ssa.definitions)
+                if definition.escaping or definition.uses]
+    while worklist:
+        index = worklist.pop()
+        if live[index]:
+            continue
+        live[index] = True
+        operands = ssa.definitions[index].operands
+        if operands:
+            worklist.extend(operand for operand in operands if operand != UNDEFINED and not live[operand])
+    return [index for index, definition in enumerate(ssa.definitions)
+            if not live[index] and not definition.is_phi()]
+
+
+'''
+Returns the value assigned by the definition: the value of x = <value> when it
+is the only target, or None
+'''
+def get_assigned_value(definition):
+    statement = definition.statement
+    if definition.is_phi() or not isinstance(statement, ast.Assign) or len(statement.targets) != 1 or \
+            statement.targets[0] is not definition.node:
+        return None
+    return statement.value
+
+
+#The lattice of get_constant_definitions(): not known yet, not constant
+UNKNOWN = object()
+VARYING = object()
+
+
+def is_same_value(value, other_value):
+    if value is UNKNOWN or value is VARYING or other_value is UNKNOWN or other_value is VARYING:
+        return value is other_value
+    return type(value) is type(other_value) and value == other_value
+
+
+'''
+Returns {definition index: value} for the definitions whose value is a known
+constant: assignments of a constant or a copy of a constant definition, and
+phis of the same constant. The definitions start unknown and only go down the
+lattice, each one is looked at again only when one of its operands changes
+'''
+def get_constant_definitions(ssa):
+    values = [UNKNOWN] * len(ssa.definitions)
+    #The definitions to look at again when a definition changes: the phis that
+    #merge it and the definitions that copy it
+    users = [list(definition.phi_users) for definition in ssa.definitions]
+    copied = {}
+    for index, definition in enumerate(ssa.definitions):
+        value = get_assigned_value(definition)
+        if isinstance(value, ast.Name):
+            copied[index] = ssa.reaching.get(id(value), UNDEFINED)
+            if copied[index] != UNDEFINED:
+                users[copied[index]].append(index)
+
+    def get_value(index):
+        definition = ssa.definitions[index]
+        if definition.escaping:
+            return VARYING
+        if definition.is_phi():
+            value = UNKNOWN
+            for operand in definition.operands:
+                operand_value = VARYING if operand == UNDEFINED else values[operand]
+                if operand_value is UNKNOWN:
+                    continue
+                if operand_value is VARYING or (value is not UNKNOWN and not is_same_value(value, operand_value)):
+                    return VARYING
+                value = operand_value
+            return value
+        assigned_value = get_assigned_value(definition)
+        if isinstance(assigned_value, ast.Constant):
+            return assigned_value.value
+        if copied.get(index, UNDEFINED) != UNDEFINED:
+            return values[copied[index]]
+        return VARYING
+
+    worklist = list(range(len(ssa.definitions)))
+    while worklist:
+        index = worklist.pop()
+        value = get_value(index)
+        if is_same_value(value, values[index]):
+            continue
+        values[index] = value
+        worklist.extend(users[index])
+
+    return {index: value for index, value in enumerate(values)
+            if value is not UNKNOWN and value is not VARYING and not ssa.definitions[index].is_phi()}
+
+
+'''
+Returns the indices of the definitions made in the loop (a For or While of the
+function) that compute the same value on every iteration: assignments of a pure
+expression whose operands are all defined before the loop, or by invariant
+definitions. A variable assigned more than once in the loop doesn't prevent
+this, only the versions the expression reads matter. The globals and builtins
+can be changed by the loop, they are not invariant
+'''
+def get_invariant_definitions(ssa, loop):
+    start, end = ssa.loop_ranges[id(loop)]
+    invariant = set()
+    for index in range(start, end):
+        definition = ssa.definitions[index]
+        value = get_assigned_value(definition)
+        if value is None or definition.escaping:
+            continue
+        operands = []
+        for node in ast.walk(value):
+            if not isinstance(node, PURE_EXPRESSION_TYPES):
+                break
+            if isinstance(node, ast.Name):
+                operands.append(ssa.reaching.get(id(node), UNDEFINED))
+        else:
+            if all(operand != UNDEFINED and (not start <= operand < end or operand in invariant)
+                   for operand in operands):
+                invariant.add(index)
+    return sorted(invariant)
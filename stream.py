@@ -0,0 +1,157 @@
+'''
+Streaming interface, so the optimizer can be a stage of a pipeline.
+
+Single documents are read from a file or stdin and written to a file or stdout.
+With --stream, stdin carries many documents and every result is written (and
+flushed) as soon as it is ready. Two framings are supported:
+
+    nul    - documents are separated by a NUL byte
+    length - every document is preceded by a line with its length in bytes
+
+The output uses the same framing as the input. A document that can't be
+optimized (it can't be parsed, or a pass fails on it) is passed through
+unchanged and reported on stderr. A malformed length header is reported too,
+and ends the stream: the documents after it can't be found.
+
+stdout may carry the optimized code, so the progress messages of optimize()
+are sent to stderr.
+'''
+
+import ast
+import contextlib
+import sys
+
+from constant import STREAM_CHUNK_SIZE
+from ouroboros import optimize, DEFAULT_PASSES
+
+
+'''
+Optimizes the given tree. With a cache the tree is optimized unit by unit (see
+incremental.py), with a profile only its hot functions are optimized (see pgo.py)
+'''
+def optimize_tree(t, passes=DEFAULT_PASSES, fixed_point=True, cache=None, profile=None):
+    with contextlib.redirect_stdout(sys.stderr):
+        if profile is not None:
+            from pgo import optimize_with_profile, format_report
+            print(format_report(optimize_with_profile(t, profile, passes, fixed_point)))
+        elif cache is not None:
+            from incremental import optimize_incremental
+            t = optimize_incremental(t, cache, passes, fixed_point)
+        else:
+            t = optimize(t, passes=passes, fixed_point=fixed_point)
+    return t
+
+
+'''
+Parses and optimizes the given source and returns the optimized tree
+'''
+def optimize_source_tree(source, passes=DEFAULT_PASSES, fixed_point=True, cache=None, profile=None):
+    return optimize_tree(ast.parse(source), passes, fixed_point, cache, profile)
+
+
+'''
+Raises a ValueError if the options can't be used together: the units of an
+incremental cache come back as copies, which the patching emitter can't map
+back to the source (see emit.py)
+'''
+def check_options(cache=None, patch=False):
+    if patch and cache is not None:
+        raise ValueError("patch can't be used with an incremental cache")
+
+
+'''
+Optimizes the given source and returns the optimized source. With patch, only
+the statements changed by the passes are rewritten (see emit.py)
+'''
+def optimize_source(source, passes=DEFAULT_PASSES, fixed_point=True, cache=None, patch=False, profile=None):
+    check_options(cache, patch)
+    if not patch:
+        t = optimize_source_tree(source, passes, fixed_point, cache, profile)
+        return ast.unparse(t) + "\n"
+    from emit import take_snapshot, emit_patched_source
+    t = ast.parse(source)
+    snapshot = take_snapshot(t)
+    t = optimize_tree(t, passes, fixed_point, cache, profile)
+    return emit_patched_source(source, t, snapshot)
+
+
+'''
+Yields the NUL separated documents of the binary stream as soon as each is complete
+'''
+def read_nul_documents(stream):
+    pending = b""
+    while True:
+        chunk = stream.read1(STREAM_CHUNK_SIZE) if hasattr(stream, "read1") else stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending = pending + chunk
+        *documents, pending = pending.split(b"\0")
+        for document in documents:
+            yield document
+    if pending:
+        yield pending
+
+
+'''
+Yields the length-prefixed documents of the binary stream
+'''
+def read_length_prefixed_documents(stream):
+    while True:
+        header = stream.readline()
+        if not header:
+            break
+        if not header.strip():
+            continue
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ValueError(f"invalid length header {header[:80]!r}")
+        document = stream.read(length)
+        if len(document) != length:
+            raise ValueError(f"truncated document, expected {length} bytes and got {len(document)}")
+        yield document
+
+
+def write_document(stream, document, framing):
+    if framing == "length":
+        stream.write(str(len(document)).encode() + b"\n" + document)
+    else:
+        stream.write(document + b"\0")
+    stream.flush()
+
+
+'''
+Optimizes every document of the input stream. Returns the number of documents
+that could not be optimized
+'''
+def run_stream(input_stream, output_stream, framing, passes=DEFAULT_PASSES, fixed_point=True, cache=None,
+               patch=False):
+    check_options(cache, patch)
+    if framing == "length":
+        documents = read_length_prefixed_documents(input_stream)
+    else:
+        documents = read_nul_documents(input_stream)
+
+    failures = 0
+    number = 0
+    while True:
+        try:
+            document = next(documents, None)
+        except ValueError as e:
+            #The framing is lost, nothing after it can be read
+            print(f"document {number}: {type(e).__name__}: {e}", file=sys.stderr)
+            failures = failures + 1
+            break
+        if document is None:
+            break
+        try:
+            output = optimize_source(document.decode(), passes, fixed_point, cache, patch).encode()
+        except Exception as e:
+            print(f"document {number}: {type(e).__name__}: {e}", file=sys.stderr)
+            failures = failures + 1
+            output = document
+        write_document(output_stream, output, framing)
+        number = number + 1
+    return failures
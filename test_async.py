@@ -0,0 +1,83 @@
+import pytest
+from ouroboros import remove_useless, hoist_invariants
+from ast_helpers import clean, ast_parse, ast_unparse
+
+def test_remove_useless_in_coroutine():
+    t = ast_parse("""
+        async def f(session, n):
+            total = 0
+            unused = 3
+            u = 5
+            x = await session.get(u)
+            await session.close()
+            async with session.lock() as lock:
+                w = 1
+                total = total + n
+            async for row in session.rows():
+                dead = row * 2
+                total = total + row
+            return total
+        """)
+
+    result = ast_unparse(remove_useless(t))
+
+    #The dead store of an awaited value keeps the await
+    assert result == clean("""
+        async def f(session, n):
+            total = 0
+            u = 5
+            await session.get(u)
+            await session.close()
+            async with session.lock() as lock:
+                total = total + n
+            async for row in session.rows():
+                total = total + row
+            return total
+        """)
+
+def test_hoist_out_of_async_for():
+    t = ast_parse("""
+        async def f(session, n, m):
+            async for row in session.rows():
+                k = n * m + 1
+                j = session.limit * 2
+                print(row + k + j)
+            for i in range(n):
+                k3 = session.limit * 4
+                print(i + k3)
+        """)
+
+    result = ast_unparse(hoist_invariants(t, use_cost_model=False))
+
+    #session.limit can change while the async for awaits
+    assert result == clean("""
+        async def f(session, n, m):
+            k = n * m + 1
+            async for row in session.rows():
+                j = session.limit * 2
+                print(row + k + j)
+            k3 = session.limit * 4
+            for i in range(n):
+                print(i + k3)
+        """)
+
+def test_await_is_an_effect_boundary():
+    t = ast_parse("""
+        async def f(session, n, m):
+            while n:
+                k = m * 3 + 1
+                w = await session.size()
+                g = limit * 2
+                n = n - k - g - w
+        """)
+
+    result = ast_unparse(hoist_invariants(t, use_cost_model=False))
+
+    assert result == clean("""
+        async def f(session, n, m):
+            k = m * 3 + 1
+            while n:
+                w = await session.size()
+                g = limit * 2
+                n = n - k - g - w
+        """)
@@ -0,0 +1,119 @@
+import pytest
+from ouroboros import remove_useless, hoist_invariants
+from ast_helpers import clean, ast_parse, ast_unparse
+
+def test_hoist_in_all_blocks():
+    t = ast_parse("""
+        def f(n, m):
+            try:
+                for i in range(n):
+                    k = m * 2
+                    print(k + i)
+            except ValueError:
+                for i in range(n):
+                    k = m * 3
+                    print(k + i)
+            else:
+                while n:
+                    k = m * 4
+                    n = n - k
+            finally:
+                with open(m) as h:
+                    for i in range(n):
+                        k = m * 5
+                        print(k + i)
+        """)
+
+    result = ast_unparse(hoist_invariants(t))
+
+    assert result == clean("""
+        def f(n, m):
+            try:
+                k = m * 2
+                for i in range(n):
+                    print(k + i)
+            except ValueError:
+                k = m * 3
+                for i in range(n):
+                    print(k + i)
+            else:
+                k = m * 4
+                while n:
+                    n = n - k
+            finally:
+                with open(m) as h:
+                    k = m * 5
+                    for i in range(n):
+                        print(k + i)
+        """)
+
+def test_remove_useless_in_all_blocks():
+    t = ast_parse("""
+        def f(n):
+            total = 0
+            try:
+                for i in range(n):
+                    k = n * 2
+                    total = total + i
+            except ValueError:
+                bad = 1
+                total = 0
+            finally:
+                z = 4
+            with open(n) as h:
+                w = 5
+                total = total + 1
+            match n:
+                case [a, *rest] if len(rest):
+                    u = 3
+                    total = total + a
+            return total
+        """)
+
+    result = ast_unparse(remove_useless(t))
+
+    assert result == clean("""
+        def f(n):
+            total = 0
+            try:
+                for i in range(n):
+                    total = total + i
+            except ValueError:
+                total = 0
+            with open(n) as h:
+                total = total + 1
+            match n:
+                case [a, *rest] if len(rest):
+                    total = total + a
+            return total
+        """)
+
+def test_emptied_blocks_stay_valid():
+    t = ast_parse("""
+        def f(n):
+            try:
+                a = 1
+            finally:
+                b = 2
+            with open(n) as h:
+                c = 3
+            for i in range(n):
+                d = 4
+            else:
+                print(n)
+            return n
+        """)
+
+    result = ast_unparse(remove_useless(t))
+
+    assert result == clean("""
+        def f(n):
+            try:
+                pass
+            finally:
+                pass
+            with open(n) as h:
+                pass
+            print(n)
+            return n
+        """)
@@ -0,0 +1,39 @@
+import pytest
+from cli import main
+import subprocess
+import sys
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.mark.parametrize("argv", [
+    ["--hoist", "--remove"],
+    ["--stream", "tab"],
+    ["--interval", "soon"],
+    ["--unknown"],
+    ["--passes", "remove,hoist", "--hoist"],
+    ["--passes", "remove", "--dont"],
+    ["--profile", "prof.out", "--incremental"],
+    ["--patch", "--incremental"],
+])
+def test_invalid_arguments(argv, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(argv)
+    assert e.value.code == 2
+    assert "ouroboros.py: error" in capsys.readouterr().err
+
+def loaded_modules(*arguments):
+    code = ("import sys, io; sys.stdin = io.StringIO('x = 1'); sys.argv = ['ouroboros.py', *sys.argv[1:]]\n"
+            "from cli import main; main(); print(' '.join(sys.modules), file=sys.stderr)")
+    result = subprocess.run([sys.executable, "-c", code, *arguments], cwd=HERE,
+                            capture_output=True, text=True, check=True)
+    return set(result.stderr.split())
+
+def test_startup_imports():
+    modules = loaded_modules("--hoist")
+
+    for heavy in ["inspect", "copy", "hashlib", "pathlib", "remove_useless_helpers"]:
+        assert heavy not in modules
+    assert "hoist_invariants_helpers" in modules
+
+    assert "hoist_invariants_helpers" not in loaded_modules("--remove")
@@ -0,0 +1,118 @@
+import pytest
+import contextlib
+import io
+from ouroboros import hoist_invariants, optimize
+from ast_helpers import clean, ast_parse, ast_unparse
+
+def test_hoist_out_of_comprehensions():
+    #g() can change the globals and the items, the locals are still hoisted.
+    #What follows an if is guarded by it, and an attribute or an item is only
+    #read once when the comprehension is known to have elements
+    t = ast_parse("""
+        def f(xs, scale, d, k):
+            ys = [g(x) * (scale + 1) / scale for x in xs]
+            kept = [x * (scale + 2) for x in xs if x > d[k] + 1]
+            total = sum(v * math.tau for v in xs)
+            sized = sum(v * math.tau for v in (1, 2, 3))
+            pairs = {x: y * scale.factor for x in range(3) for y in d[x]}
+            items = {x: y * scale.factor for x in range(3) for y in "ab"}
+            return ys, kept, total, sized, pairs, items
+        """)
+
+    result = ast_unparse(hoist_invariants(t))
+
+    assert result == clean("""
+        def f(xs, scale, d, k):
+            __o_tmp_2_18 = scale + 1
+            ys = [g(x) * __o_tmp_2_18 / scale for x in xs]
+            kept = [x * (scale + 2) for x in xs if x > d[k] + 1]
+            total = sum((v * math.tau for v in xs))
+            __o_tmp_5_20 = math.tau
+            sized = sum((v * __o_tmp_5_20 for v in (1, 2, 3)))
+            pairs = {x: y * scale.factor for x in range(3) for y in d[x]}
+            __o_tmp_7_20 = scale.factor
+            items = {x: y * __o_tmp_7_20 for x in range(3) for y in 'ab'}
+            return (ys, kept, total, sized, pairs, items)
+        """)
+
+def test_comprehension_invariants_that_can_raise():
+    source = """
+        def f(xs, ys, d, cfg):
+            first = [xs[0] + y for y in ys if xs]
+            keys = [d["k"] + x for x in xs]
+            calls = [bump(cfg), [cfg.scale * x for x in (1, 2)]]
+            return first, keys, calls
+        def bump(cfg):
+            cfg.scale = 2
+        """
+
+    result = ast_unparse(hoist_invariants(ast_parse(source)))
+
+    #xs[0] is guarded by the if, d["k"] is not read when xs is empty and
+    #bump() changes cfg.scale before the comprehension runs
+    assert result == ast_unparse(ast_parse(source))
+
+def test_comprehension_scoping():
+    source = clean("""
+        def f(xs, d, k):
+            lazy = (v * math.e for v in xs)
+            sum = None
+            shadowed = sum(v * math.e for v in xs)
+            bound = [x.real * d[x] for x in xs]
+            cond = [x and d[k] for x in xs]
+            walrus = [(y := x) + y.real + g(k) for x in xs]
+            return lazy, shadowed, bound, cond, walrus
+        class C:
+            attr = [x * math.pi for x in range(3)]
+        """)
+
+    result = ast_unparse(hoist_invariants(ast_parse(source)))
+
+    #Nothing is invariant or evaluated once and right away
+    assert result == ast_unparse(ast_parse(source))
+
+def test_optimize_keeps_comprehension_temporaries():
+    t = ast_parse("""
+        def f(scale):
+            unused = 1
+            return [x * scale.factor for x in range(8)]
+        """)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ast_unparse(optimize(t))
+
+    assert result == clean("""
+        def f(scale):
+            __o_tmp_3_16 = scale.factor
+            return [x * __o_tmp_3_16 for x in range(8)]
+        """)
+
+def test_comprehension_invariants_across_calls():
+    source = """
+        K = 1
+        def bump():
+            global K
+            K = K + 1
+            return 0
+        def f(xs, a):
+            return [bump() + x * (a + 1) + K * 2 for x in xs]
+        def g(xs, a):
+            def step():
+                nonlocal a
+                a = a + 1
+                return 0
+            return [step() + x * (a + 1) for x in xs]
+        """
+    t = ast_parse(source)
+
+    result = ast_unparse(hoist_invariants(t))
+
+    #K and the cell a can change between two elements, the local a can't
+    assert result.count("__o_tmp_") == 2
+    assert "__o_tmp_7_26 = a + 1" in result
+    namespace = {}
+    exec(compile(t, "<test>", "exec"), namespace)
+    expected = {}
+    exec(compile(ast_parse(source), "<test>", "exec"), expected)
+    assert [namespace["f"]([1, 2], 1), namespace["g"]([1, 2], 1)] == \
+        [expected["f"]([1, 2], 1), expected["g"]([1, 2], 1)]
@@ -0,0 +1,79 @@
+import pytest
+import contextlib
+import io
+from ouroboros import propagate_copies, optimize
+from ast_helpers import clean, ast_parse, ast_unparse
+
+def test_propagate_copy_chains():
+    t = ast_parse("""
+        def f(xs, y):
+            a = y
+            b = a
+            for x in xs:
+                t = x
+                print(t + b)
+            return a
+        """)
+
+    result = ast_unparse(propagate_copies(t))
+
+    assert result == clean("""
+        def f(xs, y):
+            a = y
+            b = y
+            for x in xs:
+                t = x
+                print(x + y)
+            return y
+        """)
+
+def test_copies_left_alone():
+    source = """
+        def f(xs, y, z):
+            a = y
+            y = 2
+            b = z
+            b += 1
+            c = z
+            z = [c for z in xs]
+            d = xs
+            del xs
+            e = d
+            try:
+                g = e
+            finally:
+                pass
+            h = e
+            def inner():
+                nonlocal e
+                e = None
+            return a, b, z, d, g, h
+        """
+
+    result = ast_unparse(propagate_copies(ast_parse(source)))
+
+    assert result == ast_unparse(ast_parse(source))
+
+def test_remove_dead_temporary_copies():
+    t = ast_parse("""
+        def f(n, k):
+            total = 0
+            while n > 0:
+                n = k.limit - 1
+                m = n
+                total += m
+            return total
+        """)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ast_unparse(optimize(t, passes=("remove", "hoist", "copy", "remove")))
+
+    assert result == clean("""
+        def f(n, k):
+            total = 0
+            __o_tmp_4 = k.limit - 1
+            while n > 0:
+                n = __o_tmp_4
+                total += __o_tmp_4
+            return total
+        """)
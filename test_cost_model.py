@@ -0,0 +1,53 @@
+import pytest
+from ouroboros import hoist_invariants
+from cost_model import get_cost, get_trip_count, get_hoist_report
+from ast_helpers import ast_parse, ast_unparse
+import ast
+
+def test_trip_count():
+    loops = ast_parse("""
+        for i in range(2, 10, 2):
+            pass
+        for i in [1, 2]:
+            pass
+        for i in range(n):
+            pass
+        """).body
+    assert [get_trip_count(loop) for loop in loops] == [4, 2, 10]
+
+def test_cheap_expressions_are_not_hoisted():
+    t = ast_parse("""
+        def foo(a, x, y):
+            for i in range(len(a)):
+                a[i] = -1
+            for j in range(1):
+                c = x + y
+        """)
+    expected = ast_unparse(t)
+
+    t = hoist_invariants(t)
+
+    assert get_cost(ast.parse("-1", mode="eval").body) == 1
+    assert ast_unparse(t) == expected
+
+def test_dependent_statements_stay_in_loop():
+    t = ast_parse("""
+        def foo(a, x):
+            for i in range(1):
+                v = 12
+                w = v + x
+                a[i] = w
+        """)
+    expected = ast_unparse(t)
+
+    assert ast_unparse(hoist_invariants(t)) == expected
+    assert ast_unparse(hoist_invariants(t, use_cost_model=False)) != expected
+
+def test_report():
+    t = ast_parse("""
+        def foo(a, x, y):
+            for i in range(len(a)):
+                a[i] = x + y
+                a[i] = 1
+        """)
+    assert get_hoist_report(t) == {"foo": {"hoisted": 1, "skipped": 1, "savings": 25}}
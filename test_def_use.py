@@ -0,0 +1,58 @@
+import pytest
+from def_use import get_summary, invalidate, clear_summaries
+from hoist_invariants_helpers import check_if_iter_present
+from ast_helpers import ast_parse
+import ast
+
+def test_summary():
+    statement = ast_parse("""
+        a[i + 1] = f(x) + (y := g.h(z))
+        """).body[0]
+
+    summary = get_summary(statement)
+
+    assert summary.names == {"a", "i", "f", "x", "y", "g", "z"}
+    assert summary.writes == {"y"}
+    assert summary.calls == {"f", "h"}
+    assert summary.has_walrus
+    assert check_if_iter_present(statement, "i")
+    clear_summaries()
+
+def test_summaries_are_shared():
+    t = ast_parse("""
+        for i in range(10):
+            x = i
+        """)
+    loop = t.body[0]
+    statement = loop.body[0]
+
+    summary = get_summary(t)
+
+    assert get_summary(statement) is get_summary(loop.body[0])
+    assert summary.names == {"i", "range", "x"}
+    clear_summaries()
+
+def test_invalidate_ancestors():
+    t = ast_parse("""
+        for i in range(10):
+            x = i
+        """)
+    statement = t.body[0].body[0]
+    assert get_summary(t).names == {"i", "range", "x"}
+
+    statement.value = ast.Name(id="y", ctx=ast.Load())
+    invalidate(statement)
+
+    assert get_summary(t).names == {"i", "range", "x", "y"}
+    assert get_summary(t.body[0].iter).names == {"range"}
+    clear_summaries()
+
+def test_summary_size_follows_subtree():
+    t = ast.parse("\n".join(f"def f{n}(a{n}):\n    return a{n} + 1" for n in range(500)))
+
+    get_summary(t)
+
+    #The last function only holds its own names, not the ones seen before it
+    assert get_summary(t.body[-1].body[0]).names == {"a499"}
+    assert len(get_summary(t).names) == 500
+    clear_summaries()
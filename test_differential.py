@@ -0,0 +1,43 @@
+import pytest
+from differential import benchmark_module, benchmark_corpus, compare_files
+from ast_helpers import clean
+
+MODULE = clean("""
+    BENCHMARK = {"entry": "foo", "inputs": [([0] * 100, 1, 2)]}
+
+    def foo(a, x, y):
+        c = 1
+        for i in range(len(a)):
+            a[i] = x + y
+        print(sum(a))
+        return a[:3]
+    """)
+
+def test_optimized_module_is_identical(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(MODULE)
+
+    report = benchmark_module(str(path), "foo", "[([0] * 100, 1, 2), ([], 0, 0)]", warmup=1, repeat=3)
+
+    assert report["identical"]
+    assert report["original"]["median"] > 0 and report["optimized"]["median"] > 0
+    assert report["speedup"] > 0
+
+def test_mismatch_is_reported(tmp_path):
+    original = tmp_path / "original.py"
+    original.write_text(MODULE)
+    optimized = tmp_path / "optimized.py"
+    optimized.write_text(MODULE.replace("x + y", "x - y"))
+
+    report = compare_files(str(original), str(optimized), "foo", "[([0] * 3, 1, 2)]", warmup=0, repeat=1)
+
+    assert not report["identical"]
+
+def test_corpus_measures_every_pass(tmp_path):
+    (tmp_path / "module.py").write_text(MODULE)
+    (tmp_path / "helper.py").write_text("x = 1\n")
+
+    reports = benchmark_corpus(str(tmp_path), [("remove",), ("hoist",)], warmup=0, repeat=2)
+
+    assert [report["passes"] for report in reports] == [["remove"], ["hoist"]]
+    assert all(report["identical"] for report in reports)
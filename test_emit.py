@@ -0,0 +1,99 @@
+import pytest
+from ouroboros import optimize, hoist_invariants
+from emit import compile_tree, write_pyc, take_snapshot, emit_patched_source
+from ast_helpers import clean, ast_parse
+import ast
+import importlib
+import sys
+
+def test_hoisted_nodes_locations():
+    t = ast_parse("""
+        def foo(a, x, y):
+            for i in range(len(a)):
+                a[i] = x + y
+        """)
+
+    t = hoist_invariants(t)
+
+    hoisted, loop = t.body[0].body
+    assert hoisted.lineno == hoisted.targets[0].lineno == loop.lineno == 2
+    assert loop.body[0].value.lineno == 3
+
+def test_pyc_is_importable(tmp_path):
+    t = ast_parse("""
+        def foo(a, x, y):
+            if x:
+                c = 1
+            else:
+                y = 2
+            for i in range(len(a)):
+                a[i] = x + y
+            return a
+        """)
+    code = compile_tree(optimize(t), "foo.py")
+
+    with open(tmp_path / "foo_optimized.pyc", "wb") as f:
+        write_pyc(f, code)
+
+    sys.path.insert(0, str(tmp_path))
+    try:
+        module = importlib.import_module("foo_optimized")
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("foo_optimized", None)
+    assert module.foo([0, 0], 1, 5) == [6, 6]
+    assert module.foo([0], 0, 5) == [2]
+
+PATCHED_SOURCE = '''\
+#!/usr/bin/env python
+# Comments and formatting outside of the changed statements are kept
+
+def foo(a, x, y):   # the function
+    c = [1,
+         2]
+    for i in range(len(a)):
+        # the loop body
+        a[i] = x + y
+    return a
+
+def bar(b):
+    # untouched
+    return (b  +  1)
+'''
+
+def test_patch_keeps_unchanged_source():
+    t = ast.parse(PATCHED_SOURCE)
+    snapshot = take_snapshot(t)
+    t = optimize(t)
+    output = emit_patched_source(PATCHED_SOURCE, t, snapshot)
+
+    assert ast.dump(ast.parse(output)) == ast.dump(ast.parse(ast.unparse(t)))
+    assert output.startswith("#!/usr/bin/env python\n# Comments and formatting")
+    assert "def foo(a, x, y):   # the function\n" in output
+    assert "        # the loop body\n" in output
+    assert "    # untouched\n    return (b  +  1)\n" in output
+    assert "c = [1" not in output
+
+def test_patch_renders_statements_sharing_a_line():
+    source = clean("""
+        def foo(a, x, y):
+            c = 1; d = 2
+            for i in range(len(a)): a[i] = x + y
+            return a, d
+        """)
+    t = ast.parse(source)
+    snapshot = take_snapshot(t)
+    t = optimize(t, passes=("hoist",), fixed_point=False)
+    output = emit_patched_source(source, t, snapshot)
+
+    assert ast.dump(ast.parse(output)) == ast.dump(ast.parse(ast.unparse(t)))
+
+def test_patch_without_changes_is_the_source():
+    source = clean("""
+        # nothing to optimize
+        def foo(a):
+            return a  # here
+        """)
+    t = ast.parse(source)
+    snapshot = take_snapshot(t)
+    assert emit_patched_source(source, optimize(t), snapshot) == source
@@ -0,0 +1,69 @@
+import pytest
+import import_hook
+import ouroboros
+from ast_helpers import clean
+import sys
+
+MODULE = clean("""
+    VERSION = "1.0"
+    def foo(x):
+        for i in range(10):
+            y = 10 + x
+            z = i
+        return y
+    """)
+
+@pytest.fixture
+def package(tmp_path):
+    (tmp_path / "hooked").mkdir()
+    (tmp_path / "hooked" / "__init__.py").write_text("")
+    (tmp_path / "hooked" / "mod.py").write_text(MODULE)
+    sys.path.insert(0, str(tmp_path))
+    finder = import_hook.install(["hooked"])
+    yield tmp_path / "hooked"
+    import_hook.uninstall(finder)
+    sys.path.remove(str(tmp_path))
+    for name in ["hooked", "hooked.mod"]:
+        sys.modules.pop(name, None)
+
+def test_import_hook_optimizes(package):
+    import hooked.mod
+
+    assert hooked.mod.foo(1) == 11
+    # the loop is gone from the optimized code
+    assert "range" not in hooked.mod.foo.__code__.co_names
+
+def test_import_hook_keeps_module_names(package):
+    import hooked.mod
+
+    assert hooked.mod.VERSION == "1.0"
+
+def test_import_hook_cache(package, monkeypatch):
+    import hooked.mod
+    cache_path = import_hook.get_cache_path(hooked.mod.__file__)
+    assert "ouroboros" in cache_path
+
+    del sys.modules["hooked.mod"]
+    def fail(*args):
+        raise AssertionError("the cached code should be used")
+    monkeypatch.setattr(import_hook, "compile_optimized", fail)
+    import hooked.mod
+    assert hooked.mod.foo(2) == 12
+
+def test_import_hook_falls_back(package, monkeypatch):
+    def fail(tree, dependent_variables, passes):
+        raise RuntimeError("broken pass")
+    monkeypatch.setattr(import_hook, "optimize", fail)
+
+    with pytest.warns(ImportWarning, match="broken pass"):
+        import hooked.mod
+    assert "range" in hooked.mod.foo.__code__.co_names
+
+def test_import_hook_version_follows_the_optimizer(package, monkeypatch):
+    import hooked.mod
+    cache_path = import_hook.get_cache_path(hooked.mod.__file__)
+    assert import_hook.get_optimizer_version() in cache_path
+
+    monkeypatch.setattr(ouroboros, "OPTIMIZER_VERSION", "0")
+    monkeypatch.setattr(ouroboros, "optimizer_version", None)
+    assert import_hook.get_cache_path(hooked.mod.__file__) != cache_path
@@ -0,0 +1,75 @@
+import pytest
+from incremental import IncrementalCache, optimize_incremental
+from ouroboros import optimize
+from ast_helpers import clean, ast_parse, ast_unparse
+import ast
+
+SOURCE = """
+    def foo(x):
+        for i in range(10):
+            y = 10 + x
+            z = i
+        return y
+    def bar():
+        a = 10
+        b = 0
+        return a
+    print(foo(42), bar())
+    """
+
+def test_incremental_matches_optimize():
+    t = optimize_incremental(ast_parse(SOURCE))
+
+    assert ast_unparse(t) == ast_unparse(optimize(ast_parse(SOURCE)))
+
+def test_incremental_reuses_clean_units():
+    cache = IncrementalCache()
+    optimize_incremental(ast_parse(SOURCE), cache)
+    assert cache.hits == 0
+
+    edited = SOURCE.replace("b = 0", "b = 1")
+    t = optimize_incremental(ast_parse(edited), cache)
+
+    # foo and the module-level print are reused, only bar is optimized again
+    assert cache.hits == 2
+    assert ast_unparse(t) == clean("""
+        def foo(x):
+            y = 10 + x
+            return y
+        def bar():
+            a = 10
+            return a
+        print(foo(42), bar())
+        """)
+
+def test_incremental_facts_invalidate_units():
+    cache = IncrementalCache()
+    optimize_incremental(ast_parse(SOURCE), cache)
+
+    # the module now reads z, so the cached version of foo can't be used.
+    # bar already saw z in the names used by foo and is reused
+    t = optimize_incremental(ast_parse(SOURCE + "print(z)\n"), cache)
+
+    assert cache.hits == 1
+    assert "z = i" in ast_unparse(t)
+
+def test_incremental_cache_file(tmp_path):
+    path = tmp_path / "cache.pickle"
+    cache = IncrementalCache(path)
+    optimize_incremental(ast_parse(SOURCE), cache)
+    cache.save()
+
+    cache = IncrementalCache(path)
+    optimize_incremental(ast_parse(SOURCE), cache)
+    assert cache.misses == 0
+
+def test_incremental_follows_the_optimizer_version(monkeypatch):
+    import ouroboros
+    cache = IncrementalCache()
+    optimize_incremental(ast_parse(SOURCE), cache)
+
+    # a change of the optimizer never serves the units it optimized before
+    monkeypatch.setattr(ouroboros, "optimizer_version", "0-changed")
+    optimize_incremental(ast_parse(SOURCE), cache)
+
+    assert cache.hits == 0
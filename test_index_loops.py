@@ -0,0 +1,143 @@
+import pytest
+from ouroboros import rewrite_index_loops
+from ast_helpers import clean, ast_parse, ast_unparse
+import type_inference
+
+@pytest.fixture(autouse=True)
+def trust_type_hints(monkeypatch):
+    #The sequences of these tests get their type from their annotations
+    monkeypatch.setattr(type_inference, "TRUST_TYPE_HINTS", True)
+
+def test_rewrite_index_loops():
+    t = ast_parse("""
+        def f(xs: list, ws: list, names: str):
+            total = 0
+            for i in range(len(xs)):
+                total += xs[i]
+            assert len(xs) == len(ws)
+            for i in range(len(xs)):
+                total += xs[i] * ws[i]
+            for i in range(0, len(names)):
+                print(i, names[i])
+            return total
+        """)
+
+    result = ast_unparse(rewrite_index_loops(t))
+
+    assert result == clean("""
+        def f(xs: list, ws: list, names: str):
+            total = 0
+            for __o_xs_3_4 in xs:
+                total += __o_xs_3_4
+            assert len(xs) == len(ws)
+            for __o_xs_6_4, __o_ws_6_4 in zip(xs, ws):
+                total += __o_xs_6_4 * __o_ws_6_4
+            for i, __o_names_8_4 in enumerate(names):
+                print(i, __o_names_8_4)
+            return total
+        """)
+
+def test_keep_index_for_other_sequences():
+    t = ast_parse("""
+        def f(xs: tuple, d):
+            for i in range(len(xs)):
+                d[i] = xs[i] + d[i]
+            return i
+        """)
+
+    result = ast_unparse(rewrite_index_loops(t))
+
+    assert result == clean("""
+        def f(xs: tuple, d):
+            for i, __o_xs_2_4 in enumerate(xs):
+                d[i] = __o_xs_2_4 + d[i]
+            return i
+        """)
+
+def test_index_loops_left_alone():
+    source = """
+        items = []
+        def f(xs: list, ys: list, d, g):
+            for i in range(len(d)):
+                print(d[i])
+            for i in range(len(xs)):
+                xs.append(xs[i])
+            for i in range(len(xs)):
+                xs[i] = xs[i] + 1
+            for i in range(len(xs)):
+                g(xs)
+                print(xs[i])
+            for i in range(len(xs)):
+                print(xs[i] + ys[i])
+            xs = items
+            for i in range(len(xs)):
+                g(xs[i])
+        def g(xs: list):
+            len = max
+            for i in range(len(xs)):
+                print(xs[i])
+        """
+
+    result = ast_unparse(rewrite_index_loops(ast_parse(source)))
+
+    #d has no known type, xs is changed by the loop or can be changed by g(),
+    #ys has no known length, len is not the builtin
+    assert "zip" not in result
+    assert result.count("__o_") == 2
+    assert "for i, __o_xs_12_4 in enumerate(xs)" in result
+
+def test_index_loops_with_aliases():
+    t = ast_parse("""
+        def f(xs: list, d):
+            ys = xs
+            for i in range(len(xs)):
+                if xs[i]:
+                    ys.pop()
+            for i in range(len(xs)):
+                d.clear()
+                print(xs[i])
+            out = []
+            for i in range(len(xs)):
+                out.append(xs[i])
+            return out
+        """)
+
+    result = ast_unparse(rewrite_index_loops(t))
+
+    #ys is xs, d can be xs, out is a new list
+    assert result.count("__o_") == 2
+    assert "for __o_xs_10_4 in xs:" in result
+
+def test_index_loops_with_escaped_lists():
+    t = ast_parse("""
+        def f(self, xs: list):
+            self.items = xs
+            for i in range(len(xs)):
+                self.items.append(i)
+                print(xs[i])
+        def g(xs: list):
+            d = {"k": xs}
+            for i in range(len(xs)):
+                d["k"].append(7)
+                print(xs[i])
+        def h(xs: list):
+            d = {"k": xs}
+            for i in range(len(xs)):
+                d["k"] += [7]
+                print(xs[i])
+        def k(xs: list, ys: list):
+            out = []
+            for i in range(len(xs)):
+                out.append(xs[i])
+            for i in range(len(ys)):
+                out.append(ys[i])
+            return out
+        """)
+
+    result = ast_unparse(rewrite_index_loops(t))
+
+    #xs is stored in self.items and in d, the loops change it through them,
+    #out is only a new list
+    assert result.count("__o_") == 4
+    assert "for __o_xs_18_4 in xs:" in result
+    assert "for __o_ys_20_4 in ys:" in result
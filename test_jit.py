@@ -0,0 +1,43 @@
+import pytest
+from jit import optimize
+
+def test_optimize_decorator():
+    @optimize
+    def foo(x):
+        for i in range(10):
+            y = 10 + x
+            z = i
+        return y
+
+    assert foo(1) == 11
+    assert foo.__name__ == "foo"
+    assert "range" not in foo.__code__.co_names
+
+def test_optimize_decorator_closure():
+    scale = 3
+    unused = 4
+
+    @optimize(passes=["remove"])
+    def bar(x):
+        a = unused
+        return x * scale
+
+    assert bar(2) == 6
+    assert bar.__code__.co_freevars == ("scale",)
+
+def test_optimize_decorator_cache():
+    functions = []
+    for i in range(2):
+        @optimize
+        def baz(x):
+            b = 0
+            return x + 1
+        functions.append(baz)
+
+    assert functions[0].__code__ is functions[1].__code__
+    assert functions[1](1) == 2
+
+def test_optimize_decorator_falls_back():
+    with pytest.warns(RuntimeWarning):
+        f = optimize(eval("lambda x: x + 1"))
+    assert f(1) == 2
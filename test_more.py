@@ -326,3 +326,99 @@ def test_hoist_while_var_used_before():
                 x = m + n
     """) 
 
+
+def test_hoist_two_loops_in_block():
+    t = ast_parse("""
+        def func(n, m):
+            for i in range(n):
+                a = m * 2
+                print(a + i)
+            for j in range(n):
+                print(j)
+                b = m * 3
+                print(b + j)
+    """)
+
+    t = hoist_invariants(t, use_cost_model=False)
+
+    assert ast_unparse(t) == clean("""
+        def func(n, m):
+            a = m * 2
+            for i in range(n):
+                print(a + i)
+            b = m * 3
+            for j in range(n):
+                print(j)
+                print(b + j)
+    """)
+
+
+def test_remove_useless_keeps_stores_into_objects():
+    t = ast_parse("""
+        class C:
+            def __init__(self, v, p, o):
+                k = 'a'
+                unused = 1
+                self.x = v
+                a, b = p
+                c, d = p
+                o.d[k] = 1
+                self.n += 1
+                return a
+    """)
+
+    t = remove_useless(t)
+
+    assert ast_unparse(t) == clean("""
+        class C:
+            def __init__(self, v, p, o):
+                k = 'a'
+                self.x = v
+                a, b = p
+                o.d[k] = 1
+                self.n += 1
+                return a
+    """)
+
+
+def test_remove_useless_bare_return():
+    t = ast_parse("""
+        def f(x):
+            y = 1
+            if x:
+                return
+            return x
+    """)
+
+    t = remove_useless(t)
+
+    assert ast_unparse(t) == clean("""
+        def f(x):
+            if x:
+                return
+            return x
+    """)
+
+
+def test_remove_useless_keeps_method_calls():
+    t = ast_parse("""
+        def f(map, input, d, s):
+            map.update({"k": 1})
+            input.append(3)
+            dict.update(d, {"k": 2})
+            set.add(s, 4)
+            n = len(s)
+            return None
+    """)
+
+    t = remove_useless(t)
+
+    #The objects are named like pure builtins, their methods are not
+    assert ast_unparse(t) == clean("""
+        def f(map, input, d, s):
+            map.update({'k': 1})
+            input.append(3)
+            dict.update(d, {'k': 2})
+            set.add(s, 4)
+            return None
+    """)
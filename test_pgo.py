@@ -0,0 +1,69 @@
+import pytest
+from pgo import Profile, load_profile, optimize_with_profile
+from ast_helpers import clean, ast_parse, ast_unparse
+import cProfile
+import sys
+
+SOURCE = """
+    def hot(a, x, y):
+        c = 1
+        for i in range(len(a)):
+            a[i] = x + y
+        return a
+
+    def cold(a, x, y):
+        c = 1
+        for i in range(len(a)):
+            a[i] = x + y
+        return a
+
+    hot([0] * 1000, 1, 2)
+    """
+
+def test_only_hot_functions_are_optimized():
+    t = ast_parse(SOURCE)
+    profile = Profile([("script.py", 4, 950), ("script.py", 10, 50)])
+
+    report = optimize_with_profile(t, profile)
+
+    assert ast_unparse(t) == ast_unparse(ast_parse("""
+        def hot(a, x, y):
+            __o_tmp_4 = x + y
+            for i in range(len(a)):
+                a[i] = __o_tmp_4
+            return a
+
+        def cold(a, x, y):
+            c = 1
+            for i in range(len(a)):
+                a[i] = x + y
+            return a
+
+        hot([0] * 1000, 1, 2)
+        """))
+    assert [(entry["name"], entry["hot"], entry["transformed"]) for entry in report] == \
+        [("hot", True, True), ("cold", False, False)]
+    assert report[0]["share"] == 0.95
+    assert report[0]["loops"] == [(3, 950)]
+
+def test_line_histogram(tmp_path):
+    path = tmp_path / "hits.txt"
+    path.write_text("# file:line hits\nscript.py:4 10\nother.py:4 99\n")
+
+    profile = load_profile(str(path)).for_file("script.py")
+
+    assert profile.entries == [("script.py", 4, 10.0)]
+
+def test_pstats(tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text(clean(SOURCE))
+    code = compile(path.read_text(), str(path), "exec")
+    profiler = cProfile.Profile()
+    profiler.runctx(code, {}, {})
+    profiler.dump_stats(str(tmp_path / "profile.pstats"))
+
+    profile = load_profile(str(tmp_path / "profile.pstats")).for_file(str(path))
+    t = ast_parse(SOURCE)
+    report = optimize_with_profile(t, profile)
+
+    assert [entry["name"] for entry in report if entry["hot"]] == ["hot"]
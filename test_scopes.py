@@ -0,0 +1,88 @@
+import pytest
+import symtable
+from scopes import get_scope, clear_scopes
+from ouroboros import remove_useless
+from ast_helpers import clean, ast_parse, ast_unparse
+
+SOURCE = """
+import os.path as p
+counter = 0
+def outer(a, *args, b=1, **kwargs):
+    global counter
+    counter += 1
+    x = [y for y in args if y > a]
+    total = 0
+    def inner(c):
+        nonlocal total
+        total += c + b
+        return (z := c) + len(x)
+    class Inner:
+        size = a
+        def method(self):
+            return super().method() + size
+    squares = {k: k * k for k in x if (last := k)}
+    return inner, Inner, last, lambda d: d + total
+"""
+
+def get_tables(table, scope, tables):
+    if table.get_type() == "function":
+        locals_ = set(table.get_locals()) - {".0"}
+        tables.append((table.get_name(), locals_, set(table.get_frees()), set(table.get_globals()),
+                       scope.name, scope.get_locals(), scope.free, scope.get_globals()))
+    for child_table, child_scope in zip(table.get_children(), scope.children):
+        get_tables(child_table, child_scope, tables)
+    return tables
+
+def test_scopes_match_symtable():
+    tables = get_tables(symtable.symtable(SOURCE, "<test>", "exec"), get_scope(ast_parse(SOURCE)), [])
+
+    assert [table[0] for table in tables] == ["outer", "listcomp", "inner", "method", "dictcomp", "lambda"]
+    for name, locals_, frees, globals_, scope_name, scope_locals, scope_frees, scope_globals in tables:
+        assert (scope_name, scope_locals, scope_frees, scope_globals) == (name, locals_, frees, globals_)
+    clear_scopes()
+
+def test_remove_useless_in_methods():
+    t = ast_parse("""
+        class A:
+            y = 2
+            def m(self, a):
+                b = a + 1
+                c = 5
+                return b
+        """)
+
+    result = ast_unparse(remove_useless(t))
+
+    assert result == clean("""
+        class A:
+            y = 2
+
+            def m(self, a):
+                b = a + 1
+                return b
+        """)
+
+def test_remove_useless_keeps_shared_names():
+    t = ast_parse("""
+        def outer():
+            global g
+            x = 1
+            g = 3
+            d = 4
+            def inner():
+                return x
+            return inner
+        """)
+
+    result = ast_unparse(remove_useless(t))
+
+    assert result == clean("""
+        def outer():
+            global g
+            x = 1
+            g = 3
+
+            def inner():
+                return x
+            return inner
+        """)
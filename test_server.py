@@ -0,0 +1,50 @@
+import pytest
+from server import OptimizerServer
+from client import OptimizerClient
+from ast_helpers import clean
+import threading
+
+SOURCE = clean("""
+    def foo(x):
+        for i in range(10):
+            y = 10 + x
+            z = i
+        return y
+    print(foo(42))
+    """)
+
+@pytest.fixture
+def socket_path(tmp_path):
+    path = tmp_path / "ouroboros.sock"
+    server = OptimizerServer(path, workers=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+def test_server_optimizes(socket_path):
+    with OptimizerClient(socket_path) as client:
+        response = client.optimize(SOURCE)
+        assert response["source"] + "\n" == clean("""
+            def foo(x):
+                y = 10 + x
+                return y
+            print(foo(42))
+            """)
+        assert response["stats"]["statements_before"] == 6
+        assert response["stats"]["statements_after"] == 4
+
+        response = client.optimize(SOURCE, passes=["hoist"], options={"fixed_point": False})
+        assert "z = i" in response["source"]
+
+def test_server_errors(socket_path):
+    with OptimizerClient(socket_path) as client:
+        assert "SyntaxError" in client.optimize("def (")["error"]
+        assert "unknown pass" in client.optimize(SOURCE, passes=["inline"])["error"]
+        assert "not a JSON object" in client.request([SOURCE])["error"]
+        assert "error" in client.optimize(SOURCE, options=["incremental"])
+        assert "error" in client.request({"source": 42})
+        # the connection is still usable after an error
+        assert "source" in client.optimize(SOURCE)
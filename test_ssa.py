@@ -0,0 +1,73 @@
+import pytest
+from ssa import build_ssa, get_dead_definitions, get_constant_definitions, get_invariant_definitions
+from def_use import clear_summaries
+from ast_helpers import ast_parse
+import ast
+
+def get_definition(ssa, name, line):
+    for definition in ssa.definitions:
+        if definition.name == name and not definition.is_phi() and definition.node.lineno == line:
+            return ssa.definitions.index(definition)
+
+def test_phi_at_joins():
+    function = ast_parse("""
+        def foo(a, x):
+            y = 1
+            if x:
+                y = 2
+            for i in a:
+                y = y + i
+            return y
+        """).body[0]
+
+    ssa = build_ssa(function)
+
+    returned = function.body[-1].value
+    exit_phi = ssa.definitions[ssa.reaching[id(returned)]]
+    assert exit_phi.is_phi() and isinstance(exit_phi.statement, ast.For)
+    if_phi = ssa.definitions[exit_phi.operands[0]]
+    assert if_phi.is_phi() and isinstance(if_phi.statement, ast.If)
+    assert if_phi.operands == [get_definition(ssa, "y", 4), get_definition(ssa, "y", 2)]
+    assert exit_phi.operands[1] == get_definition(ssa, "y", 6)
+    clear_summaries()
+
+def test_dead_and_constant_definitions():
+    function = ast_parse("""
+        def foo(a, x):
+            c = 1
+            b = 2
+            while x:
+                d = c
+                c = d
+                x = x - 1
+            def bar():
+                return b
+            e = 3
+            return c
+        """).body[0]
+
+    ssa = build_ssa(function)
+
+    dead = [ssa.definitions[index].name for index in get_dead_definitions(ssa)]
+    assert dead == ["a", "bar", "e"]
+    constants = {ssa.definitions[index].name: value for index, value in get_constant_definitions(ssa).items()}
+    assert constants == {"c": 1, "d": 1, "e": 3}
+    clear_summaries()
+
+def test_invariant_definitions():
+    function = ast_parse("""
+        def foo(a, x, y):
+            for i in range(len(a)):
+                c = x + y
+                d = c * 2
+                c = i
+                e = c + 1
+                f = g + 1
+        """).body[0]
+
+    ssa = build_ssa(function)
+
+    invariant = get_invariant_definitions(ssa, function.body[0])
+    assert [(ssa.definitions[index].name, ssa.definitions[index].node.lineno) for index in invariant] == \
+        [("c", 3), ("d", 4)]
+    clear_summaries()
@@ -0,0 +1,67 @@
+import pytest
+from stream import run_stream, read_nul_documents, optimize_source
+from ast_helpers import clean
+import io
+
+SOURCE = clean("""
+    x = 1
+    y = 2
+    print(x)
+    """)
+
+def test_optimize_source():
+    assert optimize_source(SOURCE) == clean("""
+        x = 1
+        print(x)
+        """)
+
+def test_nul_documents_split_across_chunks():
+    stream = io.BufferedReader(io.BytesIO(b"a = 1\0b = 2\0c = 3"), buffer_size=4)
+    assert list(read_nul_documents(stream)) == [b"a = 1", b"b = 2", b"c = 3"]
+
+def test_stream_nul():
+    output = io.BytesIO()
+    failures = run_stream(io.BytesIO(SOURCE.encode() + b"\0def (\0"), output, "nul")
+
+    assert failures == 1
+    optimized, broken, rest = output.getvalue().split(b"\0")
+    assert optimized.decode() == "x = 1\nprint(x)\n"
+    # documents that can't be parsed are passed through
+    assert broken == b"def ("
+    assert rest == b""
+
+def test_stream_length_prefixed():
+    document = SOURCE.encode()
+    output = io.BytesIO()
+    run_stream(io.BytesIO(b"%d\n%s" % (len(document), document) * 2), output, "length")
+
+    optimized = b"x = 1\nprint(x)\n"
+    assert output.getvalue() == b"%d\n%s" % (len(optimized), optimized) * 2
+
+def test_stream_reports_failures(monkeypatch, capsys):
+    import stream
+    document = SOURCE.encode()
+    output = io.BytesIO()
+    failures = run_stream(io.BytesIO(b"%d\n%sten\n%s" % (len(document), document, document)), output, "length")
+
+    # the documents before the malformed header are written
+    assert failures == 1
+    assert output.getvalue() == b"15\nx = 1\nprint(x)\n"
+    assert "document 1: ValueError: invalid length header" in capsys.readouterr().err
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("broken pass")
+    monkeypatch.setattr(stream, "optimize", fail)
+    output = io.BytesIO()
+    failures = run_stream(io.BytesIO(document + b"\0" + document), output, "nul")
+
+    assert failures == 2
+    assert output.getvalue() == document + b"\0" + document + b"\0"
+    assert "document 1: RuntimeError: broken pass" in capsys.readouterr().err
+
+def test_patch_rejects_incremental_cache():
+    from incremental import IncrementalCache
+    with pytest.raises(ValueError, match="patch"):
+        optimize_source(SOURCE, cache=IncrementalCache(), patch=True)
+    with pytest.raises(ValueError, match="patch"):
+        run_stream(io.BytesIO(SOURCE.encode()), io.BytesIO(), "nul", cache=IncrementalCache(), patch=True)
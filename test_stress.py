@@ -0,0 +1,43 @@
+from ouroboros import optimize
+from ast_helpers import fingerprint
+from bench_stress import get_nested_ifs, get_nested_fors, get_wrapped_loops, get_long_expression
+import ast
+import sys
+
+#Deeper than the recursion limit
+DEPTH = sys.getrecursionlimit() + 100
+
+def get_innermost_block(t, node_type):
+    block = t.body[0].body
+    while any(isinstance(statement, node_type) for statement in block):
+        block = next(statement for statement in block if isinstance(statement, node_type)).body
+    return block
+
+def test_deeply_nested_ifs():
+    t = optimize(get_nested_ifs(DEPTH))
+
+    innermost = get_innermost_block(t, ast.If)
+    assert [statement.targets[0].id for statement in innermost] == ["y"]
+
+def test_deeply_nested_fors():
+    t = optimize(get_nested_fors(DEPTH))
+
+    innermost = get_innermost_block(t, ast.For)
+    assert [type(statement) for statement in innermost] == [ast.AugAssign]
+
+def test_deeply_wrapped_loops():
+    t = optimize(get_wrapped_loops(DEPTH))
+
+    #Every loop, in every kind of block, had its invariant hoisted
+    loops = [node for node in ast.walk(t) if isinstance(node, ast.For)]
+    assert len(loops) == DEPTH + 1
+    assert all([type(statement) for statement in loop.body] == [ast.AugAssign] for loop in loops)
+
+def test_long_expression():
+    t = get_long_expression(100000)
+    expected = fingerprint(t.body[0].body[0])
+
+    t = optimize(t)
+
+    assert [type(statement) for statement in t.body[0].body] == [ast.Assign, ast.Return]
+    assert fingerprint(t.body[0].body[0]) == expected
@@ -0,0 +1,157 @@
+import pytest
+import contextlib
+import io
+from ouroboros import rewrite_string_accumulation, optimize
+from ast_helpers import clean, ast_parse, ast_unparse
+import type_inference
+
+def test_rewrite_string_accumulation(monkeypatch):
+    monkeypatch.setattr(type_inference, "TRUST_TYPE_HINTS", True)
+    source = """
+        def render(rows, sep: str):
+            out = "<table>"
+            for row in rows:
+                out += "<tr>"
+                for cell in row:
+                    out += f"<td>{cell}</td>"
+                out = out + "</tr>" + sep
+            out += "</table>"
+            return out
+        """
+    t = ast_parse(source)
+
+    result = ast_unparse(rewrite_string_accumulation(t))
+
+    assert result == clean("""
+        def render(rows, sep: str):
+            out = '<table>'
+            __o_parts_out_3_4 = [out]
+            for row in rows:
+                __o_parts_out_3_4.append('<tr>')
+                for cell in row:
+                    __o_parts_out_3_4.append(f'<td>{cell}</td>')
+                __o_parts_out_3_4.extend(('</tr>', sep))
+            out = ''.join(__o_parts_out_3_4)
+            out += '</table>'
+            return out
+        """)
+    original = {}
+    rewritten = {}
+    exec(compile(ast_parse(source), "<test>", "exec"), original)
+    exec(compile(t, "<test>", "exec"), rewritten)
+    for rows in ([], [[1, 2], [3]]):
+        assert original["render"](rows, "\n") == rewritten["render"](rows, "\n")
+
+def test_rewrite_while_accumulation():
+    t = ast_parse("""
+        def digits(n: int):
+            s = ""
+            while n:
+                s = s + str(n % 10)
+                n //= 10
+            return s
+        """)
+
+    result = ast_unparse(rewrite_string_accumulation(t))
+
+    assert result == clean("""
+        def digits(n: int):
+            s = ''
+            __o_parts_s_3_4 = [s]
+            while n:
+                __o_parts_s_3_4.append(str(n % 10))
+                n //= 10
+            s = ''.join(__o_parts_s_3_4)
+            return s
+        """)
+
+def test_string_accumulation_left_alone():
+    source = """
+        def f(xs, prefix):
+            a = ""
+            for x in xs:
+                a += x
+            b = prefix
+            for x in xs:
+                b += str(x)
+            c = ""
+            for x in xs:
+                c += str(x)
+                print(len(c))
+            d = 0
+            for x in xs:
+                d += len(str(x))
+            e = ""
+            for x in xs:
+                try:
+                    e += str(x)
+                except ValueError:
+                    pass
+            g = ""
+            for x in xs:
+                g += str(x)
+            def inner():
+                return g
+            return a, b, c, d, e, inner
+        """
+
+    result = ast_unparse(rewrite_string_accumulation(ast_parse(source)))
+
+    #The pieces or the accumulator have no known type, the accumulator is read
+    #in the loop, is an int, is assigned in a try or is read by a closure
+    assert result == ast_unparse(ast_parse(source))
+
+def test_remove_keeps_appended_parts():
+    t = ast_parse("""
+        def f(xs):
+            unused = 1
+            s = ""
+            for x in xs:
+                s += str(x)
+            return s
+        """)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ast_unparse(optimize(t, passes=("join", "remove")))
+
+    assert result == clean("""
+        def f(xs):
+            s = ''
+            __o_parts_s_4_4 = [s]
+            for x in xs:
+                __o_parts_s_4_4.append(str(x))
+            s = ''.join(__o_parts_s_4_4)
+            return s
+        """)
+
+def test_remove_keeps_names_of_appended_expressions():
+    source = """
+        def f(xs, r):
+            s = ""
+            for p in xs:
+                k = p + 1
+                r.append(p * k)
+                s += str(p) + ","
+            return s
+        """
+    t = ast_parse(source)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        t = optimize(t, passes=("join", "remove"))
+
+    assert ast_unparse(t) == clean("""
+        def f(xs, r):
+            s = ''
+            __o_parts_s_3_4 = [s]
+            for p in xs:
+                k = p + 1
+                r.append(p * k)
+                __o_parts_s_3_4.append(str(p) + ',')
+            s = ''.join(__o_parts_s_3_4)
+            return s
+        """)
+    original = {}
+    rewritten = {}
+    exec(compile(ast_parse(source), "<test>", "exec"), original)
+    exec(compile(t, "<test>", "exec"), rewritten)
+    assert original["f"]([1, 2], []) == rewritten["f"]([1, 2], [])
@@ -0,0 +1,80 @@
+import pytest
+from ouroboros import optimize
+from type_inference import infer_types
+import type_inference
+from def_use import clear_summaries
+from ast_helpers import clean, ast_parse, ast_unparse
+import ast
+
+def get_returned_type(source):
+    function = ast_parse(source).body[0]
+    types = infer_types(function)
+    returned = [node for node in ast.walk(function) if isinstance(node, ast.Return)][-1]
+    returned_type = types.get_type(returned.value)
+    clear_summaries()
+    return returned_type
+
+def test_flow_sensitive_types():
+    assert get_returned_type("""
+        def foo(a):
+            n = len(a)
+            for i in range(n):
+                n = n + i * 2
+            return n
+        """) is int
+    assert get_returned_type("""
+        def foo(a):
+            x = 1
+            if a:
+                x = "one"
+            return x
+        """) is None
+    assert get_returned_type("""
+        def foo(a):
+            x = 1
+            x = x / 2
+            return x
+        """) is float
+
+def test_hints_and_shadowed_builtins(monkeypatch):
+    #An annotation or a guard can name a base class, they are not trusted by default
+    assert get_returned_type("""
+        def foo(a: list, b):
+            if isinstance(b, str):
+                return b
+        """) is None
+
+    monkeypatch.setattr(type_inference, "TRUST_TYPE_HINTS", True)
+    assert get_returned_type("""
+        def foo(a: list, b):
+            if isinstance(b, str):
+                return b
+        """) is str
+    assert get_returned_type("""
+        def foo(a: list, b):
+            return a
+        """) is list
+    assert get_returned_type("""
+        def foo(a, len):
+            return len(a)
+        """) is None
+
+def test_specialize_square():
+    t = ast_parse("""
+        def foo(a, x: float):
+            total = 0
+            for i in range(len(a)):
+                total = total + i ** 2 + x ** 2
+            return total
+        """)
+
+    t = optimize(t, passes=("specialize",))
+
+    expected = clean("""
+        def foo(a, x: float):
+            total = 0
+            for i in range(len(a)):
+                total = total + i * i + x ** 2
+            return total
+        """)
+    assert ast_unparse(t) == expected
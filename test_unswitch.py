@@ -0,0 +1,126 @@
+import pytest
+import unswitch_loops_helpers
+from ouroboros import unswitch_loops
+from ast_helpers import clean, ast_parse, ast_unparse
+
+def test_unswitch_invariant_if():
+    t = ast_parse("""
+        def f(xs, mode, scale):
+            total = 0
+            for x in xs:
+                y = x * 2
+                if mode == "fast":
+                    total += y
+                elif scale:
+                    total += y * scale
+            return total
+        """)
+
+    result = ast_unparse(unswitch_loops(t))
+
+    assert result == clean("""
+        def f(xs, mode, scale):
+            total = 0
+            if mode == 'fast':
+                for x in xs:
+                    y = x * 2
+                    total += y
+            elif scale:
+                for x in xs:
+                    y = x * 2
+                    total += y * scale
+            else:
+                for x in xs:
+                    y = x * 2
+            return total
+        """)
+    namespace = {}
+    exec(compile(t, "<test>", "exec"), namespace)
+    assert [namespace["f"]([1, 2], mode, 3) for mode in ("fast", "slow")] == [6, 18]
+
+def test_unswitch_keeps_variant_tests():
+    source = clean("""
+        mode = None
+        def f(xs, cfg, flag):
+            for x in xs:
+                if x > 1:
+                    flag = x
+            for x in xs:
+                if flag:
+                    flag = not flag
+            for x in xs:
+                if cfg.on:
+                    cfg.count = x
+            for x in xs:
+                if mode:
+                    g(x)
+            for x in xs:
+                if h(flag):
+                    pass
+            def inner():
+                nonlocal flag
+                flag = False
+            for x in xs:
+                if flag:
+                    inner()
+        """)
+
+    result = ast_unparse(unswitch_loops(ast_parse(source)))
+
+    assert result == ast_unparse(ast_parse(source))
+
+def test_unswitch_loop_with_effects():
+    source = """
+        def f(xs, d, out, mode):
+            for x in xs:
+                if d:
+                    out.append(x)
+                    d.clear()
+            for x in xs:
+                if len(d) > 1 or mode == "fast":
+                    out.append(x)
+        """
+
+    #The calls can change d, and mode may be a mutable object
+    assert ast_unparse(unswitch_loops(ast_parse(source))) == ast_unparse(ast_parse(source))
+
+    t = ast_parse("""
+        def f(xs, out, mode):
+            limit = 3
+            for x in xs:
+                if mode is None and limit > 1:
+                    out.append(x)
+        """)
+
+    result = ast_unparse(unswitch_loops(t))
+
+    assert result.startswith(clean("""
+        def f(xs, out, mode):
+            limit = 3
+            if mode is None and limit > 1:
+                for x in xs:
+                    out.append(x)
+        """))
+
+def test_unswitch_budget(monkeypatch):
+    source = """
+        def f(xs, a, b):
+            total = 0
+            for x in xs:
+                if a:
+                    total += x
+                if b:
+                    total -= x
+            return total
+        """
+
+    result = ast_unparse(unswitch_loops(ast_parse(source)))
+
+    #Both tests are unswitched, in four copies of the loop
+    assert result.count("for x in xs") == 4
+    assert "if a" not in result.split("for x in xs")[1]
+
+    monkeypatch.setattr(unswitch_loops_helpers, "UNSWITCH_BUDGET", 36)
+    result = ast_unparse(unswitch_loops(ast_parse(source)))
+
+    assert result.count("for x in xs") == 2
@@ -0,0 +1,56 @@
+import pytest
+from watch import Watcher
+from ouroboros import get_optimized_path
+from ast_helpers import clean
+import os
+
+def test_optimized_path_with_dots():
+    assert get_optimized_path("/tmp/my.project/foo.py") == "/tmp/my.project/foo_optimized.py"
+
+def test_watch_emits_on_change(tmp_path):
+    script = tmp_path / "foo.py"
+    script.write_text(clean("""
+        def foo():
+            a = 10
+            b = 0
+            return a
+        print(foo())
+        """))
+
+    watcher = Watcher([script], persistent_cache=False)
+    assert len(watcher.poll()) == 1
+    assert watcher.poll() == []
+
+    output = tmp_path / "foo_optimized.py"
+    assert "b = 0" not in output.read_text()
+
+    script.write_text(clean("""
+        def foo():
+            a = 10
+            b = 0
+            return a + b
+        print(foo())
+        """))
+    os.utime(script, ns=(1, 1))
+
+    assert len(watcher.poll()) == 1
+    assert "b = 0" in output.read_text()
+    # foo was edited, the module-level print is reused from memory
+    assert watcher.files[0].cache.hits == 1
+
+def test_watch_survives_optimizer_errors(tmp_path, monkeypatch, capsys):
+    import watch
+    script = tmp_path / "foo.py"
+    script.write_text("x = 1\n")
+
+    def fail(*args):
+        raise RecursionError("maximum recursion depth exceeded")
+    monkeypatch.setattr(watch, "optimize_incremental", fail)
+    watcher = Watcher([script], persistent_cache=False)
+    assert watcher.poll() == []
+    assert "foo.py: RecursionError" in capsys.readouterr().err
+
+    monkeypatch.undo()
+    script.write_text("x = 2\n")
+    os.utime(script, ns=(1, 1))
+    assert len(watcher.poll()) == 1
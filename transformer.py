@@ -1,5 +1,6 @@
 import ast
 from constant import *
+from def_use import get_summary
 
 known_pure = ["abs","aiter","all","any","anext","ascii","bin","bool","breakpoint","bytearray","bytes",
               "callable","chr","classmethod","compile","complex","delattr","dict","dir","divmod","enumerate",
@@ -9,15 +10,123 @@ known_pure = ["abs","aiter","all","any","anext","ascii","bin","bool","breakpoint
               "tuple","type","vars","zip","__import__","set","setattr","slice","sorted","staticmethod","str","sum",
               "super"]
 
+'''
+Returns the name of the called function, or of the object of the called method
+'''
+def get_function_name(call):
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    if isinstance(call.func, ast.Attribute) and isinstance(call.func.value, ast.Name):
+        return call.func.value.id
+    return ""
+
+'''
+Checks if the call is to a builtin known to be pure. A method call never is: the
+name of its object says nothing about the method, map.update() is not map()
+'''
+def check_if_call_pure(call):
+    return isinstance(call.func, ast.Name) and call.func.id in known_pure and call.func.id != "print"
+
+'''
+Checks if the assignment to the target is live: it stores into an attribute or
+an item (the object can be seen from elsewhere), or it assigns a dependent
+variable, itself or unpacked in a tuple or list
+'''
+def check_if_target_live(target, dependent_variables):
+    for node in ast.walk(target):
+        if isinstance(node, (ast.Attribute, ast.Subscript)) and isinstance(node.ctx, ast.Store):
+            return True
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store) and node.id in dependent_variables:
+            return True
+    return False
+
 class Transformer(ast.NodeTransformer):
-    def __init__(self, dependent_variable, flag):
+    #The fields that are never visited: the context managers of a with and the
+    #patterns and guards of a match decide what runs, they are always kept (see
+    #remove_useless_with() and remove_useless_match())
+    kept_fields = {ast.withitem: ("context_expr", "optional_vars"), ast.match_case: ("pattern", "guard")}
+
+    def __init__(self, dependent_variable, flag, nested_statements=True):
         self.dependent_variables = dependent_variable
+        #With nested_statements=False the statements below the visited node are
+        #not visited, only its own blocks and expressions
+        self.nested_statements = nested_statements
         """
         : flag = 0 => do nothing
         : flag = 1 => dependent variable
         : flag = 2 => pass
         """
         self.flag = flag
+        #The nodes whose subtree changed, see def_use.invalidate()
+        self.changed_nodes = []
+        self.changed = set()
+        self.parents = {}
+        self.visitors = {}
+
+    '''
+    Same as NodeTransformer.visit(), with an explicit stack instead of recursion so
+    deeply nested trees don't hit the recursion limit. The visit_ methods below
+    never visit the children of their node, so their subtrees are left alone, like
+    with NodeTransformer
+    '''
+    def visit(self, node):
+        method = self.get_visitor(node)
+        if method is not None:
+            return method(node)
+
+        stack = [node]
+        while stack:
+            parent_node = stack.pop()
+            kept_fields = self.kept_fields.get(type(parent_node), ())
+            for name, value in ast.iter_fields(parent_node):
+                if name in kept_fields:
+                    continue
+                if isinstance(value, list):
+                    new_values = []
+                    for item in value:
+                        if isinstance(item, ast.AST):
+                            item = self.visit_child(parent_node, item, stack)
+                            if item is None:
+                                continue
+                            elif not isinstance(item, ast.AST):
+                                new_values.extend(item)
+                                continue
+                        new_values.append(item)
+                    value[:] = new_values
+                elif isinstance(value, ast.AST):
+                    new_value = self.visit_child(parent_node, value, stack)
+                    if new_value is None:
+                        delattr(parent_node, name)
+                    else:
+                        setattr(parent_node, name, new_value)
+        return node
+
+    def get_visitor(self, node):
+        node_type = type(node)
+        if node_type not in self.visitors:
+            self.visitors[node_type] = getattr(self, "visit_" + node_type.__name__, None)
+        return self.visitors[node_type]
+
+    def visit_child(self, parent_node, node, stack):
+        self.parents[id(node)] = parent_node
+        method = self.get_visitor(node)
+        if method is None:
+            if self.nested_statements or not isinstance(node, ast.stmt):
+                stack.append(node)
+            return node
+        new_node = method(node)
+        if new_node is not node:
+            self.mark_changed(parent_node)
+        return new_node
+
+    '''
+    Records the node and its ancestors up to the visited node as changed
+    '''
+    def mark_changed(self, node):
+        while node is not None and id(node) not in self.changed:
+            self.changed.add(id(node))
+            self.changed_nodes.append(node)
+            node = self.parents.get(id(node))
 
     #Special case needed to handle deletion of For statements.
     #We see all blocks inside for and remove all assignment for
@@ -28,47 +137,48 @@ class Transformer(ast.NodeTransformer):
             for i in range(0,len(node.body)):
                 body = node.body[i]
                 if isinstance(body, ast.Assign):
-                    for target in body.targets:
-                        if isinstance(target, ast.Name):
-                            if target.id not in self.dependent_variables:
-                                remove_statement.append(i)
-                        elif isinstance(target, ast.Subscript):
-                            if target.value.id not in self.dependent_variables:
-                                remove_statement.append(i)
+                    if not any(check_if_target_live(target, self.dependent_variables) for target in body.targets):
+                        remove_statement.append(i)
                 elif isinstance(body, ast.AugAssign):
-                    target = body.target
-                    if target.id not in self.dependent_variables:
+                    if not check_if_target_live(body.target, self.dependent_variables):
                         remove_statement.append(i)
                 else:
                     pass
+            if remove_statement:
+                self.mark_changed(node)
             i = 0
             for item in remove_statement:
-                node.body.pop(item-i)
-                i = i+1
+                remaining = self.get_dead_store(node.body[item-i])
+                if remaining is None:
+                    node.body.pop(item-i)
+                    i = i+1
+                else:
+                    node.body[item-i] = remaining
             return node
         elif self.flag == TRANSFORMER_PASS:
             return None
         else:
             return node
 
+    visit_AsyncFor = visit_For
+
+    #An await is an effect, it is always kept with the expression it awaits
+    def visit_Await(self, node):
+        return node
+
+    #Returns what is left of a dead assignment: nothing, or the awaited value.
+    #An await is an effect, the coroutine is suspended and other tasks run
+    def get_dead_store(self, node):
+        if not get_summary(node).has_await:
+            return None
+        return ast.copy_location(ast.Expr(value=node.value), node)
+
     def visit_Assign(self, node):
         if self.flag == TRANSFORMER_DEPENDENT_VARIABLES:
-            target_found_in_dependant = False
-            for target in node.targets:
-                target_name = ""
-                if isinstance(target,ast.Name):
-                    target_name = target.id
-                elif isinstance(target,ast.Subscript):
-                    target_name = target.value.id
-
-                if target_name in self.dependent_variables:
-                    target_found_in_dependant = True
-                    break
-            
-            if target_found_in_dependant:
+            if any(check_if_target_live(target, self.dependent_variables) for target in node.targets):
                 return node
             else:
-                return None
+                return self.get_dead_store(node)
         elif self.flag == TRANSFORMER_PASS:
             return None
         else:
@@ -76,9 +186,8 @@ class Transformer(ast.NodeTransformer):
         
     def visit_AugAssign(self, node):
         if self.flag == TRANSFORMER_DEPENDENT_VARIABLES:
-            target = node.target.id
-            if target not in self.dependent_variables:
-                return None
+            if not check_if_target_live(node.target, self.dependent_variables):
+                return self.get_dead_store(node)
             else:
                 return node
         elif self.flag == TRANSFORMER_PASS:
@@ -90,8 +199,7 @@ class Transformer(ast.NodeTransformer):
     def visit_Call(self,node):
         #check if function is pure or not. If pure and dependent variables
         #are not present, can delete the call
-        function_name = node.func.id
-        if function_name in known_pure and function_name !="print":
+        if check_if_call_pure(node):
             keep_statement = False
             for argument in node.args:
                 if argument in self.dependent_variables:
@@ -109,7 +217,7 @@ class Transformer(ast.NodeTransformer):
             if target.id not in self.dependent_variables:
                 return None
         elif isinstance(target, ast.Call):
-            if target.func.id not in self.dependent_variables:
+            if get_function_name(target) not in self.dependent_variables:
                 return None
         return node
     
@@ -118,8 +226,7 @@ class Transformer(ast.NodeTransformer):
             value = node.value
             if isinstance(value,ast.Call):
                 #self.visit_Call(value)
-                function_name = value.func.id
-                if function_name in known_pure and function_name !="print":
+                if check_if_call_pure(value):
                     keep_statement = False
                     for argument in value.args:
                         if argument in self.dependent_variables:
@@ -138,7 +245,7 @@ class Transformer(ast.NodeTransformer):
             elif isinstance(value, ast.ListComp):
                 target = value.elt
                 if isinstance(target, ast.Call):
-                    new_target = target.func.id
+                    new_target = get_function_name(target)
                     if new_target not in self.dependent_variables:
                         return None
                     else:
@@ -151,6 +258,8 @@ class Transformer(ast.NodeTransformer):
                         return node
                 else:
                     return None
+            elif isinstance(value, ast.Await):
+                return node
             else:
                 return None
             
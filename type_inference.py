@@ -0,0 +1,380 @@
+'''
+Flow-sensitive local type inference, built on the SSA form of the function (see
+ssa.py), so every version of a variable has its own type.
+
+The types are the builtin classes (int, float, str, list...). They are seeded
+from
+
+    - literals and displays: 1 is an int, [x] is a list, f"{x}" is a str
+    - the results of the operators on known types: int + int is an int,
+      int / int is a float, a comparison of builtin scalars is a bool
+    - the calls of the builtins with a known return type (len() is an int...),
+      as long as the name is not bound in the function or the module
+    - the annotations of the arguments and of the annotated assignments
+    - isinstance(x, T) guards, which narrow the loads of x in the body of the
+      if (and of the while) they guard
+
+and propagated through the copies and the phis until nothing changes. A phi
+merging different types, or a version of unknown type, has no type.
+
+The annotations and the guards say "T or a subclass of T", they are trusted
+to mean T when TRUST_TYPE_HINTS is set. Names read by nested scopes can be
+rebound there (nonlocal), they never have a type.
+'''
+
+import ast
+
+from constant import TRUST_TYPE_HINTS
+from ssa import build_ssa, get_assigned_value, get_bound_names, UNDEFINED, NESTED_SCOPE_TYPES
+
+#The return types of the builtins
+BUILTIN_RETURN_TYPES = {
+    "len": int, "hash": int, "id": int, "ord": int, "int": int,
+    "float": float,
+    "bool": bool, "isinstance": bool, "issubclass": bool, "callable": bool,
+    "str": str, "repr": str, "ascii": str, "chr": str, "hex": str, "oct": str, "bin": str, "format": str,
+    "bytes": bytes,
+    "list": list, "sorted": list,
+    "dict": dict,
+    "set": set,
+    "frozenset": frozenset,
+    "tuple": tuple,
+    "range": range,
+}
+
+#The builtin classes that can appear in annotations and isinstance() guards
+BUILTIN_TYPES = {
+    "int": int, "float": float, "complex": complex, "bool": bool, "str": str, "bytes": bytes,
+    "list": list, "dict": dict, "set": set, "frozenset": frozenset, "tuple": tuple,
+}
+
+#The methods of str that return a str, and the ones that return a list
+STR_METHODS = {
+    "join": str, "upper": str, "lower": str, "strip": str, "lstrip": str, "rstrip": str,
+    "replace": str, "format": str, "capitalize": str, "title": str,
+    "split": list, "rsplit": list, "splitlines": list,
+}
+
+INTEGER_TYPES = (int, bool)
+NUMBER_TYPES = (int, bool, float)
+SCALAR_TYPES = (int, bool, float, str, bytes)
+INTEGER_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.LShift, ast.RShift,
+                     ast.BitOr, ast.BitAnd, ast.BitXor)
+FLOAT_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+IDENTITY_OPERATORS = (ast.Is, ast.IsNot, ast.In, ast.NotIn)
+
+#The lattice of the definitions: not known yet, no single type
+UNKNOWN = object()
+VARYING = object()
+
+
+def join_types(first, second):
+    if first is UNKNOWN:
+        return second
+    if second is UNKNOWN or first is second:
+        return first
+    return VARYING
+
+
+'''
+Returns the type of left <operator> right, None if it is not known
+'''
+def get_binary_operation_type(left, operator, right, right_node):
+    if left in INTEGER_TYPES and right in INTEGER_TYPES:
+        if isinstance(operator, (ast.BitOr, ast.BitAnd, ast.BitXor)) and left is bool and right is bool:
+            return bool
+        if isinstance(operator, INTEGER_OPERATORS):
+            return int
+        if isinstance(operator, ast.Div):
+            return float
+        #A negative exponent gives a float
+        if isinstance(operator, ast.Pow) and isinstance(right_node, ast.Constant) and right_node.value >= 0:
+            return int
+        return None
+    if left in NUMBER_TYPES and right in NUMBER_TYPES:
+        return float if isinstance(operator, FLOAT_OPERATORS) else None
+    if isinstance(operator, ast.Mod) and left is str:
+        return str
+    if isinstance(operator, ast.Add) and left is right and left in (str, bytes, list, tuple):
+        return left
+    if isinstance(operator, ast.Mult):
+        if left in (str, bytes, list, tuple) and right in INTEGER_TYPES:
+            return left
+        if left in INTEGER_TYPES and right in (str, bytes, list, tuple):
+            return right
+    return None
+
+
+'''
+Returns the builtin class named by the annotation or the isinstance() argument
+'''
+def get_hint_type(node):
+    #list[int] is a list
+    if isinstance(node, ast.Subscript):
+        node = node.value
+    if isinstance(node, ast.Name):
+        return BUILTIN_TYPES.get(node.id)
+    if isinstance(node, ast.Tuple) and len(node.elts) == 1:
+        return get_hint_type(node.elts[0])
+    return None
+
+
+class TypeInfo:
+    def __init__(self, function, module_names=frozenset()):
+        self.function = function
+        self.ssa = build_ssa(function)
+        #Names that don't refer to the builtins in this function
+        self.shadowed = set(module_names) | self.ssa.outer_names | \
+            {definition.name for definition in self.ssa.definitions}
+        #id(Name) -> type given by an isinstance() guard
+        self.narrowed = {}
+        self.types = [UNKNOWN] * len(self.ssa.definitions)
+        #id(expression) -> its type, once the types of the definitions are known
+        self.expression_types = {}
+
+        if TRUST_TYPE_HINTS:
+            self.narrow_guarded_loads()
+        self.infer_definitions()
+
+    def is_builtin(self, name):
+        return name not in self.shadowed
+
+    '''
+    Returns the (Name, type) pairs of the isinstance(x, T) guards of the test,
+    including the ones joined by and
+    '''
+    def get_guards(self, test):
+        guards = []
+        tests = [test]
+        while tests:
+            test = tests.pop()
+            if isinstance(test, ast.BoolOp) and isinstance(test.op, ast.And):
+                tests.extend(test.values)
+            elif isinstance(test, ast.Call) and isinstance(test.func, ast.Name) and test.func.id == "isinstance" \
+                    and self.is_builtin("isinstance") and len(test.args) == 2 and not test.keywords \
+                    and isinstance(test.args[0], ast.Name):
+                hint = get_hint_type(test.args[1])
+                if hint is not None and self.is_builtin(hint.__name__):
+                    guards.append((test.args[0], hint))
+        return guards
+
+    def narrow_guarded_loads(self):
+        stack = list(self.function.body)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NESTED_SCOPE_TYPES):
+                continue
+            if isinstance(node, (ast.If, ast.While)):
+                body_nodes = None
+                for name, hint in self.get_guards(node.test):
+                    definition = self.ssa.reaching.get(id(name), UNDEFINED)
+                    if definition == UNDEFINED:
+                        continue
+                    if body_nodes is None:
+                        body_nodes = {id(child_node) for statement in node.body for child_node in ast.walk(statement)}
+                    #The loads in the body that read the guarded version
+                    for use in self.ssa.definitions[definition].uses:
+                        if id(use) in body_nodes:
+                            self.narrowed[id(use)] = hint
+            stack.extend(ast.iter_child_nodes(node))
+
+    '''
+    Returns the type of the version defined by the definition
+    '''
+    def get_definition_type(self, index):
+        definition = self.ssa.definitions[index]
+        if definition.name in self.ssa.captured:
+            return VARYING
+        if definition.is_phi():
+            result = UNKNOWN
+            for operand in definition.operands:
+                #An unbound version raises when it is loaded
+                if operand != UNDEFINED:
+                    result = join_types(result, self.types[operand])
+            return result
+
+        node = definition.node
+        statement = definition.statement
+        if isinstance(node, ast.arg):
+            hint = get_hint_type(node.annotation) if TRUST_TYPE_HINTS and node.annotation else None
+            return hint or VARYING
+        if isinstance(statement, ast.AnnAssign) and TRUST_TYPE_HINTS:
+            hint = get_hint_type(statement.annotation)
+            if hint is not None:
+                return hint
+        value = get_assigned_value(definition)
+        if value is None and isinstance(statement, ast.AnnAssign) and statement.target is node:
+            value = statement.value
+        if value is not None:
+            if self.reads_unknown(value):
+                return UNKNOWN
+            return self.compute_type(value) or VARYING
+        if isinstance(statement, ast.AugAssign) and statement.target is node:
+            operand = self.ssa.reaching.get(id(node), UNDEFINED)
+            left = self.types[operand] if operand != UNDEFINED else VARYING
+            if left is UNKNOWN or self.reads_unknown(statement.value):
+                return UNKNOWN
+            right = self.compute_type(statement.value)
+            if left is VARYING or right is None:
+                return VARYING
+            return get_binary_operation_type(left, statement.op, right, statement.value) or VARYING
+        if isinstance(statement, (ast.For, ast.AsyncFor)) and statement.target is node:
+            iterator = statement.iter
+            if isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Name) and \
+                    iterator.func.id == "range" and self.is_builtin("range"):
+                return int
+            if self.compute_type(iterator) is str:
+                return str
+        return VARYING
+
+    '''
+    Checks if the expression reads a version whose type is not known yet
+    '''
+    def reads_unknown(self, node):
+        for child_node in ast.walk(node):
+            operand = self.ssa.reaching.get(id(child_node), UNDEFINED)
+            if operand != UNDEFINED and self.types[operand] is UNKNOWN and id(child_node) not in self.narrowed:
+                return True
+        return False
+
+    '''
+    Computes the types of the definitions, optimistically: every definition is
+    looked at again when the type of a version it reads changes
+    '''
+    def infer_definitions(self):
+        users = [list(definition.phi_users) for definition in self.ssa.definitions]
+        for index, definition in enumerate(self.ssa.definitions):
+            if definition.is_phi():
+                continue
+            statement = definition.statement
+            read_nodes = []
+            if isinstance(statement, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+                read_nodes = [statement.value] if statement.value is not None else []
+                if isinstance(statement, ast.AugAssign):
+                    read_nodes.append(statement.target)
+            elif isinstance(statement, (ast.For, ast.AsyncFor)):
+                read_nodes = [statement.iter]
+            for read_node in read_nodes:
+                for child_node in ast.walk(read_node):
+                    operand = self.ssa.reaching.get(id(child_node), UNDEFINED)
+                    if operand != UNDEFINED:
+                        users[operand].append(index)
+
+        worklist = list(range(len(self.ssa.definitions) - 1, -1, -1))
+        while worklist:
+            index = worklist.pop()
+            new_type = join_types(self.types[index], self.get_definition_type(index))
+            if new_type is self.types[index]:
+                continue
+            self.types[index] = new_type
+            worklist.extend(users[index])
+        self.expression_types.clear()
+
+    '''
+    Returns the type of the expression, or None. The expression is walked
+    bottom-up with an explicit stack
+    '''
+    def compute_type(self, node):
+        types = {}
+        stack = [(node, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if id(current) in self.expression_types:
+                types[id(current)] = self.expression_types[id(current)]
+                continue
+            if not children_done:
+                stack.append((current, True))
+                if isinstance(current, (ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+                                        ast.Subscript, ast.Call, ast.Attribute)):
+                    for child_node in ast.iter_child_nodes(current):
+                        if isinstance(child_node, ast.expr):
+                            stack.append((child_node, False))
+                continue
+            types[id(current)] = self.get_node_type(current, types)
+        return types[id(node)]
+
+    def get_node_type(self, node, types):
+        if isinstance(node, ast.Constant):
+            return type(node.value)
+        if isinstance(node, ast.JoinedStr):
+            return str
+        if isinstance(node, (ast.List, ast.ListComp)):
+            return list
+        if isinstance(node, (ast.Dict, ast.DictComp)):
+            return dict
+        if isinstance(node, (ast.Set, ast.SetComp)):
+            return set
+        if isinstance(node, ast.Tuple):
+            return tuple
+        if isinstance(node, ast.Name):
+            if id(node) in self.narrowed:
+                return self.narrowed[id(node)]
+            definition = self.ssa.reaching.get(id(node), UNDEFINED)
+            if definition == UNDEFINED:
+                return None
+            definition_type = self.types[definition]
+            return None if definition_type is UNKNOWN or definition_type is VARYING else definition_type
+        if isinstance(node, ast.BinOp):
+            left = types.get(id(node.left))
+            right = types.get(id(node.right))
+            if left is None or right is None:
+                return None
+            return get_binary_operation_type(left, node.op, right, node.right)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return bool
+            operand = types.get(id(node.operand))
+            if isinstance(node.op, ast.Invert):
+                return int if operand in INTEGER_TYPES else None
+            if operand in INTEGER_TYPES:
+                return int
+            return float if operand is float else None
+        if isinstance(node, ast.Compare):
+            if all(isinstance(operator, IDENTITY_OPERATORS) for operator in node.ops):
+                return bool
+            operands = [types.get(id(node.left))] + [types.get(id(comparator)) for comparator in node.comparators]
+            return bool if all(operand in SCALAR_TYPES for operand in operands) else None
+        if isinstance(node, ast.BoolOp):
+            operands = [types.get(id(value)) for value in node.values]
+            return operands[0] if all(operand is operands[0] for operand in operands) else None
+        if isinstance(node, ast.IfExp):
+            body = types.get(id(node.body))
+            return body if body is types.get(id(node.orelse)) else None
+        if isinstance(node, ast.Subscript):
+            value = types.get(id(node.value))
+            if value is str:
+                return str
+            if value in (list, tuple, bytes) and isinstance(node.slice, ast.Slice):
+                return value
+            return None
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and self.is_builtin(node.func.id):
+                return BUILTIN_RETURN_TYPES.get(node.func.id)
+            if isinstance(node.func, ast.Attribute) and types.get(id(node.func.value)) is str:
+                return STR_METHODS.get(node.func.attr)
+            return None
+        return None
+
+    '''
+    Returns the type of the expression of the function, or None if it is not
+    known
+    '''
+    def get_type(self, node):
+        node_type = self.compute_type(node)
+        self.expression_types[id(node)] = node_type
+        return node_type
+
+
+'''
+Infers the types of the function. module_names are the names bound at the top
+level of its module, which shadow the builtins
+'''
+def infer_types(function, module_names=frozenset()):
+    return TypeInfo(function, module_names)
+
+
+'''
+Returns the names bound at the top level of the module
+'''
+def get_module_names(tree):
+    return get_bound_names(tree.body) if isinstance(tree, ast.Module) else set()
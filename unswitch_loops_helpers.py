@@ -0,0 +1,159 @@
+'''
+All the helper functions needed by unswitch_loops()
+'''
+
+import ast
+
+from ast_helpers import copy_tree
+from constant import UNSWITCH_BUDGET
+from def_use import get_summary, invalidate
+from hoist_invariants_helpers import COMPREHENSION_TYPES, check_if_safe_across_await
+from type_inference import infer_types
+
+LOOP_TYPES = (ast.For, ast.AsyncFor, ast.While)
+
+#The values no code can change in place
+IMMUTABLE_TYPES = (int, bool, float, complex, str, bytes, type(None))
+
+#The tests that are never moved out of their loop: they have effects of their
+#own, or their own scope
+UNSWITCH_UNSAFE_TYPES = (ast.Call, ast.Await, ast.Yield, ast.YieldFrom, ast.NamedExpr,
+                         ast.Lambda) + COMPREHENSION_TYPES
+
+'''
+Returns the size of the node: the number of statements and expressions in it
+'''
+def get_size(node):
+    return sum(1 for child_node in ast.walk(node) if isinstance(child_node, (ast.stmt, ast.expr)))
+
+'''
+Checks if the loop can change what a test reads without assigning its names:
+it calls something, awaits or yields (other code runs), or stores into an
+attribute or a subscript
+'''
+def check_if_loop_has_effects(loop):
+    summary = get_summary(loop)
+    if summary.calls or summary.has_await:
+        return True
+    for child_node in ast.walk(loop):
+        if isinstance(child_node, (ast.Yield, ast.YieldFrom)):
+            return True
+        if isinstance(child_node, (ast.Attribute, ast.Subscript)) and not isinstance(child_node.ctx, ast.Load):
+            return True
+    return False
+
+'''
+Checks if the test only reads values that no code can change in place, with
+the types of the function (or None for the module): the names it compares by
+identity (is, is not), and the names of an immutable builtin type. Any other
+local name can alias a list or an object that a call changes
+'''
+def check_if_test_immutable(test, types):
+    identity_operands = set()
+    for child_node in ast.walk(test):
+        if isinstance(child_node, ast.Compare) and all(isinstance(operator, (ast.Is, ast.IsNot))
+                                                       for operator in child_node.ops):
+            identity_operands.update(id(operand) for operand in [child_node.left] + child_node.comparators)
+    for child_node in ast.walk(test):
+        if isinstance(child_node, ast.Name) and id(child_node) not in identity_operands and \
+                (types is None or types.get_type(child_node) not in IMMUTABLE_TYPES):
+            return False
+    return True
+
+'''
+Checks if the test of an if statement of the loop is invariant: like for
+check_invariant_statements_for() and check_invariant_statements_while(), none
+of the variables it reads are assigned in the loop (its target and iterable, or
+its test, included). A loop with effects can also change the globals, the
+closure cells, the attributes and items, and the objects the locals refer to,
+so the test must then only read local_names, and only their immutable values
+(see check_if_test_immutable())
+'''
+def check_if_test_invariant(test, loop, local_names, loop_has_effects, types):
+    for child_node in ast.walk(test):
+        if isinstance(child_node, UNSWITCH_UNSAFE_TYPES):
+            return False
+    if get_summary(test).reads & get_summary(loop).writes:
+        return False
+    if loop_has_effects and not (check_if_safe_across_await(test, local_names) and
+                                 check_if_test_immutable(test, types)):
+        return False
+    return True
+
+'''
+Returns the types of the function, inferred once per version of the function
+(types maps id(function) to them), or None for the module
+'''
+def get_function_types(function, module_names, types):
+    if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return None
+    if id(function) not in types:
+        types[id(function)] = infer_types(function, module_names)
+    return types[id(function)]
+
+'''
+Returns the position of the first if statement of the loop body with an
+invariant test, or None. function is the function (or module) of the loop
+'''
+def get_invariant_if(loop, function, local_names, module_names, types):
+    loop_has_effects = None
+    for position, statement in enumerate(loop.body):
+        if not isinstance(statement, ast.If):
+            continue
+        if loop_has_effects is None:
+            loop_has_effects = check_if_loop_has_effects(loop)
+        function_types = get_function_types(function, module_names, types) if loop_has_effects else None
+        if check_if_test_invariant(statement.test, loop, local_names, loop_has_effects, function_types):
+            return position
+    return None
+
+'''
+Replaces the if statement at position in the loop by its branches, in a copy of
+the loop per branch. Returns the if statement choosing between the copies:
+
+    for x in xs:                if test:
+        a(x)                        for x in xs:
+        if test:                        a(x)
+            b(x)          =>            b(x)
+        else:                       else:
+            c(x)                        for x in xs:
+                                            a(x)
+                                            c(x)
+'''
+def unswitch_loop(loop, position):
+    branch = loop.body[position]
+    else_loop = copy_tree(loop)
+    loop.body[position:position + 1] = branch.body
+    else_loop.body[position:position + 1] = else_loop.body[position].orelse
+    if not else_loop.body:
+        else_loop.body = [ast.copy_location(ast.Pass(), branch)]
+    invalidate(loop)
+    return ast.copy_location(ast.If(test=branch.test, body=[loop], orelse=[else_loop]), loop)
+
+'''
+Unswitches the loops of the block, in place. function is the function (or
+module) of the block and sizes its size so far, per function: a loop is only
+copied while the function stays within UNSWITCH_BUDGET. types caches the types
+of the functions, module_names are the names bound by the module. The copies
+are unswitched again when their if statement is visited. Returns True if the
+block changed
+'''
+def unswitch_block(block, function, local_names, sizes, module_names, types):
+    changed = False
+    for position, statement in enumerate(block):
+        if not isinstance(statement, LOOP_TYPES):
+            continue
+        branch_position = get_invariant_if(statement, function, local_names, module_names, types)
+        if branch_position is None:
+            continue
+        if id(function) not in sizes:
+            sizes[id(function)] = get_size(function)
+        loop_size = get_size(statement)
+        if sizes[id(function)] + loop_size > UNSWITCH_BUDGET:
+            continue
+        sizes[id(function)] = sizes[id(function)] + loop_size
+        block[position] = unswitch_loop(statement, branch_position)
+        #The copies are new nodes, the types are inferred again
+        types.pop(id(function), None)
+        changed = True
+    return changed
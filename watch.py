@@ -0,0 +1,114 @@
+'''
+Watch mode. Polls the given scripts with os.stat() and re-emits the
+<script>_optimized.py file as soon as one of them is saved.
+
+The process stays alive between edits, so the imports are paid once, and every
+watched file keeps its last source and an in-memory IncrementalCache. An edit
+only re-parses the changed file and re-optimizes the units that changed.
+'''
+
+import ast
+import os
+import sys
+import time
+
+from constant import WATCH_INTERVAL
+from incremental import IncrementalCache, get_default_cache_path, optimize_incremental
+from ouroboros import DEFAULT_PASSES, get_optimized_path
+
+
+class WatchedFile:
+    def __init__(self, path, persistent_cache=True):
+        self.path = str(path)
+        self.output_path = get_optimized_path(self.path)
+        self.stat = None
+        self.source = None
+        self.elapsed = 0
+        cache_path = get_default_cache_path(self.path) if persistent_cache else None
+        self.cache = IncrementalCache(cache_path)
+
+    '''
+    Returns True if the stat of the file changed since the last poll
+    '''
+    def check_stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self.stat:
+            return False
+        self.stat = stat
+        return True
+
+    '''
+    Re-reads the file and emits the optimized version. Returns False if the
+    source did not actually change, or can't be read, parsed or optimized: the
+    error is reported and the file is emitted again on its next change
+    '''
+    def emit(self, passes, fixed_point):
+        start = time.perf_counter()
+        try:
+            with open(self.path, "r") as f:
+                source = f.read()
+        except OSError as e:
+            print(f"{self.path}: {e}", file=sys.stderr)
+            return False
+        if source == self.source:
+            return False
+        self.source = source
+
+        try:
+            t = ast.parse(source)
+            t = optimize_incremental(t, self.cache, passes, fixed_point)
+        except SyntaxError as e:
+            print(f"{self.path}: {e}", file=sys.stderr)
+            return False
+        except Exception as e:
+            print(f"{self.path}: {type(e).__name__}: {e}", file=sys.stderr)
+            return False
+        self.cache.prune()
+
+        with open(self.output_path, "w") as f:
+            f.write(ast.unparse(t) + "\n")
+        self.elapsed = time.perf_counter() - start
+        return True
+
+
+class Watcher:
+    def __init__(self, paths, passes=DEFAULT_PASSES, fixed_point=True, persistent_cache=True):
+        self.passes = passes
+        self.fixed_point = fixed_point
+        self.files = [WatchedFile(path, persistent_cache) for path in paths]
+
+    '''
+    Checks every watched file once. Returns the files that were re-emitted
+    '''
+    def poll(self):
+        emitted = []
+        for watched_file in self.files:
+            if watched_file.check_stat() and watched_file.emit(self.passes, self.fixed_point):
+                emitted.append(watched_file)
+        return emitted
+
+    def save(self):
+        for watched_file in self.files:
+            watched_file.cache.save()
+
+    '''
+    Polls until interrupted (or for the given number of iterations), reporting
+    every file that is re-emitted together with the time it took
+    '''
+    def run(self, interval=WATCH_INTERVAL, iterations=None):
+        try:
+            while iterations is None or iterations > 0:
+                for watched_file in self.poll():
+                    elapsed = watched_file.elapsed * 1000
+                    print(f"{watched_file.output_path} updated in {elapsed:.1f} ms", file=sys.stderr)
+                if iterations is not None:
+                    iterations = iterations - 1
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.save()